@@ -0,0 +1,253 @@
+"""Columnar cold storage for old sales.
+
+The archive job moves sales from months older than ``SALES_ARCHIVE_DAYS``
+out of the ``sales`` table into one directory of column files per month:
+
+    sales_archive/2025-03/{id,product,name,quantity,price,total_price,day,date}.npy
+    sales_archive/2025-03/{products,names}.npy   # dictionaries for the codes
+
+Each column is a plain ``.npy`` array opened with ``mmap_mode="r"``, so a
+scan only pages in the columns and months it touches. Product ids and names
+are dictionary-encoded to int32 codes and numbers use fixed-width types,
+which keeps a month a fraction of its size as table rows. The
+``daily_sales`` rollups are left alone, so analytics over archived months
+are unaffected; ``rollups.rebuild()`` folds archived months back in.
+
+    python archive.py                     # archive months older than SALES_ARCHIVE_DAYS
+    python archive.py --days 90 --store 2
+"""
+import os
+import shutil
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import numpy as np
+
+COLUMNS = ("id", "product", "name", "quantity", "price", "total_price", "day", "date")
+DELETE_CHUNK = 1000
+
+
+def _text(value) -> str:
+    # Same text the export writes for a DATETIME (MySQL) or ISO string (SQLite)
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _next_month(month: str) -> str:
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+
+
+class SalesArchive:
+    """Month partitions of archived sales under ``directory``."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._partitions = {}
+
+    def months(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if len(name) == 7 and name[4] == "-" and os.path.isfile(os.path.join(self.directory, name, "id.npy"))
+        )
+
+    def read_month(self, month: str) -> dict:
+        """The month's columns as read-only memory maps, plus its ``products``/``names`` dictionaries."""
+        path = os.path.join(self.directory, month)
+        cached = self._partitions.get(month)
+        stamp = os.stat(os.path.join(path, "id.npy")).st_mtime_ns
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        partition = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in COLUMNS + ("products", "names")
+        }
+        self._partitions[month] = (stamp, partition)
+        return partition
+
+    def write_month(self, month: str, rows):
+        """Add ``SALE_COLUMNS`` rows to ``month``, keeping rows already archived under the same id."""
+        rows = [(str(row[0]), str(row[1]), str(row[2]), int(row[3]), float(row[4]), float(row[5]), _text(row[6]))
+                for row in rows]
+        if month in self.months():
+            seen = set()
+            merged = []
+            for row in list(self.iter_month(month)) + rows:
+                if row[0] not in seen:
+                    seen.add(row[0])
+                    merged.append(row)
+            rows = merged
+        rows.sort(key=lambda row: (row[6], row[0]))
+
+        products, product_codes = np.unique(np.array([row[1] for row in rows], dtype=str), return_inverse=True)
+        names, name_codes = np.unique(np.array([row[2] for row in rows], dtype=str), return_inverse=True)
+        dates = [row[6] for row in rows]
+        columns = {
+            "id": np.array([row[0].encode("utf-8") for row in rows], dtype=bytes),
+            "product": product_codes.astype(np.int32),
+            "name": name_codes.astype(np.int32),
+            "quantity": np.array([row[3] for row in rows], dtype=np.int32),
+            "price": np.array([row[4] for row in rows], dtype=np.float64),
+            "total_price": np.array([row[5] for row in rows], dtype=np.float64),
+            "day": np.array([text[:10] for text in dates], dtype="datetime64[D]"),
+            "date": np.array([text.encode("utf-8") for text in dates], dtype=bytes),
+            "products": products,
+            "names": names,
+        }
+
+        # Written beside the partition and swapped in, so readers never see half a month
+        path = os.path.join(self.directory, month)
+        staging = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name, values in columns.items():
+            with open(os.path.join(staging, f"{name}.npy"), "wb") as handle:
+                np.save(handle, values)
+                handle.flush()
+                os.fsync(handle.fileno())
+        retired = None
+        if os.path.isdir(path):
+            retired = f"{path}.old-{os.getpid()}"
+            os.replace(path, retired)
+        os.replace(staging, path)
+        if retired is not None:
+            shutil.rmtree(retired, ignore_errors=True)
+        self._partitions.pop(month, None)
+        return len(rows)
+
+    def _select(self, partition, date_from=None, date_to=None, product_id=None):
+        mask = np.ones(len(partition["id"]), dtype=bool)
+        if date_from:
+            mask &= partition["date"] >= date_from.encode("utf-8")
+        if date_to:
+            mask &= partition["date"] < date_to.encode("utf-8")
+        if product_id is not None:
+            code = np.searchsorted(partition["products"], product_id)
+            if code >= len(partition["products"]) or partition["products"][code] != product_id:
+                return np.zeros(0, dtype=np.intp)
+            mask &= partition["product"] == code
+        return np.flatnonzero(mask)
+
+    def iter_month(self, month: str, date_from=None, date_to=None, product_id=None):
+        partition = self.read_month(month)
+        selected = self._select(partition, date_from, date_to, product_id)
+        if not len(selected):
+            return
+        products, names = partition["products"], partition["names"]
+        yield from zip(
+            (value.decode("utf-8") for value in partition["id"][selected].tolist()),
+            products[partition["product"][selected]].tolist(),
+            names[partition["name"][selected]].tolist(),
+            partition["quantity"][selected].tolist(),
+            partition["price"][selected].tolist(),
+            partition["total_price"][selected].tolist(),
+            (value.decode("utf-8") for value in partition["date"][selected].tolist()),
+        )
+
+    def rows(self, date_from: Optional[str] = None, date_to: Optional[str] = None, product_id: Optional[str] = None):
+        """Archived ``SALE_COLUMNS`` rows in (date, id) order, optionally filtered like ``/api/export/sales``."""
+        for month in self.months():
+            if date_from and _next_month(month) <= date_from[:7]:
+                continue
+            if date_to and month > date_to[:7]:
+                break
+            yield from self.iter_month(month, date_from, date_to, product_id)
+
+    def covers(self, date_from: Optional[str] = None, date_to: Optional[str] = None) -> bool:
+        """Whether any archived month overlaps ``[date_from, date_to)``."""
+        return any(
+            not (date_from and _next_month(month) <= date_from[:7]) and not (date_to and month > date_to[:7])
+            for month in self.months()
+        )
+
+    def daily_totals(self, since: Optional[str] = None):
+        """``(product_id, day, quantity, revenue, transactions)`` per product and day, as in ``daily_sales``."""
+        totals = []
+        for month in self.months():
+            if since and _next_month(month) <= since[:7]:
+                continue
+            partition = self.read_month(month)
+            days = partition["day"]
+            selected = np.flatnonzero(days >= np.datetime64(since[:10], "D")) if since else np.arange(len(days))
+            if not len(selected):
+                continue
+            day_numbers = days[selected].astype(np.int64)
+            keys = partition["product"][selected].astype(np.int64) << 32 | (day_numbers - day_numbers.min())
+            unique, inverse = np.unique(keys, return_inverse=True)
+            quantity = np.bincount(inverse, weights=partition["quantity"][selected])
+            revenue = np.bincount(inverse, weights=partition["total_price"][selected])
+            count = np.bincount(inverse)
+            first = np.zeros(len(unique), dtype=np.intp)
+            first[inverse[::-1]] = np.arange(len(inverse))[::-1]
+            products = partition["products"][partition["product"][selected][first]].tolist()
+            day_text = days[selected][first].astype(str).tolist()
+            totals.extend(zip(products, day_text, quantity.astype(np.int64).tolist(), revenue.tolist(), count.tolist()))
+        return totals
+
+
+def archive_sales(main, days: int, today: Optional[date] = None) -> dict:
+    """Move sales from complete months older than ``days`` into the current store's archive."""
+    today = today or datetime.now().date()
+    # Whole months only, so a partition is never reopened for rows still being written
+    cutoff = (today - timedelta(days=days)).replace(day=1).isoformat()
+    archive = main.get_store_db().archive
+
+    conn = main.get_conn()
+    cursor = conn.cursor()
+    cursor.execute(main.sql_params("SELECT MIN(date) FROM sales WHERE date < ?"), (cutoff,))
+    oldest = cursor.fetchone()[0]
+    conn.close()
+
+    moved = {}
+    month = _text(oldest)[:7] if oldest is not None else cutoff[:7]
+    while month < cutoff[:7]:
+        conn = main.get_conn()
+        cursor = conn.cursor()
+        cursor.execute(
+            main.sql_params(f"SELECT {', '.join(main.SALE_COLUMNS)} FROM sales WHERE date >= ? AND date < ?"),
+            (f"{month}-01", f"{_next_month(month)}-01"),
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        if rows:
+            archive.write_month(month, rows)
+            # By id, so a sale synced into this month meanwhile stays in the table
+            ids = [row[0] for row in rows]
+            for start in range(0, len(ids), DELETE_CHUNK):
+                main.run_write(lambda conn, chunk=ids[start:start + DELETE_CHUNK]: _delete(main, conn, chunk))
+            moved[month] = len(rows)
+        month = _next_month(month)
+    return moved
+
+
+def _delete(main, conn, ids):
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" for _ in ids)
+    cursor.execute(main.sql_params(f"DELETE FROM sales WHERE id IN ({placeholders})"), ids)
+    # Logged as archived, not deleted, so /api/sync sends no tombstones for them
+    changes = main.ChangeSet()
+    changes.archive("sales", *ids)
+    changes.write(conn)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import main
+    from tenancy import current_store
+
+    parser = argparse.ArgumentParser(description="Move old sales into the columnar archive")
+    parser.add_argument("--days", type=int, default=int(os.getenv("SALES_ARCHIVE_DAYS", "365")),
+                        help="Archive complete months older than this many days")
+    parser.add_argument("--store", help="X-Store-Id of the store to archive (default store if omitted)")
+    args = parser.parse_args()
+
+    current_store.set(args.store)
+    main.init_db()
+    moved = archive_sales(main, args.days)
+    directory = main.get_store_db().archive.directory
+    main.close_pool()
+    for month, count in moved.items():
+        print(f"{month}: {count} sales archived")
+    print(f"{sum(moved.values())} sales archived to {directory}")
@@ -0,0 +1,94 @@
+import threading
+
+
+class BarcodeIndex:
+    """In-process barcode -> product lookup used by the POS scan endpoint.
+
+    Entries are plain product dicts shaped like the ``/api/products`` rows.
+    They are never mutated in place: writers swap in a new dict under a lock,
+    so readers can look up and serialize an entry without locking.
+
+    Every entry carries the product's committed ``version``. Writers pass the
+    values their transaction committed, so an update that arrives after a
+    newer one is ignored, and a stock change that skips a version (a change
+    this index never saw) drops the entry to be reloaded on the next scan.
+    The index only sees writes made through its own process.
+    """
+
+    def __init__(self):
+        self._by_barcode = {}
+        self._barcode_by_id = {}
+        self._version_by_id = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_barcode)
+
+    def get(self, barcode: str):
+        return self._by_barcode.get(barcode)
+
+    def load(self, products):
+        """Replace the index with ``(product, version)`` pairs."""
+        by_barcode = {}
+        barcode_by_id = {}
+        version_by_id = {}
+        for product, version in products:
+            barcode = product.get("barcode")
+            # With duplicate barcodes the first product (by name) wins
+            if barcode and barcode not in by_barcode:
+                by_barcode[barcode] = product
+                barcode_by_id[product["id"]] = barcode
+                version_by_id[product["id"]] = version
+        with self._lock:
+            self._by_barcode = by_barcode
+            self._barcode_by_id = barcode_by_id
+            self._version_by_id = version_by_id
+
+    def put(self, product: dict, version: int):
+        """Cache ``product`` as committed at ``version``, unless a newer version is cached."""
+        with self._lock:
+            if self._version_by_id.get(product["id"], -1) > version:
+                return
+            self._remove(product["id"])
+            barcode = product.get("barcode")
+            if barcode:
+                previous = self._by_barcode.get(barcode)
+                if previous is not None:
+                    self._barcode_by_id.pop(previous["id"], None)
+                    self._version_by_id.pop(previous["id"], None)
+                self._by_barcode[barcode] = product
+                self._barcode_by_id[product["id"]] = barcode
+                self._version_by_id[product["id"]] = version
+
+    def remove(self, product_id: str):
+        with self._lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id: str):
+        barcode = self._barcode_by_id.pop(product_id, None)
+        self._version_by_id.pop(product_id, None)
+        if barcode is not None:
+            self._by_barcode.pop(barcode, None)
+
+    def set_stock(self, product_id: str, stock: int, version: int):
+        """Record the ``stock`` a transaction committed along with ``version``."""
+        with self._lock:
+            barcode = self._barcode_by_id.get(product_id)
+            if barcode is None:
+                return
+            cached = self._version_by_id[product_id]
+            if cached >= version:
+                return
+            if cached != version - 1:
+                # Another change came in between, and only its stock would be known
+                self._remove(product_id)
+                return
+            product = self._by_barcode[barcode]
+            self._by_barcode[barcode] = {**product, "stock": stock}
+            self._version_by_id[product_id] = version
+
+    def clear_category(self, category: str):
+        with self._lock:
+            for barcode, product in list(self._by_barcode.items()):
+                if product.get("category") == category:
+                    self._by_barcode[barcode] = {**product, "category": None}
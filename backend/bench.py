@@ -0,0 +1,411 @@
+"""Per-endpoint benchmark suite for the Estolo backend.
+
+Seeds a database, then drives every route in ``main.py`` through an
+in-process ASGI client at a fixed concurrency and prints one JSON document
+with throughput and p50/p95/p99 latency per endpoint. Compare two runs with
+``--baseline`` to catch regressions between releases.
+
+    python bench.py                                   # temp SQLite DB, default scale
+    python bench.py --products 5000 --sales 500000 --concurrency 16 --output bench.json
+    python bench.py --only "GET /api/sales,POST /api/sales"
+    python bench.py --slow-query-ms 20 --only "GET /admin/slow-queries"
+    python bench.py --baseline bench.json --threshold 0.2
+
+With ``DB_ENGINE=mysql`` the configured MySQL database is seeded and used
+instead, so point it at a disposable schema.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import httpx
+
+
+@dataclass
+class Scenario:
+    name: str
+    # (index, state) -> (method, url, keyword arguments for httpx)
+    request: Callable
+    heavy: bool = False
+    # Routes httpx's ASGI transport can't drive (it waits for the whole body): (client, index, state) -> status
+    call: Optional[Callable] = None
+
+
+def percentile(sorted_values, q: float) -> float:
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(q / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def sale_body(sale_id, product, quantity=1, date=None):
+    return {
+        "id": sale_id,
+        "product_id": product["id"],
+        "product_name": product["name"],
+        "quantity": quantity,
+        "price": product["price"],
+        "total_price": round(product["price"] * quantity, 2),
+        "date": date or datetime.now().isoformat(),
+    }
+
+
+def product_body(product_id, index, category="snacks"):
+    return {
+        "id": product_id,
+        "name": f"Bench Product {index:06d}",
+        "stock": 1000,
+        "price": 9.99,
+        "barcode": f"bench-{product_id}",
+        "category": category,
+        "created_at": datetime.now().isoformat(),
+    }
+
+
+def supplier_body(supplier_id, index):
+    return {
+        "id": supplier_id,
+        "name": f"Bench Supplier {index:05d}",
+        "phone": "+254700000000",
+        "location": "Nairobi",
+        "email": None,
+        "business_name": None,
+        "created_at": datetime.now().isoformat(),
+    }
+
+
+def import_csv(index):
+    lines = ["id,name,stock,price,barcode,category"]
+    for row in range(50):
+        lines.append(f"import-{index}-{row},Imported {index}-{row},10,1.5,,snacks")
+    return ("\n".join(lines) + "\n").encode()
+
+
+async def event_round_trip(app, client, request):
+    """Open /api/events, make a write and wait for its ``changes`` event."""
+    subscribed, delivered, closed = asyncio.Event(), asyncio.Event(), asyncio.Event()
+    status = None
+
+    async def receive():
+        await closed.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            subscribed.set()
+        elif message.get("body", b"").startswith(b"event: changes"):
+            delivered.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/events", "raw_path": b"/api/events", "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"estolo.local")], "client": ("127.0.0.1", 0), "server": ("estolo.local", 80),
+    }
+    stream = asyncio.create_task(app(scope, receive, send))
+    try:
+        await asyncio.wait_for(subscribed.wait(), 30)
+        if status == 200:
+            method, url, kwargs = request
+            await client.request(method, url, **kwargs)
+            await asyncio.wait_for(delivered.wait(), 30)
+    finally:
+        closed.set()
+        await stream
+    return status
+
+
+def build_scenarios(state):
+    """Every route, ordered so that writes create the rows later writes modify."""
+    products = state["products"]
+    pick = state["random"].choice
+    week_ago = (datetime.now().date() - timedelta(days=7)).isoformat()
+
+    def created(kind, index):
+        return f"bench-{kind}-{state['run']}-{index}"
+
+    def create_sale(i, s):
+        sale_id = created("sale", i)
+        s["sale_products"][sale_id] = product = pick(products)
+        return "POST", "/api/sales", {"json": sale_body(sale_id, product)}
+
+    def sale_event(client, i, s):
+        product = pick(products)
+        request = "POST", "/api/sales", {"json": sale_body(created("event", i), product)}
+        return event_round_trip(s["app"], client, request)
+
+    def update_sale(i, s):
+        # A sale's product can't change, so reuse the one it was created with
+        sale_id = created("sale", i)
+        product = s["sale_products"].get(sale_id, products[0])
+        return "PUT", f"/api/sales/{sale_id}", {"json": sale_body(sale_id, product, quantity=2)}
+
+    return [
+        Scenario("GET /", lambda i, s: ("GET", "/", {})),
+        Scenario("GET /health", lambda i, s: ("GET", "/health", {})),
+        Scenario("GET /health/db", lambda i, s: ("GET", "/health/db", {})),
+        Scenario("GET /api/products", lambda i, s: ("GET", "/api/products", {"params": {"limit": 100}})),
+        Scenario("GET /api/products?category", lambda i, s: (
+            "GET", "/api/products", {"params": {"category": "snacks", "limit": 100}})),
+        Scenario("GET /api/products/by-barcode/{barcode}", lambda i, s: (
+            "GET", f"/api/products/by-barcode/{pick(products)['barcode']}", {})),
+        Scenario("GET /api/products/search", lambda i, s: (
+            "GET", "/api/products/search", {"params": {"q": pick(products)["name"][:i % 6 + 1]}})),
+        Scenario("POST /api/products", lambda i, s: (
+            "POST", "/api/products", {"json": product_body(created("product", i), i)})),
+        Scenario("PUT /api/products/{id}", lambda i, s: (
+            "PUT", f"/api/products/{created('product', i)}",
+            {"json": {**product_body(created("product", i), i), "stock": 500}})),
+        Scenario("POST /api/products/bulk", lambda i, s: (
+            "POST", "/api/products/bulk",
+            {"json": [product_body(created(f"bulk{i}", row), row) for row in range(50)]}), heavy=True),
+        Scenario("POST /api/products/import", lambda i, s: (
+            "POST", "/api/products/import",
+            {"files": {"file": ("products.csv", io.BytesIO(import_csv(f"{state['run']}-{i}")), "text/csv")}}),
+            heavy=True),
+        Scenario("GET /api/categories", lambda i, s: ("GET", "/api/categories", {})),
+        Scenario("POST /api/categories", lambda i, s: (
+            "POST", "/api/categories",
+            {"json": {"id": created("category", i), "name": created("category", i),
+                      "created_at": datetime.now().isoformat()}})),
+        Scenario("DELETE /api/categories/{id}", lambda i, s: (
+            "DELETE", f"/api/categories/{created('category', i)}", {})),
+        Scenario("GET /api/sales", lambda i, s: ("GET", "/api/sales", {"params": {"limit": 100}})),
+        Scenario("GET /api/sales?product_id", lambda i, s: (
+            "GET", "/api/sales", {"params": {"product_id": pick(products)["id"], "limit": 100}})),
+        Scenario("GET /api/sales?date_range", lambda i, s: (
+            "GET", "/api/sales", {"params": {"date_from": week_ago, "limit": 100}})),
+        Scenario("POST /api/sales", create_sale),
+        Scenario("POST /api/sales/batch", lambda i, s: (
+            "POST", "/api/sales/batch",
+            {"json": [sale_body(created(f"batch{i}", row), pick(products)) for row in range(20)]})),
+        Scenario("POST /api/checkout", lambda i, s: (
+            "POST", "/api/checkout",
+            {"json": {"id": created("basket", i), "date": datetime.now().isoformat(),
+                      "lines": [{"product_id": pick(products)["id"], "quantity": 1} for _ in range(8)]}})),
+        Scenario("PUT /api/sales/{id}", update_sale),
+        Scenario("DELETE /api/sales/{id}", lambda i, s: (
+            "DELETE", f"/api/sales/{created('sale', i)}", {})),
+        Scenario("DELETE /api/products/{id}", lambda i, s: (
+            "DELETE", f"/api/products/{created('product', i)}", {})),
+        Scenario("GET /api/suppliers", lambda i, s: ("GET", "/api/suppliers", {"params": {"limit": 100}})),
+        Scenario("POST /api/suppliers", lambda i, s: (
+            "POST", "/api/suppliers", {"json": supplier_body(created("supplier", i), i)})),
+        Scenario("PUT /api/suppliers/{id}", lambda i, s: (
+            "PUT", f"/api/suppliers/{created('supplier', i)}",
+            {"json": {**supplier_body(created("supplier", i), i), "location": "Mombasa"}})),
+        Scenario("DELETE /api/suppliers/{id}", lambda i, s: (
+            "DELETE", f"/api/suppliers/{created('supplier', i)}", {})),
+        Scenario("GET /api/sync", lambda i, s: (
+            "GET", "/api/sync", {"params": {"since": s["sync_cursor"], "limit": 1000}})),
+        # Subscribe, commit a sale and receive its change event
+        Scenario("GET /api/events", None, call=sale_event),
+        Scenario("GET /api/export/sales", lambda i, s: (
+            "GET", "/api/export/sales", {"params": {"date_from": week_ago}}), heavy=True),
+        Scenario("GET /api/export/products", lambda i, s: ("GET", "/api/export/products", {}), heavy=True),
+        Scenario("GET /api/analytics/demand", lambda i, s: ("GET", "/api/analytics/demand", {})),
+        Scenario("GET /api/analytics/forecast", lambda i, s: (
+            "GET", "/api/analytics/forecast", {"params": {"limit": 100}}), heavy=True),
+        # Last, so the metrics and the slow-query log hold everything the runs above recorded
+        Scenario("GET /metrics", lambda i, s: ("GET", "/metrics", {})),
+        Scenario("GET /admin/slow-queries", lambda i, s: (
+            "GET", "/admin/slow-queries", {"params": {"limit": 200}, "headers": s["admin_headers"]})),
+    ]
+
+
+async def run_scenario(client, scenario: Scenario, state, concurrency: int, total: int):
+    indexes = iter(range(total))
+    latencies = []
+    statuses = {}
+
+    async def worker():
+        for index in indexes:
+            if scenario.call:
+                started = time.perf_counter()
+                status = await scenario.call(client, index, state)
+            else:
+                method, url, kwargs = scenario.request(index, state)
+                started = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                await response.aread()
+                status = response.status_code
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if status >= 400)
+    return {
+        "endpoint": scenario.name,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "status_codes": {str(status): count for status, count in sorted(statuses.items())},
+        "seconds": round(elapsed, 4),
+        "requests_per_second": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def seed_database(main, args):
+    import load_test
+    import rollups
+
+    random.seed(args.seed)
+    load_test.seed(main, args.products, args.sales, args.days)
+
+    conn = main.get_conn()
+    cursor = conn.cursor()
+    cursor.executemany(
+        main.sql_params('''
+            INSERT INTO suppliers (id, name, phone, location, email, business_name, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        '''),
+        [tuple(supplier_body(str(uuid.uuid4()), i).values()) for i in range(args.suppliers)],
+    )
+    conn.commit()
+    rollups.rebuild(conn, main.get_db_engine(), main.get_store_db().archive)
+
+    cursor.execute("SELECT id, name, price, barcode FROM products ORDER BY id")
+    products = [dict(zip(("id", "name", "price", "barcode"), row)) for row in cursor.fetchall()]
+    cursor.execute("SELECT MAX(seq) FROM change_log")
+    sync_cursor = cursor.fetchone()[0] or 0
+    conn.close()
+    return products, sync_cursor
+
+
+def compare(results, baseline_path: str, threshold: float):
+    with open(baseline_path) as handle:
+        baseline = {row["endpoint"]: row for row in json.load(handle)["results"]}
+    regressions = []
+    for row in results:
+        before = baseline.get(row["endpoint"])
+        if before is None or not before["p95_ms"]:
+            continue
+        change = row["p95_ms"] / before["p95_ms"] - 1
+        if change > threshold:
+            regressions.append({
+                "endpoint": row["endpoint"],
+                "baseline_p95_ms": before["p95_ms"],
+                "p95_ms": row["p95_ms"],
+                "change": round(change, 3),
+            })
+    return regressions
+
+
+async def run(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault("DB_ENGINE", "sqlite")
+    if os.environ["DB_ENGINE"] == "sqlite":
+        workdir = tempfile.mkdtemp(prefix="estolo-bench-")
+        os.environ["SQLITE_PATH"] = os.path.join(workdir, "estolo.db")
+    if args.slow_query_ms is not None:
+        os.environ["SLOW_QUERY_MS"] = str(args.slow_query_ms)
+
+    import anyio.to_thread
+    import main
+
+    started = time.perf_counter()
+    main.init_db()
+    products, sync_cursor = seed_database(main, args)
+    main.warm_barcode_index()
+    main.warm_search_index()
+    seed_seconds = time.perf_counter() - started
+    anyio.to_thread.current_default_thread_limiter().total_tokens = main.get_worker_threads()
+
+    state = {
+        "run": uuid.uuid4().hex[:8],
+        "random": random.Random(args.seed),
+        "products": products,
+        "sale_products": {},
+        "sync_cursor": sync_cursor,
+        "app": main.app,
+        "admin_headers": {"X-Admin-Token": os.getenv("ADMIN_TOKEN", "")},
+    }
+    only = {name.strip() for name in args.only.split(",")} if args.only else None
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://estolo.local", timeout=120) as client:
+        for scenario in build_scenarios(state):
+            if only and scenario.name not in only:
+                continue
+            total = max(args.requests // 10, args.concurrency) if scenario.heavy else args.requests
+            result = await run_scenario(client, scenario, state, args.concurrency, total)
+            results.append(result)
+            print(
+                f"{result['endpoint']:<42} {result['requests_per_second']:>9.1f} req/s "
+                f"p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+                f"p99 {result['p99_ms']:>8.2f} ms  errors {result['errors']}",
+                file=sys.stderr,
+                flush=True,
+            )
+
+    main.close_write_queue()
+    main.close_pool()
+
+    report = {
+        "config": {
+            "db_engine": main.get_db_engine(),
+            "products": args.products,
+            "sales": args.sales,
+            "days": args.days,
+            "suppliers": args.suppliers,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "seed": args.seed,
+            "slow_query_ms": os.getenv("SLOW_QUERY_MS"),
+            "seed_seconds": round(seed_seconds, 2),
+        },
+        "results": results,
+    }
+    if args.baseline:
+        report["regressions"] = compare(results, args.baseline, args.threshold)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    print(output)
+    return 1 if report.get("regressions") else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000, help="Products to seed")
+    parser.add_argument("--sales", type=int, default=50000, help="Sales to seed")
+    parser.add_argument("--days", type=int, default=90, help="Days of sales history to seed")
+    parser.add_argument("--suppliers", type=int, default=200, help="Suppliers to seed")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients per endpoint")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="Requests per endpoint (a tenth for exports, imports and forecasts)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for data and request mix")
+    parser.add_argument("--only", help="Comma separated endpoint names to run")
+    parser.add_argument("--slow-query-ms", type=float,
+                        help="Set SLOW_QUERY_MS, so /admin/slow-queries has a log to return")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare p95 latency against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative p95 increase reported as a regression (default 0.2)")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Before/after benchmark for the index migrations.
+
+Seeds a temporary SQLite database, times the queries behind the list,
+filter and analytics routes with every migration applied, then reverts the
+index migrations and times them again. It exits non-zero if a "before"
+plan still uses one of the reverted indexes, or an "after" plan doesn't use
+the index that query is expected to.
+
+    python bench_indexes.py --products 5000 --sales 500000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+QUERIES = {
+    "sales_last_7_days": (
+        "SELECT product_id, SUM(quantity), COUNT(DISTINCT DATE(date)) FROM sales "
+        "WHERE date >= DATE('now', '-7 days') GROUP BY product_id",
+        (),
+    ),
+    "sales_page_by_date": (
+        "SELECT id, product_id, quantity, date FROM sales ORDER BY date DESC, id DESC LIMIT 100",
+        (),
+    ),
+    "sales_for_product": (
+        "SELECT id, quantity, date FROM sales WHERE product_id = ? ORDER BY date DESC LIMIT 100",
+        None,
+    ),
+    "product_by_barcode": (
+        "SELECT id, name, stock, price FROM products WHERE barcode = ?",
+        None,
+    ),
+    "products_page_by_name": (
+        "SELECT id, name, stock FROM products ORDER BY name, id LIMIT 100",
+        (),
+    ),
+    "products_in_category": (
+        "SELECT id, name FROM products WHERE category = ? ORDER BY name, id LIMIT 100",
+        ("snacks",),
+    ),
+}
+
+
+# The index each query's "after" plan must use
+EXPECTED_INDEXES = {
+    "sales_page_by_date": "idx_sales_date_id",
+    "sales_for_product": "idx_sales_product_date",
+    "product_by_barcode": "idx_products_barcode",
+    "products_page_by_name": "idx_products_name_id",
+    "products_in_category": "idx_products_category_name_id",
+}
+
+
+def time_query(cursor, sql, params, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        best = min(best, time.perf_counter() - started)
+    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+    plan = "; ".join(row[-1] for row in cursor.fetchall())
+    return best * 1000, plan
+
+
+def index_names(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def run_queries(conn, params_for, repeat):
+    cursor = conn.cursor()
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        results[name] = time_query(cursor, sql, params if params is not None else params_for[name], repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--sales", type=int, default=200000)
+    parser.add_argument("--days", type=int, default=365, help="Days of sales history to spread the sales over")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query; the best time is reported")
+    args = parser.parse_args()
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, backend_dir)
+    os.chdir(tempfile.mkdtemp(prefix="estolo-bench-"))
+    os.environ["DB_ENGINE"] = "sqlite"
+
+    import main as app_main
+    import migrations
+    from load_test import seed
+
+    app_main.init_db()
+    seed(app_main, args.products, args.sales, args.days)
+
+    conn = app_main.get_conn()
+    cursor = conn.cursor()
+    cursor.execute("SELECT product_id FROM sales LIMIT 1")
+    product_id = cursor.fetchone()[0]
+    cursor.execute("SELECT barcode FROM products ORDER BY barcode DESC LIMIT 1")
+    barcode = cursor.fetchone()[0]
+    params_for = {"sales_for_product": (product_id,), "product_by_barcode": (barcode,)}
+    cursor.execute("ANALYZE")
+    conn.commit()
+
+    after = run_queries(conn, params_for, args.repeat)
+    indexed = index_names(cursor)
+    migrations.migrate(conn, "sqlite", target=0)
+    conn.close()
+
+    # A raw connection: get_conn() would reopen the store and migrate it straight back up.
+    # Fresh, so no statement prepared against the indexed schema is reused either.
+    app_main.close_pool()
+    conn = app_main.open_connection()
+    dropped = indexed - index_names(conn.cursor())
+    before = run_queries(conn, params_for, args.repeat)
+    migrations.migrate(conn, "sqlite")
+    conn.close()
+
+    if not dropped:
+        raise SystemExit("Reverting the migrations dropped no indexes")
+    for name, index in EXPECTED_INDEXES.items():
+        if index not in after[name][1]:
+            raise SystemExit(f"{name}: 'after' plan doesn't use {index}: {after[name][1]}")
+    for name, (_, plan) in before.items():
+        used = sorted(index for index in dropped if index in plan)
+        if used:
+            raise SystemExit(f"{name}: 'before' plan still uses {', '.join(used)}: {plan}")
+
+    print(f"{'query':<24} {'before ms':>10} {'after ms':>10} {'speedup':>9}")
+    for name in QUERIES:
+        before_ms, after_ms = before[name][0], after[name][0]
+        print(f"{name:<24} {before_ms:>10.3f} {after_ms:>10.3f} {before_ms / max(after_ms, 1e-6):>8.1f}x")
+    print()
+    print(json.dumps({
+        name: {
+            "before_ms": round(before[name][0], 4),
+            "after_ms": round(after[name][0], 4),
+            "before_plan": before[name][1],
+            "after_plan": after[name][1],
+        }
+        for name in QUERIES
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Before/after benchmark for list response serialization.
+
+Seeds a temporary SQLite database, fetches the rows behind ``GET /api/sales``
+and ``GET /api/products`` at several page sizes, and times turning them into
+a response body the way FastAPI does for a returned list of dicts
+(``jsonable_encoder`` + ``JSONResponse``) against ``RowsResponse``. Every
+body is checked to be byte-identical.
+
+    python bench_serialization.py --products 5000 --sales 200000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+PAGE_SIZES = (100, 1000, 10000, 100000)
+
+
+def legacy_body(columns, rows) -> bytes:
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    width = len(columns)
+    items = [dict(zip(columns, row[:width])) for row in rows]
+    return JSONResponse(jsonable_encoder(items)).body
+
+
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--sales", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the best time is reported")
+    args = parser.parse_args()
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, backend_dir)
+    os.chdir(tempfile.mkdtemp(prefix="estolo-bench-"))
+    os.environ["DB_ENGINE"] = "sqlite"
+
+    import main as app_main
+    from load_test import seed
+    from serialization import RowsResponse
+
+    app_main.init_db()
+    seed(app_main, args.products, args.sales)
+
+    results = []
+    for table, columns, sort_column, direction in (
+        ("sales", app_main.SALE_COLUMNS, "date", "DESC"),
+        ("products", app_main.PRODUCT_COLUMNS, "name", "ASC"),
+    ):
+        conn = app_main.get_conn()
+        cursor = conn.cursor()
+        # Same shape as fetch_page(): the sort column and id trail the selected columns
+        cursor.execute(
+            f"SELECT {', '.join(columns)}, {sort_column}, id FROM {table} "
+            f"ORDER BY {sort_column} {direction}, id {direction}"
+        )
+        all_rows = cursor.fetchall()
+        conn.close()
+        for size in PAGE_SIZES:
+            rows = all_rows[:size]
+
+            legacy_seconds, legacy = best_time(lambda: legacy_body(columns, rows), args.repeat)
+            fast_seconds, fast = best_time(lambda: RowsResponse(columns, rows).body, args.repeat)
+            if fast != legacy:
+                raise SystemExit(f"{table} x{len(rows)}: RowsResponse body differs from JSONResponse")
+            results.append({
+                "table": table,
+                "rows": len(rows),
+                "bytes": len(fast),
+                "legacy_ms": round(legacy_seconds * 1000, 3),
+                "rows_response_ms": round(fast_seconds * 1000, 3),
+                "speedup": round(legacy_seconds / fast_seconds, 1),
+            })
+            if len(rows) < size:
+                break
+
+    app_main.close_pool()
+    print(json.dumps({"products": args.products, "sales": args.sales, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Contention benchmark for stock decrements.
+
+Many tills sell at once through ``POST /api/sales``: first spread over many
+products, then all on one hot product with limited stock, then a mix. For
+each run it reports throughput and latency, how many sales were refused for
+insufficient stock, and checks that stock never went negative and that
+every unit sold was taken off stock exactly once.
+
+    python bench_stock.py --tills 32 --sales 4000 --hot-stock 2500
+
+With ``DB_ENGINE=mysql`` the configured MySQL database is used instead, so
+point it at a disposable schema.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+
+COLD_PRODUCTS = 200
+COLD_STOCK = 1_000_000
+
+
+def seed_products(main, hot_stock: int):
+    now = datetime.now().isoformat()
+    run = uuid.uuid4().hex[:8]
+    hot = f"hot-{run}"
+    cold = [f"cold-{run}-{n:04d}" for n in range(COLD_PRODUCTS)]
+
+    def write(conn):
+        conn.cursor().executemany(
+            main.sql_params(
+                "INSERT INTO products (id, name, stock, price, barcode, category, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)"
+            ),
+            [(hot, "Hot Bread 700g", hot_stock, 15.0, None, "bread_and_bakery", now)]
+            + [(product_id, f"Cold {product_id}", COLD_STOCK, 10.0, None, "snacks", now) for product_id in cold],
+        )
+
+    main.run_write(write)
+    return hot, cold
+
+
+def read_stock(main, product_ids):
+    conn = main.get_conn()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" for _ in product_ids)
+    cursor.execute(main.sql_params(f"SELECT id, stock FROM products WHERE id IN ({placeholders})"), list(product_ids))
+    stock = dict(cursor.fetchall())
+    conn.close()
+    return stock
+
+
+async def run_mix(client, main, name: str, pick_product, tills: int, total: int):
+    indexes = iter(range(total))
+    latencies = []
+    statuses = {}
+    sold = {}
+
+    async def till():
+        for index in indexes:
+            product_id = pick_product(index)
+            quantity = 1 + index % 3
+            body = {
+                "id": str(uuid.uuid4()),
+                "product_id": product_id,
+                "product_name": product_id,
+                "quantity": quantity,
+                "price": 10.0,
+                "total_price": 10.0 * quantity,
+                "date": datetime.now().isoformat(),
+            }
+            started = time.perf_counter()
+            response = await client.post("/api/sales", json=body)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                sold[product_id] = sold.get(product_id, 0) + quantity
+
+    product_ids = {pick_product(index) for index in range(total)}
+    before = read_stock(main, product_ids)
+    started = time.perf_counter()
+    await asyncio.gather(*(till() for _ in range(tills)))
+    elapsed = time.perf_counter() - started
+    after = read_stock(main, product_ids)
+
+    latencies.sort()
+    return {
+        "run": name,
+        "sales": total,
+        "tills": tills,
+        "status_codes": {str(status): count for status, count in sorted(statuses.items())},
+        "sales_per_second": round(total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3),
+        "lowest_stock": min(after.values()),
+        "stock_consistent": all(before[p] - after[p] == sold.get(p, 0) for p in product_ids),
+    }
+
+
+async def run(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault("DB_ENGINE", "sqlite")
+    if os.environ["DB_ENGINE"] == "sqlite":
+        workdir = tempfile.mkdtemp(prefix="estolo-bench-")
+        os.environ["SQLITE_PATH"] = os.path.join(workdir, "estolo.db")
+
+    import anyio.to_thread
+    import main
+
+    main.init_db()
+    anyio.to_thread.current_default_thread_limiter().total_tokens = main.get_worker_threads()
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://estolo.local", timeout=120) as client:
+        hot, cold = seed_products(main, args.hot_stock)
+        results.append(await run_mix(client, main, "spread", lambda i: cold[i % len(cold)], args.tills, args.sales))
+        hot, cold = seed_products(main, args.hot_stock)
+        results.append(await run_mix(client, main, "hot", lambda i: hot, args.tills, args.sales))
+        hot, cold = seed_products(main, args.hot_stock)
+        results.append(await run_mix(
+            client, main, "mixed", lambda i: hot if i % 2 else cold[i % len(cold)], args.tills, args.sales,
+        ))
+
+    main.close_pool()
+    print(json.dumps({"engine": main.get_db_engine(), "hot_stock": args.hot_stock, "results": results}, indent=2))
+    if not all(result["stock_consistent"] and result["lowest_stock"] >= 0 for result in results):
+        raise SystemExit("Stock went negative or drifted from the recorded sales")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tills", type=int, default=32, help="Concurrent sellers")
+    parser.add_argument("--sales", type=int, default=4000, help="Sales attempted per run")
+    parser.add_argument("--hot-stock", type=int, default=2500,
+                        help="Starting stock of the hot product (below demand, so it sells out)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
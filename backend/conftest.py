@@ -0,0 +1,19 @@
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    """The app module, pointed at a fresh SQLite database under ``tmp_path``."""
+    monkeypatch.setenv("DB_ENGINE", "sqlite")
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "estolo.db"))
+    monkeypatch.setenv("SALES_ARCHIVE_DIR", str(tmp_path / "sales_archive"))
+    import main
+
+    return main
+
+
+@pytest.fixture
+def client(main):
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,230 @@
+import threading
+import time
+import weakref
+from collections import deque
+
+
+class PoolExhausted(RuntimeError):
+    pass
+
+
+class PooledConnection:
+    """Thin proxy around a DB-API connection checked out of a ConnectionPool.
+
+    Routes keep calling ``conn.close()`` as before; for a pooled connection
+    that hands the underlying connection back to the pool instead of closing it.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._cursors = weakref.WeakSet()
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        wrap = self._pool.cursor_wrapper
+        if not wrap:
+            return cursor
+        cursor = wrap(cursor)
+        if hasattr(cursor, "finish"):
+            self._cursors.add(cursor)
+        return cursor
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        if self._raw is None:
+            return
+        # Timed cursors report (and may EXPLAIN) their last statement while the connection is still ours
+        for cursor in list(self._cursors):
+            try:
+                cursor.finish()
+            except Exception:
+                pass
+        raw, self._raw = self._raw, None
+        self._pool._release(raw, self._created_at)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise RuntimeError("Connection has already been returned to the pool")
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Safety net for handlers that raise before reaching conn.close().
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of DB-API connections.
+
+    ``connect`` opens a new raw connection and ``ping`` raises if a raw
+    connection is no longer usable. Idle connections are validated on
+    checkout and replaced once they are older than ``recycle`` seconds.
+    ``cursor_wrapper``, if given, wraps every cursor handed out (e.g. for timing);
+    a wrapper's ``finish()``, if it has one, is called before its connection is released.
+    """
+
+    def __init__(self, connect, ping=None, min_size=1, max_size=10,
+                 timeout=30.0, recycle=3600.0, cursor_wrapper=None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._connect = connect
+        self._ping = ping
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.cursor_wrapper = cursor_wrapper
+
+        self._idle = deque()
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._failed_health_checks = 0
+        self._wait_time = 0.0
+
+        for _ in range(self.min_size):
+            raw = self._open()
+            with self._cond:
+                self._idle.append((raw, time.monotonic()))
+                self._size += 1
+
+    def _open(self):
+        raw = self._connect()
+        with self._cond:
+            self._created += 1
+        return raw
+
+    @staticmethod
+    def _discard(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _healthy(self, raw):
+        if self._ping is None:
+            return True
+        try:
+            self._ping(raw)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        started = None
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed")
+            self._checkouts += 1
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    raw, created_at = None, None
+                    break
+                now = time.monotonic()
+                if started is None:
+                    started = now
+                    self._waits += 1
+                remaining = self.timeout - (now - started)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._wait_time += now - started
+                    raise PoolExhausted(
+                        f"No database connection available within {self.timeout}s "
+                        f"(max_size={self.max_size})"
+                    )
+                self._cond.wait(remaining)
+            if started is not None:
+                self._wait_time += time.monotonic() - started
+
+        try:
+            if raw is not None and self.recycle and time.monotonic() - created_at > self.recycle:
+                self._discard(raw)
+                with self._cond:
+                    self._recycled += 1
+                raw = None
+            elif raw is not None and not self._healthy(raw):
+                self._discard(raw)
+                with self._cond:
+                    self._failed_health_checks += 1
+                raw = None
+            if raw is None:
+                raw, created_at = self._open(), time.monotonic()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, raw, created_at)
+
+    def _release(self, raw, created_at):
+        broken = False
+        try:
+            # End any transaction (including read snapshots) left open by the caller.
+            raw.rollback()
+        except Exception:
+            broken = True
+
+        with self._cond:
+            if broken or self._closed:
+                self._size -= 1
+                self._discard(raw)
+            else:
+                self._idle.append((raw, created_at))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                raw, _ = self._idle.pop()
+                self._size -= 1
+                self._discard(raw)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_seconds": round(self._wait_time, 6),
+                "exhausted": self._timeouts,
+                "created": self._created,
+                "recycled": self._recycled,
+                "failed_health_checks": self._failed_health_checks,
+            }
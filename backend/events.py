@@ -0,0 +1,114 @@
+"""In-process fan-out of committed changes to dashboard subscribers.
+
+Writers call ``EventHub.publish()`` from any thread once their transaction
+has committed. The event is encoded once and handed to the event loop, which
+puts it on every subscriber's bounded queue; the SSE and WebSocket routes
+drain those queues. A subscriber whose queue is full is dropped rather than
+buffered without limit or allowed to hold up the others: it gets a final
+``None`` and should resync (``/api/sync``) and reconnect.
+"""
+import asyncio
+import json
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+class Subscriber:
+    def __init__(self, store: Optional[str], tables, queue_size: int):
+        self.store = store
+        self.tables = frozenset(tables) if tables else None
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = False
+
+    async def get(self) -> Optional[str]:
+        """The next event as JSON, or None once the subscriber has been dropped."""
+        return await self.queue.get()
+
+
+class EventHub:
+    """Per-store subscriber sets; ``publish`` is thread-safe, the rest runs on the event loop."""
+
+    def __init__(self, queue_size: int = 256, max_rows: int = 500):
+        self.queue_size = max(1, queue_size)
+        # Larger change sets are summarised per table instead of listing every row
+        self.max_rows = max_rows
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self.published = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def subscribe(self, store: Optional[str], tables=None) -> Subscriber:
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(store, tables, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(store, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.store)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.store]
+
+    def has_subscribers(self, store: Optional[str]) -> bool:
+        return store in self._subscribers
+
+    def publish(self, store: Optional[str], changes):
+        """Send ``(table, row_id, op)`` changes committed in ``store`` to its subscribers."""
+        loop = self._loop
+        if loop is None or store not in self._subscribers or not changes:
+            return
+        by_table = {}
+        for table, row_id, op in changes:
+            by_table.setdefault(table, []).append({"table": table, "id": row_id, "op": op})
+        for table, rows in by_table.items():
+            if len(rows) > self.max_rows:
+                by_table[table] = [{"table": table, "op": "bulk", "count": len(rows)}]
+        event = {"at": datetime.now(timezone.utc).isoformat(), "changes": by_table}
+        try:
+            loop.call_soon_threadsafe(self._deliver, store, event)
+        except RuntimeError:
+            # The loop has shut down
+            pass
+
+    def _deliver(self, store, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(store, ()))
+        by_table = event["changes"]
+        everything = None
+        for subscriber in subscribers:
+            if subscriber.tables is None:
+                if everything is None:
+                    everything = self._encode(event["at"], by_table)
+                payload = everything
+            else:
+                selected = {table: rows for table, rows in by_table.items() if table in subscriber.tables}
+                if not selected:
+                    continue
+                payload = self._encode(event["at"], selected)
+            try:
+                subscriber.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+        self.published += 1
+
+    @staticmethod
+    def _encode(at: str, by_table) -> str:
+        return _encoder.encode({"at": at, "changes": [change for rows in by_table.values() for change in rows]})
+
+    def _drop(self, subscriber: Subscriber):
+        self.unsubscribe(subscriber)
+        subscriber.dropped = True
+        self.dropped += 1
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
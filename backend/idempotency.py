@@ -0,0 +1,201 @@
+"""Idempotency-Key handling for mutating requests.
+
+A client that retries a POST, PUT, PATCH or DELETE with the same
+``Idempotency-Key`` header gets the stored response of the first successful
+attempt instead of having the work done again. ``IdempotencyKeys`` keeps
+recent responses in a bounded in-memory LRU in front of a persistent store
+(its ``load``/``save`` callables, a database table in the app), so a retry
+is answered without running the route and usually without a query.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import anyio.to_thread
+
+from tenancy import current_store
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+MAX_KEY_LENGTH = 255
+METHODS = frozenset(("POST", "PUT", "PATCH", "DELETE"))
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status: int
+    content_type: Optional[str]
+    body: bytes
+    created_at: float
+
+
+def fingerprint(method: str, path: str, query: bytes, body: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in (method.encode(), path.encode(), query, body):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class IdempotencyKeys:
+    """Stored responses: an LRU keyed by ``(store, key)`` over ``load(key)``/``save(key, stored)``.
+
+    ``load`` and ``save`` are blocking and run in the threadpool with the
+    request's store selected. Entries older than ``ttl`` seconds are ignored.
+    """
+
+    def __init__(self, load, save, capacity: int = 10000, ttl: float = 86400):
+        self.load = load
+        self.save = save
+        self.capacity = max(1, capacity)
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self.replays = 0
+        self.save_errors = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key) -> Optional[StoredResponse]:
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is None:
+                return None
+            if self.expired(stored):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return stored
+
+    def expired(self, stored: StoredResponse) -> bool:
+        return stored.created_at + self.ttl < time.time()
+
+    def put(self, key, stored: StoredResponse):
+        with self._lock:
+            self._entries[key] = stored
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+async def _send_json(send, status: int, body: bytes):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware that replays stored responses for repeated Idempotency-Keys.
+
+    Only 2xx responses are stored: a failed request changed nothing, so its
+    retry runs again. Reusing a key for a different request is a 422, and a
+    retry that arrives while the first attempt is still running is a 409.
+    Must sit inside ``StoreMiddleware``, since keys are scoped per store.
+    """
+
+    def __init__(self, app, keys: IdempotencyKeys):
+        self.app = app
+        self.keys = keys
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in METHODS:
+            await self.app(scope, receive, send)
+            return
+        key = None
+        for name, value in scope["headers"]:
+            if name == IDEMPOTENCY_HEADER:
+                key = value.decode("latin-1").strip()
+                break
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, b'{"detail":"Invalid Idempotency-Key"}')
+            return
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        request_fingerprint = fingerprint(scope["method"], scope["path"], scope.get("query_string", b""), body)
+
+        keys = self.keys
+        cache_key = (current_store.get(), key)
+        stored = keys.get(cache_key)
+        if stored is None and cache_key not in keys._in_flight:
+            loaded = await anyio.to_thread.run_sync(keys.load, key)
+            if loaded is not None and not keys.expired(loaded):
+                keys.put(cache_key, loaded)
+            # The first attempt may have finished while this one was loading
+            stored = keys.get(cache_key)
+        if stored is not None:
+            if stored.fingerprint != request_fingerprint:
+                await _send_json(
+                    send, 422, b'{"detail":"Idempotency-Key was already used for a different request"}',
+                )
+                return
+            keys.replays += 1
+            headers = [(b"content-length", str(len(stored.body)).encode()), (REPLAYED_HEADER, b"true")]
+            if stored.content_type:
+                headers.append((b"content-type", stored.content_type.encode("latin-1")))
+            await send({"type": "http.response.start", "status": stored.status, "headers": headers})
+            await send({"type": "http.response.body", "body": stored.body})
+            return
+
+        if cache_key in keys._in_flight:
+            await _send_json(send, 409, b'{"detail":"A request with this Idempotency-Key is still in progress"}')
+            return
+        keys._in_flight.add(cache_key)
+        try:
+            replayed_body = False
+
+            async def receive_body():
+                nonlocal replayed_body
+                if not replayed_body:
+                    replayed_body = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                return await receive()
+
+            # Buffered so the response is stored before the client can see it and retry
+            messages = []
+
+            async def capture(message):
+                messages.append(message)
+
+            await self.app(scope, receive_body, capture)
+
+            start = messages[0]
+            if 200 <= start["status"] < 300:
+                content_type = next(
+                    (value.decode("latin-1") for name, value in start.get("headers", []) if name == b"content-type"),
+                    None,
+                )
+                stored = StoredResponse(
+                    request_fingerprint,
+                    start["status"],
+                    content_type,
+                    b"".join(message.get("body", b"") for message in messages[1:]),
+                    time.time(),
+                )
+                keys.put(cache_key, stored)
+                try:
+                    await anyio.to_thread.run_sync(keys.save, key, stored)
+                except Exception:
+                    # The work is done; still answer, and retries on this worker hit the LRU
+                    keys.save_errors += 1
+            for message in messages:
+                await send(message)
+        finally:
+            keys._in_flight.discard(cache_key)
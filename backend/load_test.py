@@ -0,0 +1,200 @@
+"""Concurrency load test for the Estolo backend.
+
+Drives one endpoint at increasing client concurrency and reports throughput
+for each level, together with the latency of ``/health`` measured while the
+database-bound requests are in flight. With blocking DB work kept off the
+event loop, requests/s should grow with concurrency (up to the worker thread
+and pool limits) and ``/health`` should stay fast.
+
+    python load_test.py                                  # in-process, temp SQLite DB
+    python load_test.py --path /api/sales --sales 50000
+    python load_test.py --db-latency-ms 5                # simulate a networked database
+    python load_test.py --url http://localhost:8000      # against a running server
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+
+
+SEED_CATEGORIES = ("snacks", "beverages", "dairy", "bakery", "produce", "frozen", "household", "toiletries")
+
+
+def seed(main, products: int, sales: int, days: int = 14):
+    import rollups
+
+    conn = main.get_conn()
+    cursor = conn.cursor()
+    now = datetime.now()
+    product_rows = [
+        (
+            str(uuid.uuid4()),
+            f"Product {i:05d}",
+            random.randint(0, 500),
+            round(random.uniform(2, 150), 2),
+            f"600{i:010d}",
+            SEED_CATEGORIES[i % len(SEED_CATEGORIES)],
+            now.isoformat(),
+        )
+        for i in range(products)
+    ]
+    cursor.executemany(main.sql_params('''
+        INSERT INTO products (id, name, stock, price, barcode, category, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''), product_rows)
+
+    sale_rows = []
+    for _ in range(sales):
+        product_id, name, _, price, _, _, _ = random.choice(product_rows)
+        quantity = random.randint(1, 5)
+        sale_date = now - timedelta(minutes=random.randint(0, 60 * 24 * days))
+        sale_rows.append((
+            str(uuid.uuid4()), product_id, name, quantity, price,
+            round(price * quantity, 2), sale_date.isoformat(),
+        ))
+    cursor.executemany(main.sql_params('''
+        INSERT INTO sales (id, product_id, product_name, quantity, price, total_price, date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''), sale_rows)
+    conn.commit()
+    # Seeded around the write path that maintains daily_sales, so build it here
+    rollups.rebuild(conn, main.get_db_engine(), main.get_store_db().archive)
+    conn.close()
+
+
+def simulate_db_latency(main, latency: float):
+    # Adds a fixed round-trip delay to every statement, like a remote MySQL server would.
+    class SlowCursor(sqlite3.Cursor):
+        def execute(self, *args):
+            time.sleep(latency)
+            return super().execute(*args)
+
+        def executemany(self, *args):
+            time.sleep(latency)
+            return super().executemany(*args)
+
+    class SlowConnection(sqlite3.Connection):
+        def cursor(self, factory=SlowCursor):
+            return super().cursor(factory)
+
+    def open_connection(store=None):
+        conn = sqlite3.connect(main.get_sqlite_path(store), check_same_thread=False, factory=SlowConnection)
+        main.configure_sqlite(conn)
+        return conn
+
+    main.open_connection = open_connection
+
+
+async def run_level(client, path: str, concurrency: int, total: int):
+    remaining = total
+    latencies = []
+    probe_latencies = []
+    errors = 0
+    done = asyncio.Event()
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            await client.get("/health")
+            probe_latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.01)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+
+    latencies.sort()
+    return {
+        "path": path,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "requests_per_second": round(total / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3),
+        "health_p50_ms": round(statistics.median(probe_latencies) * 1000, 3) if probe_latencies else None,
+    }
+
+
+async def run(args):
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        workdir = tempfile.mkdtemp(prefix="estolo-load-")
+        os.chdir(workdir)
+        os.environ.setdefault("DB_ENGINE", "sqlite")
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import anyio.to_thread
+        import main
+
+        if args.db_latency_ms:
+            simulate_db_latency(main, args.db_latency_ms / 1000)
+        main.init_db()
+        seed(main, args.products, args.sales)
+        anyio.to_thread.current_default_thread_limiter().total_tokens = main.get_worker_threads()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app),
+            base_url="http://estolo.local",
+            timeout=60,
+        )
+
+    results = []
+    async with client:
+        await client.get(args.path)
+        for concurrency in args.concurrency:
+            result = await run_level(client, args.path, concurrency, args.requests)
+            results.append(result)
+            print(json.dumps(result), flush=True)
+
+    baseline = results[0]["requests_per_second"]
+    print()
+    print(f"{'clients':>8} {'req/s':>10} {'speedup':>8} {'p95 ms':>9} {'/health p50 ms':>15}")
+    for result in results:
+        print(
+            f"{result['concurrency']:>8} {result['requests_per_second']:>10.1f} "
+            f"{result['requests_per_second'] / baseline:>7.2f}x {result['p95_ms']:>9.2f} "
+            f"{result['health_p50_ms'] or 0:>15.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Base URL of a running server (default: in-process app)")
+    parser.add_argument("--path", default="/api/analytics/demand", help="Endpoint to drive")
+    parser.add_argument("--concurrency", default="1,2,4,8,16",
+                        type=lambda value: [int(v) for v in value.split(",")],
+                        help="Comma separated client concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--products", type=int, default=500, help="Products to seed (in-process mode)")
+    parser.add_argument("--sales", type=int, default=100000, help="Sales to seed (in-process mode)")
+    parser.add_argument("--db-latency-ms", type=float, default=0,
+                        help="Simulated per-statement database latency (in-process mode)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
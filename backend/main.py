@@ -1,18 +1,69 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, File, HTTPException, Query, Request, Response, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
+import asyncio
+import base64
+import csv
+import hashlib
+import heapq
+import hmac
+import io
+import json
 import os
 import sqlite3
+import threading
+import time
 try:
     import pymysql
 except Exception:
     pymysql = None
-from datetime import datetime
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from itertools import islice
+import anyio.to_thread
 import uvicorn
 
+import forecast
+import migrations
+from archive import SalesArchive
+from barcode_index import BarcodeIndex
+from db_pool import ConnectionPool, PoolExhausted
+from events import EventHub
+from idempotency import IdempotencyKeys, IdempotencyMiddleware, StoredResponse
+from metrics import Metrics, MetricsMiddleware, TimedCursor
+from product_search import ProductSearchIndex, fts5_query, like_prefix, mysql_boolean_query, tokenize
+from slow_queries import SlowQueryLog
+from tenancy import StoreCache, StoreMiddleware, current_store
+from rollups import RollupDelta
+from serialization import RowsResponse
+from write_queue import WriteQueue
+
 app = FastAPI(title="Estolo Backend API", version="1.0.0")
 
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")) * 3600
+IDEMPOTENCY_PURGE_INTERVAL = 600
+
+idempotency_keys = IdempotencyKeys(
+    # Defined below, with the rest of the database layer
+    load=lambda key: load_idempotent_response(key),
+    save=lambda key, stored: save_idempotent_response(key, stored),
+    capacity=int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000")),
+    ttl=IDEMPOTENCY_TTL,
+)
+# Inside StoreMiddleware, so keys are looked up in the request's store
+app.add_middleware(IdempotencyMiddleware, keys=idempotency_keys)
+
+# Inside CORS, so rejected store ids still get CORS headers
+app.add_middleware(
+    StoreMiddleware,
+    allowed=[store.strip() for store in os.getenv("STORE_IDS", "").split(",") if store.strip()],
+    auto_create=os.getenv("STORE_AUTO_CREATE", "0") == "1",
+)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -20,8 +71,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Next-Cursor", "Link", "ETag", "Last-Modified", "X-Search-Backend", "X-Store-Id", "Idempotent-Replayed",
+    ],
 )
 
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+event_hub = EventHub(queue_size=int(os.getenv("EVENTS_QUEUE_SIZE", "256")))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+
 # Database setup
 def get_db_engine() -> str:
     engine = os.getenv("DB_ENGINE", "").strip().lower()
@@ -31,7 +91,11 @@ def get_db_engine() -> str:
         return "mysql"
     return "sqlite"
 
-def get_mysql_config():
+def get_store_id() -> Optional[str]:
+    # Set per request from the X-Store-Id header; None is the default store
+    return current_store.get()
+
+def get_mysql_config(store: Optional[str] = None):
     host = os.getenv("DB_HOST")
     name = os.getenv("DB_NAME")
     user = os.getenv("DB_USER")
@@ -44,16 +108,18 @@ def get_mysql_config():
             "DB_PASSWORD, and optional DB_PORT."
         )
 
+    if store is not None:
+        name = f"{name}_store{store}"
     return host, name, user, password, port
 
-def get_conn():
+def open_connection(store: Optional[str] = None):
     engine = get_db_engine()
     if engine == "mysql":
         if pymysql is None:
             raise RuntimeError(
                 "pymysql is not installed. Install it with: pip install pymysql"
             )
-        host, name, user, password, port = get_mysql_config()
+        host, name, user, password, port = get_mysql_config(store)
         return pymysql.connect(
             host=host,
             user=user,
@@ -62,11 +128,246 @@ def get_conn():
             port=port,
             cursorclass=pymysql.cursors.Cursor,
             autocommit=False,
+            # Each statement sees the latest commits, so an optimistic stock retry re-reads fresh values
+            init_command="SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED",
         )
     if engine == "sqlite":
-        return sqlite3.connect("estolo.db")
+        # Pooled connections are handed to whichever worker thread checks them out.
+        conn = sqlite3.connect(get_sqlite_path(store), check_same_thread=False)
+        configure_sqlite(conn)
+        return conn
     raise RuntimeError("Unsupported DB_ENGINE. Use 'sqlite' or 'mysql'.")
 
+def create_mysql_database(store: str):
+    host, name, user, password, port = get_mysql_config(store)
+    conn = pymysql.connect(host=host, user=user, password=password, port=port)
+    try:
+        conn.cursor().execute(f"CREATE DATABASE IF NOT EXISTS `{name}`")
+    finally:
+        conn.close()
+
+def get_sqlite_path(store: Optional[str] = None) -> str:
+    path = os.getenv("SQLITE_PATH", "estolo.db")
+    if store is None:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}_store{store}{ext or '.db'}"
+
+def get_sales_archive_dir(store: Optional[str] = None) -> str:
+    path = os.getenv("SALES_ARCHIVE_DIR", "sales_archive")
+    if store is None:
+        return path
+    return os.path.join(path, f"store{store}")
+
+def get_sqlite_pragmas():
+    return {
+        "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        # NORMAL is durable against application crashes in WAL mode and skips most fsyncs
+        "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        # Negative values are KiB: 64 MiB page cache per connection
+        "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+        "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+        "temp_store": "MEMORY",
+    }
+
+def configure_sqlite(conn):
+    for name, value in get_sqlite_pragmas().items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+def ping_connection(conn):
+    if get_db_engine() == "mysql":
+        conn.ping(reconnect=False)
+    else:
+        conn.execute("SELECT 1")
+
+def get_pool_config():
+    return {
+        "min_size": int(os.getenv("DB_POOL_MIN", "1")),
+        "max_size": int(os.getenv("DB_POOL_MAX", "10")),
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "recycle": float(os.getenv("DB_POOL_RECYCLE", "3600")),
+    }
+
+def get_slow_query_log() -> Optional[SlowQueryLog]:
+    global _slow_query_log
+    threshold = os.getenv("SLOW_QUERY_MS")
+    if not threshold:
+        return None
+    if _slow_query_log is None:
+        _slow_query_log = SlowQueryLog(
+            float(threshold),
+            get_db_engine(),
+            capacity=int(os.getenv("SLOW_QUERY_LOG_SIZE", "200")),
+            explain=os.getenv("SLOW_QUERY_EXPLAIN", "1") != "0",
+        )
+    return _slow_query_log
+
+_slow_query_log = None
+
+def get_cursor_wrapper():
+    # Per-statement timing for /metrics (SQL_METRICS=0 turns it off) and the opt-in slow-query log
+    timed_metrics = None if os.getenv("SQL_METRICS", "1") == "0" else metrics
+    slow_log = get_slow_query_log()
+    if timed_metrics is None and slow_log is None:
+        return None
+    return lambda cursor: TimedCursor(cursor, timed_metrics, slow_log)
+
+def write_queue_enabled() -> bool:
+    return get_db_engine() == "sqlite" and os.getenv("SQLITE_WRITE_QUEUE", "1") != "0"
+
+class StoreDatabase:
+    """One store's database: its connection pool, SQLite writer and in-memory indexes.
+
+    The schema is created and the indexes warmed on first use, by whichever
+    request gets there first; concurrent requests for the store wait for it.
+    """
+
+    def __init__(self, store: Optional[str]):
+        self.store = store
+        if store is not None and get_db_engine() == "mysql":
+            create_mysql_database(store)
+        self.pool = ConnectionPool(
+            lambda: open_connection(store),
+            ping=ping_connection,
+            cursor_wrapper=get_cursor_wrapper(),
+            **get_pool_config(),
+        )
+        self.barcode_index = BarcodeIndex()
+        self.search_index = ProductSearchIndex()
+        self.search_backend = None
+        self.archive = SalesArchive(get_sales_archive_dir(store))
+        self.idempotency_purged_at = 0.0
+        self.change_log_pruned_at = 0.0
+        self.ready = False
+        self.closed = False
+        self._write_queue = None
+        self._initializing = False
+        self._lock = threading.RLock()
+
+    @property
+    def write_queue(self) -> WriteQueue:
+        if self._write_queue is None:
+            with self._lock:
+                if self.closed:
+                    raise RuntimeError(f"Store {self.store!r} has been closed")
+                if self._write_queue is None:
+                    self._write_queue = WriteQueue(
+                        lambda: open_connection(self.store),
+                        max_batch=int(os.getenv("SQLITE_WRITE_BATCH", "64")),
+                        cursor_wrapper=get_cursor_wrapper(),
+                    )
+        return self._write_queue
+
+    def ensure_ready(self):
+        if self.ready:
+            return
+        with self._lock:
+            # init_db() itself checks out connections through get_conn()
+            if self.ready or self._initializing:
+                return
+            self._initializing = True
+            token = current_store.set(self.store)
+            try:
+                init_db()
+                warm_barcode_index()
+                warm_search_index()
+                self.ready = True
+            finally:
+                current_store.reset(token)
+                self._initializing = False
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            if self._write_queue is not None:
+                self._write_queue.close()
+                self._write_queue = None
+        self.pool.close()
+
+_stores = StoreCache(StoreDatabase, capacity=int(os.getenv("STORE_CACHE_SIZE", "16")))
+
+def get_store_db(store: Optional[str] = None) -> StoreDatabase:
+    """The current request's store database (or ``store``'s), initialized on first use."""
+    if store is None:
+        store = get_store_id()
+    db = _stores.get(store)
+    db.ensure_ready()
+    return db
+
+def get_pool() -> ConnectionPool:
+    return get_store_db().pool
+
+def close_pool():
+    # Closes every store's pool and writer; they are reopened on next use
+    _stores.close()
+
+def get_conn():
+    # Checked-out connections go back to the pool on conn.close()
+    return get_pool().acquire()
+
+def get_write_queue() -> WriteQueue:
+    return get_store_db().write_queue
+
+def close_write_queue():
+    for _, db in _stores.entries():
+        with db._lock:
+            if db._write_queue is not None:
+                db._write_queue.close()
+                db._write_queue = None
+
+def run_write(fn):
+    """Run ``fn(conn)`` in a committed transaction and return its result.
+
+    With SQLite, writes are handed to the single writer thread and
+    group-committed with whatever else is queued; ``fn`` must not commit.
+    Side effects outside the database belong after ``run_write`` returns.
+    The change sets ``fn`` wrote are published to event subscribers once the
+    transaction has committed.
+    """
+    written = []
+    db = get_store_db()
+    now = time.time()
+    # Expired change_log rows are pruned every few minutes, on the back of a write
+    prune = SYNC_RETENTION_DAYS > 0 and now - db.change_log_pruned_at >= CHANGE_LOG_PRUNE_INTERVAL
+
+    def job(conn):
+        # Runs on the writer thread with SQLite, so the list is handed over here
+        token = written_change_sets.set(written)
+        try:
+            result = fn(conn)
+            if prune:
+                prune_change_log(conn)
+            return result
+        finally:
+            written_change_sets.reset(token)
+
+    if write_queue_enabled():
+        result = get_write_queue().submit(job)
+    else:
+        conn = get_conn()
+        try:
+            result = job(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    if prune:
+        db.change_log_pruned_at = now
+    publish_changes(written)
+    return result
+
+def publish_changes(change_sets):
+    store = get_store_id()
+    if not change_sets or not event_hub.has_subscribers(store):
+        return
+    ops = {}
+    for changes in change_sets:
+        ops.update(changes.ops)
+    event_hub.publish(store, [(table, row_id, op) for (table, row_id), op in ops.items()])
+
 def get_paramstyle():
     return "qmark" if get_db_engine() == "sqlite" else "format"
 
@@ -75,6 +376,50 @@ def sql_params(sql: str) -> str:
         return sql
     return sql.replace("?", "%s")
 
+def load_idempotent_response(key: str) -> Optional[StoredResponse]:
+    conn = get_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            sql_params(
+                "SELECT fingerprint, status, content_type, body, created_at "
+                "FROM idempotency_keys WHERE idempotency_key = ?"
+            ),
+            (key,),
+        )
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    fingerprint, status, content_type, body, created_at = row
+    return StoredResponse(fingerprint, status, content_type, bytes(body), created_at)
+
+def save_idempotent_response(key: str, stored: StoredResponse):
+    db = get_store_db()
+    now = time.time()
+    # Expired keys are cleared every few minutes, on the back of a save
+    purge = now - db.idempotency_purged_at >= IDEMPOTENCY_PURGE_INTERVAL
+    replace = "REPLACE INTO" if get_db_engine() == "mysql" else "INSERT OR REPLACE INTO"
+
+    def write(conn):
+        cursor = conn.cursor()
+        if purge:
+            cursor.execute(
+                sql_params("DELETE FROM idempotency_keys WHERE created_at < ?"), (now - IDEMPOTENCY_TTL,),
+            )
+        cursor.execute(
+            sql_params(
+                f"{replace} idempotency_keys "
+                "(idempotency_key, fingerprint, status, content_type, body, created_at) VALUES (?, ?, ?, ?, ?, ?)"
+            ),
+            (key, *stored),
+        )
+
+    run_write(write)
+    if purge:
+        db.idempotency_purged_at = now
+
 def init_db():
     conn = get_conn()
     cursor = conn.cursor()
@@ -164,6 +509,9 @@ def init_db():
             cursor.execute(sql_ins, (cat_name, cat_name, created_at))
     
     conn.commit()
+
+    # Indexes and later schema changes are versioned migrations
+    migrations.migrate(conn, get_db_engine())
     conn.close()
 
 # Pydantic models
@@ -180,7 +528,7 @@ class Sale(BaseModel):
     id: str
     product_id: str
     product_name: str
-    quantity: int
+    quantity: int = Field(..., gt=0)
     price: float
     total_price: float
     date: str
@@ -199,6 +547,121 @@ class Category(BaseModel):
     name: str
     created_at: str
 
+# List pagination
+PRODUCT_COLUMNS = ("id", "name", "stock", "price", "barcode", "category", "created_at")
+SALE_COLUMNS = ("id", "product_id", "product_name", "quantity", "price", "total_price", "date")
+SUPPLIER_COLUMNS = ("id", "name", "phone", "location", "email", "business_name", "created_at")
+CATEGORY_COLUMNS = ("id", "name", "created_at")
+
+LIST_MAX_LIMIT = 1000
+
+def get_default_list_limit() -> Optional[int]:
+    # Unset keeps the legacy "return everything" behaviour for clients that don't page.
+    value = os.getenv("LIST_DEFAULT_LIMIT", "").strip()
+    return min(int(value), LIST_MAX_LIMIT) if value else None
+
+def parse_fields(fields: Optional[str], columns) -> tuple:
+    if not fields:
+        return columns
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested.difference(columns)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+        )
+    # Keep the table's column order so responses stay stable
+    return tuple(name for name in columns if name in requested)
+
+def encode_cursor(sort_value, row_id) -> str:
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def is_cursor_value(value) -> bool:
+    # Something both drivers bind as a plain SQL value (bool is an int, but never a sort key)
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return -2 ** 63 <= value < 2 ** 63
+    return isinstance(value, (str, float))
+
+def decode_cursor(cursor: str) -> tuple:
+    """The ``(sort value, id)`` keyset a page ended at; 400 for anything else."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        values = None
+    if not isinstance(values, list) or len(values) != 2 or not all(map(is_cursor_value, values)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple(values)
+
+def fetch_page(
+    table: str,
+    columns: tuple,
+    sort_column: str,
+    descending: bool,
+    fields: Optional[str],
+    filters: List[tuple],
+    limit: Optional[int],
+    cursor: Optional[str],
+):
+    """Keyset-paginated SELECT ordered by (sort_column, id).
+
+    ``filters`` is a list of ``(sql, params)`` pairs AND-ed into the WHERE
+    clause. Returns the selected column names, the page's rows (which may
+    carry the sort columns after them) and the cursor for the next page
+    (None on the last page).
+    """
+    selected = parse_fields(fields, columns)
+    query_columns = list(selected)
+    for key in (sort_column, "id"):
+        if key not in query_columns:
+            query_columns.append(key)
+
+    where = [clause for clause, _ in filters]
+    params = [value for _, values in filters for value in values]
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        op = "<" if descending else ">"
+        where.append(f"({sort_column} {op} ? OR ({sort_column} = ? AND id {op} ?))")
+        params.extend([sort_value, sort_value, row_id])
+
+    direction = "DESC" if descending else "ASC"
+    sql = f"SELECT {', '.join(query_columns)} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {sort_column} {direction}, id {direction}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    conn = get_conn()
+    db_cursor = conn.cursor()
+    db_cursor.execute(sql_params(sql), tuple(params))
+    rows = db_cursor.fetchall()
+    conn.close()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            last[query_columns.index(sort_column)],
+            last[query_columns.index("id")],
+        )
+
+    return selected, rows, next_cursor
+
+def set_next_cursor(request: Request, response: Response, next_cursor: Optional[str]):
+    if next_cursor is None:
+        return
+    response.headers["X-Next-Cursor"] = next_cursor
+    next_url = request.url.include_query_params(cursor=next_cursor)
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
+
 # Routes
 @app.get("/")
 async def root():
@@ -212,16 +675,22 @@ async def health():
     }
 
 @app.get("/health/db")
-async def health_db():
+def health_db():
     try:
         conn = get_conn()
         cursor = conn.cursor()
         cursor.execute("SELECT 1")
         cursor.fetchone()
+        cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        schema_version = cursor.fetchone()[0] or 0
         conn.close()
         return {
             "status": "ok",
             "db_engine": get_db_engine(),
+            "store": get_store_id(),
+            "schema_version": schema_version,
+            "pool": get_pool().stats(),
+            "writer": get_write_queue().stats() if write_queue_enabled() else None,
         }
     except Exception as exc:
         return {
@@ -230,437 +699,1512 @@ async def health_db():
             "error": str(exc),
         }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus text exposition of request, SQL, pool and writer metrics."""
+    # Pool and writer figures are summed over the stores that are currently open
+    gauges = {}
+    for _, db in _stores.entries():
+        writer = db._write_queue
+        for prefix, label, stats in (
+            ("estolo_db_pool", "Connection pool", db.pool.stats()),
+            ("estolo_db_writer", "SQLite writer", writer.stats() if writer else {}),
+        ):
+            for name, value in stats.items():
+                key = f"{prefix}_{name}"
+                help_text, total = gauges.get(key, (f"{label} {name.replace('_', ' ')}.", 0))
+                if name in ("largest_batch", "max_size"):
+                    gauges[key] = (help_text, max(total, value))
+                else:
+                    gauges[key] = (help_text, total + value)
+    gauges["estolo_stock_update_retries"] = ("Optimistic stock updates retried after losing a race.", stock_update_retries)
+    gauges["estolo_stores_open"] = ("Stores with open connections.", len(_stores))
+    gauges["estolo_stores_evicted"] = ("Stores closed to stay within STORE_CACHE_SIZE.", _stores.evictions)
+    gauges["estolo_event_subscribers"] = ("Open change event streams (SSE and WebSocket).", len(event_hub))
+    gauges["estolo_events_published"] = ("Committed change sets fanned out to subscribers.", event_hub.published)
+    gauges["estolo_event_subscribers_dropped"] = ("Event subscribers dropped for falling behind.", event_hub.dropped)
+    gauges["estolo_idempotent_replays"] = ("Retries answered with a stored Idempotency-Key response.", idempotency_keys.replays)
+    gauges["estolo_idempotency_cache_entries"] = ("Idempotency-Key responses held in memory.", len(idempotency_keys))
+    gauges["estolo_idempotency_save_errors"] = ("Idempotency-Key responses that could not be persisted.", idempotency_keys.save_errors)
+    return PlainTextResponse(
+        metrics.render(gauges),
+        media_type="text/plain; version=0.0.4",
+    )
+
+def require_admin(request: Request):
+    token = os.getenv("ADMIN_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/slow-queries")
+def get_slow_queries(request: Request, limit: int = Query(50, ge=1, le=1000)):
+    """Most recent statements over SLOW_QUERY_MS, newest first, with their query plans."""
+    require_admin(request)
+    slow_log = get_slow_query_log()
+    if slow_log is None:
+        return {"enabled": False, "threshold_ms": None, "recorded": 0, "queries": []}
+    return {
+        "enabled": True,
+        "threshold_ms": slow_log.threshold * 1000,
+        "recorded": slow_log.recorded,
+        "queries": slow_log.entries(limit),
+    }
+
+@app.delete("/admin/slow-queries")
+def clear_slow_queries(request: Request):
+    require_admin(request)
+    slow_log = get_slow_query_log()
+    if slow_log is not None:
+        slow_log.clear()
+    return {"status": "cleared"}
+
+@app.exception_handler(PoolExhausted)
+async def pool_exhausted_handler(request: Request, exc: PoolExhausted):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+# Routes that touch the database are plain `def` handlers, so FastAPI runs them
+# in anyio's worker thread pool instead of on the event loop.
+def get_worker_threads() -> int:
+    return int(os.getenv("DB_WORKER_THREADS", str(get_pool_config()["max_size"])))
+
+@app.on_event("startup")
+async def configure_worker_threads():
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = get_worker_threads()
+
 @app.on_event("startup")
 def on_startup():
-    init_db()
+    # Other stores are initialized on their first request
+    get_store_db()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    close_pool()
 
 @app.get("/api/products")
-async def get_products():
+def get_products(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    category: Optional[str] = None,
+):
+    not_modified = check_not_modified(request, response, "products")
+    if not_modified:
+        return not_modified
+
+    filters = []
+    if category:
+        filters.append(("category = ?", (category,)))
+
+    columns, rows, next_cursor = fetch_page(
+        "products", PRODUCT_COLUMNS, "name", False, fields, filters,
+        limit or get_default_list_limit(), cursor,
+    )
+    set_next_cursor(request, response, next_cursor)
+    return RowsResponse(columns, rows, headers=response.headers)
+
+# POS scan lookups are served from memory (one index per store); the mutating routes below keep it in step
+def warm_barcode_index():
     conn = get_conn()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM products ORDER BY name")
+    cursor.execute(
+        f"SELECT {', '.join(PRODUCT_COLUMNS)}, version FROM products "
+        "WHERE barcode IS NOT NULL ORDER BY name, id"
+    )
     rows = cursor.fetchall()
     conn.close()
-    
-    products = []
-    for row in rows:
-        products.append({
-            "id": row[0],
-            "name": row[1],
-            "stock": row[2],
-            "price": row[3],
-            "barcode": row[4],
-            "category": row[5],
-            "created_at": row[6]
-        })
-    
-    return products
+    get_store_db().barcode_index.load((dict(zip(PRODUCT_COLUMNS, row)), row[-1]) for row in rows)
 
-@app.post("/api/products")
-async def create_product(product: Product):
+def load_product_by_barcode(barcode: str):
+    """``(product, version)`` for ``barcode``, or None."""
     conn = get_conn()
     cursor = conn.cursor()
-    # Ensure category exists in categories table (if provided)
-    if product.category:
-        sql_check = sql_params('SELECT id FROM categories WHERE name = ?')
-        cursor.execute(sql_check, (product.category,))
-        existing_cat = cursor.fetchone()
-        if not existing_cat:
-            sql_cat = sql_params('INSERT INTO categories (id, name, created_at) VALUES (?, ?, ?)')
-            cursor.execute(sql_cat, (
-                product.category,  # using category name as id for simplicity
-                product.category,
-                product.created_at,
-            ))
-
-    sql = sql_params('''
-        INSERT INTO products (id, name, stock, price, barcode, category, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''')
-    cursor.execute(sql, (
-        product.id,
-        product.name,
-        product.stock,
-        product.price,
-        product.barcode,
-        product.category,
-        product.created_at,
-    ))
-    conn.commit()
+    sql = sql_params(
+        f"SELECT {', '.join(PRODUCT_COLUMNS)}, version FROM products "
+        "WHERE barcode = ? ORDER BY name, id LIMIT 1"
+    )
+    cursor.execute(sql, (barcode,))
+    row = cursor.fetchone()
     conn.close()
+    return (dict(zip(PRODUCT_COLUMNS, row)), row[-1]) if row else None
+
+@app.get("/api/products/by-barcode/{barcode}")
+async def get_product_by_barcode(barcode: str):
+    # Opening a store's database blocks, so a store that isn't ready yet is handled off the event loop
+    db = _stores.peek(get_store_id())
+    product = db.barcode_index.get(barcode) if db is not None and db.ready else None
+    if product is None:
+        # Miss: the product may have been added by another worker process
+        loaded = await run_in_threadpool(load_product_by_barcode, barcode)
+        if loaded is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        product, version = loaded
+        get_store_db().barcode_index.put(product, version)
     return product
 
-@app.put("/api/products/{product_id}")
-async def update_product(product_id: str, product: Product):
+PRODUCT_SEARCH_MAX_LIMIT = 100
+
+# Typeahead fallback when the database has no text index (or PRODUCT_SEARCH=memory)
+def warm_search_index():
+    db = get_store_db()
     conn = get_conn()
     cursor = conn.cursor()
-    sql = sql_params('''
-        UPDATE products
-        SET name = ?,
-            stock = ?,
-            price = ?,
-            barcode = ?,
-            category = ?,
-            created_at = ?
-        WHERE id = ?
-    ''')
+    cursor.execute("SELECT id, name FROM products")
+    rows = cursor.fetchall()
+    if os.getenv("PRODUCT_SEARCH", "index").strip().lower() == "memory":
+        search_backend = "memory"
+    elif get_db_engine() == "mysql":
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() "
+            "AND table_name = 'products' AND index_type = 'FULLTEXT'"
+        )
+        search_backend = "fulltext" if cursor.fetchone()[0] else "memory"
+    else:
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'products_fts'")
+        search_backend = "fts5" if cursor.fetchone()[0] else "memory"
+    conn.close()
+    db.search_index.load(rows)
+    db.search_backend = search_backend
+
+def search_products_indexed(tokens: List[str], limit: int):
+    # Names starting with the first term come first, then shorter names
+    if get_store_db().search_backend == "fulltext":
+        sql = (
+            f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products "
+            "WHERE MATCH(name) AGAINST (? IN BOOLEAN MODE) "
+            # '\\' in MySQL's string syntax is one backslash
+            "ORDER BY name NOT LIKE ? ESCAPE '\\\\', CHAR_LENGTH(name), name LIMIT ?"
+        )
+        params = (mysql_boolean_query(tokens), like_prefix(tokens[0]), limit)
+    else:
+        sql = (
+            f"SELECT {', '.join('p.' + column for column in PRODUCT_COLUMNS)} "
+            "FROM products_fts JOIN products p ON p.rowid = products_fts.rowid "
+            "WHERE products_fts MATCH ? "
+            "ORDER BY p.name NOT LIKE ? ESCAPE '\\', length(p.name), p.name LIMIT ?"
+        )
+        params = (fts5_query(tokens), like_prefix(tokens[0]), limit)
+    conn = get_conn()
+    cursor = conn.cursor()
+    cursor.execute(sql_params(sql), params)
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(zip(PRODUCT_COLUMNS, row)) for row in rows]
+
+def search_products_in_memory(query: str, limit: int):
+    ids = get_store_db().search_index.search(query, limit)
+    if not ids:
+        return []
+    conn = get_conn()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" for _ in ids)
     cursor.execute(
-        sql,
-        (
+        sql_params(f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products WHERE id IN ({placeholders})"),
+        ids,
+    )
+    by_id = {row[0]: dict(zip(PRODUCT_COLUMNS, row)) for row in cursor.fetchall()}
+    conn.close()
+    return [by_id[product_id] for product_id in ids if product_id in by_id]
+
+@app.get("/api/products/search")
+def search_products(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=PRODUCT_SEARCH_MAX_LIMIT),
+):
+    search_backend = get_store_db().search_backend
+    response.headers["X-Search-Backend"] = search_backend
+    tokens = tokenize(q)
+    if not tokens:
+        return []
+    if search_backend == "memory":
+        return search_products_in_memory(q, limit)
+    return search_products_indexed(tokens, limit)
+
+@app.post("/api/products")
+def create_product(product: Product):
+    def write(conn):
+        cursor = conn.cursor()
+        changes = ChangeSet()
+        changes.upsert("products", product.id)
+        # Ensure category exists in categories table (if provided)
+        if product.category:
+            sql_check = sql_params('SELECT id FROM categories WHERE name = ?')
+            cursor.execute(sql_check, (product.category,))
+            existing_cat = cursor.fetchone()
+            if not existing_cat:
+                changes.upsert("categories", product.category)
+                sql_cat = sql_params('INSERT INTO categories (id, name, created_at) VALUES (?, ?, ?)')
+                cursor.execute(sql_cat, (
+                    product.category,  # using category name as id for simplicity
+                    product.category,
+                    product.created_at,
+                ))
+
+        sql = sql_params('''
+            INSERT INTO products (id, name, stock, price, barcode, category, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''')
+        cursor.execute(sql, (
+            product.id,
             product.name,
             product.stock,
             product.price,
             product.barcode,
             product.category,
             product.created_at,
-            product_id,
-        ),
-    )
-    conn.commit()
-    updated = cursor.rowcount
-    conn.close()
+        ))
+        changes.write(conn)
 
-    if updated == 0:
+    run_write(write)
+    db = get_store_db()
+    # New rows start at the column default, version 0
+    db.barcode_index.put(product.model_dump(), 0)
+    db.search_index.put(product.id, product.name)
+    return product
+
+PRODUCT_IMPORT_CHUNK = 500
+IMPORT_MAX_ERRORS = 100
+
+def product_upsert_sql() -> str:
+    insert = '''
+        INSERT INTO products (id, name, stock, price, barcode, category, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+    updated = ("name", "stock", "price", "barcode", "category")
+    if get_db_engine() == "mysql":
+        assignments = ", ".join(f"{col} = VALUES({col})" for col in updated)
+        return sql_params(insert + f" ON DUPLICATE KEY UPDATE {assignments}, version = version + 1")
+    assignments = ", ".join(f"{col} = excluded.{col}" for col in updated)
+    return sql_params(insert + f" ON CONFLICT(id) DO UPDATE SET {assignments}, version = version + 1")
+
+def ensure_categories(cursor, names: set, created_at: str):
+    # Resolve every category referenced by an import with one lookup
+    names = sorted(name for name in names if name)
+    existing = set()
+    for start in range(0, len(names), IN_CLAUSE_CHUNK):
+        chunk = names[start:start + IN_CLAUSE_CHUNK]
+        placeholders = ", ".join("?" for _ in chunk)
+        cursor.execute(
+            sql_params(f"SELECT name FROM categories WHERE name IN ({placeholders})"),
+            tuple(chunk),
+        )
+        existing.update(row[0] for row in cursor.fetchall())
+    missing = [name for name in names if name not in existing]
+    if missing:
+        cursor.executemany(
+            sql_params('INSERT INTO categories (id, name, created_at) VALUES (?, ?, ?)'),
+            [(name, name, created_at) for name in missing],
+        )
+    return missing
+
+def upsert_products(records) -> dict:
+    """Validate and upsert an iterable of product dicts in one transaction."""
+    products = {}
+    rejected = []
+    rejected_count = 0
+    for index, record in enumerate(records):
+        try:
+            product = Product(**record)
+        except (ValidationError, TypeError) as exc:
+            if isinstance(exc, ValidationError):
+                first = exc.errors()[0]
+                error = f"{'.'.join(str(part) for part in first['loc'])}: {first['msg']}"
+            else:
+                error = str(exc)
+        else:
+            if product.id not in products:
+                products[product.id] = product
+                continue
+            error = "Duplicate product id in import"
+        rejected_count += 1
+        if len(rejected) < IMPORT_MAX_ERRORS:
+            rejected.append({"row": index, "error": error})
+
+    ids = list(products)
+
+    def write(conn):
+        cursor = conn.cursor()
+        existing = find_existing_ids(cursor, "products", ids)
+        categories_created = ensure_categories(
+            cursor,
+            {product.category for product in products.values()},
+            datetime.now().isoformat(),
+        )
+        sql = product_upsert_sql()
+        for start in range(0, len(ids), PRODUCT_IMPORT_CHUNK):
+            cursor.executemany(sql, [
+                (
+                    product.id,
+                    product.name,
+                    product.stock,
+                    product.price,
+                    product.barcode,
+                    product.category,
+                    product.created_at,
+                )
+                for product in (products[i] for i in ids[start:start + PRODUCT_IMPORT_CHUNK])
+            ])
+        changes = ChangeSet()
+        changes.upsert("products", *ids)
+        changes.upsert("categories", *categories_created)
+        changes.write(conn)
+        return existing, categories_created
+
+    existing, categories_created = run_write(write)
+    return {
+        "inserted": len(ids) - len(existing),
+        "updated": len(existing),
+        "rejected": rejected_count,
+        "categories_created": len(categories_created),
+        "errors": rejected,
+    }
+
+@app.post("/api/products/bulk")
+def bulk_upsert_products(products: List[dict] = Body(...)):
+    result = upsert_products(products)
+    warm_barcode_index()
+    warm_search_index()
+    return result
+
+def iter_product_csv(upload: UploadFile):
+    reader = csv.DictReader(io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline=""))
+    now = datetime.now().isoformat()
+    for row in reader:
+        record = {
+            key.strip(): (value.strip() if isinstance(value, str) else value)
+            for key, value in row.items()
+            if key
+        }
+        for optional in ("barcode", "category"):
+            if not record.get(optional):
+                record[optional] = None
+        if not record.get("created_at"):
+            record["created_at"] = now
+        yield record
+
+@app.post("/api/products/import")
+def import_products_csv(file: UploadFile = File(...)):
+    try:
+        result = upsert_products(iter_product_csv(file))
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV file: {exc}")
+    warm_barcode_index()
+    warm_search_index()
+    return result
+
+@app.put("/api/products/{product_id}")
+def update_product(product_id: str, product: Product):
+    def write(conn):
+        cursor = conn.cursor()
+        sql = sql_params('''
+            UPDATE products
+            SET name = ?,
+                stock = ?,
+                price = ?,
+                barcode = ?,
+                category = ?,
+                created_at = ?,
+                version = version + 1
+            WHERE id = ?
+        ''')
+        cursor.execute(
+            sql,
+            (
+                product.name,
+                product.stock,
+                product.price,
+                product.barcode,
+                product.category,
+                product.created_at,
+                product_id,
+            ),
+        )
+        if not cursor.rowcount:
+            return None
+        cursor.execute(sql_params("SELECT version FROM products WHERE id = ?"), (product_id,))
+        version = cursor.fetchone()[0]
+        changes = ChangeSet()
+        changes.upsert("products", product_id)
+        changes.write(conn)
+        return version
+
+    version = run_write(write)
+
+    if version is None:
         raise HTTPException(status_code=404, detail="Product not found")
+    db = get_store_db()
+    db.barcode_index.put({**product.model_dump(), "id": product_id}, version)
+    db.search_index.put(product_id, product.name)
     return product
 
 @app.delete("/api/products/{product_id}")
-async def delete_product(product_id: str):
-    conn = get_conn()
-    cursor = conn.cursor()
-    sql = sql_params('DELETE FROM products WHERE id = ?')
-    cursor.execute(sql, (product_id,))
-    conn.commit()
-    deleted = cursor.rowcount
-    conn.close()
+def delete_product(product_id: str):
+    def write(conn):
+        cursor = conn.cursor()
+        sql = sql_params('DELETE FROM products WHERE id = ?')
+        cursor.execute(sql, (product_id,))
+        deleted = cursor.rowcount
+        if deleted:
+            changes = ChangeSet()
+            changes.delete("products", product_id)
+            changes.write(conn)
+        return deleted
+
+    deleted = run_write(write)
 
     if deleted == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    db = get_store_db()
+    db.barcode_index.remove(product_id)
+    db.search_index.remove(product_id)
     return {"status": "deleted"}
 
 
 @app.get("/api/categories")
-async def get_categories():
+def get_categories(request: Request, response: Response):
+    not_modified = check_not_modified(request, response, "categories")
+    if not_modified:
+        return not_modified
+
     conn = get_conn()
     cursor = conn.cursor()
-    cursor.execute("SELECT id, name, created_at FROM categories ORDER BY name")
+    cursor.execute(f"SELECT {', '.join(CATEGORY_COLUMNS)} FROM categories ORDER BY name")
     rows = cursor.fetchall()
     conn.close()
-
-    cats = []
-    for row in rows:
-        cats.append({
-            "id": row[0],
-            "name": row[1],
-            "created_at": row[2],
-        })
-    return cats
+    return RowsResponse(CATEGORY_COLUMNS, rows, headers=response.headers)
 
 
 @app.post("/api/categories")
-async def create_category(category: Category):
-    conn = get_conn()
-    cursor = conn.cursor()
-    # Prevent duplicate category names
-    sql_check = sql_params('SELECT id FROM categories WHERE name = ?')
-    cursor.execute(sql_check, (category.name,))
-    if cursor.fetchone():
-        conn.close()
-        raise HTTPException(status_code=400, detail="Category with this name already exists")
+def create_category(category: Category):
+    def write(conn):
+        cursor = conn.cursor()
+        # Prevent duplicate category names
+        sql_check = sql_params('SELECT id FROM categories WHERE name = ?')
+        cursor.execute(sql_check, (category.name,))
+        if cursor.fetchone():
+            raise HTTPException(status_code=400, detail="Category with this name already exists")
 
-    sql = sql_params('INSERT INTO categories (id, name, created_at) VALUES (?, ?, ?)')
-    cursor.execute(sql, (category.id, category.name, category.created_at))
-    conn.commit()
-    conn.close()
+        sql = sql_params('INSERT INTO categories (id, name, created_at) VALUES (?, ?, ?)')
+        cursor.execute(sql, (category.id, category.name, category.created_at))
+        changes = ChangeSet()
+        changes.upsert("categories", category.id)
+        changes.write(conn)
+
+    run_write(write)
     return category
 
 
 @app.delete("/api/categories/{category_id}")
-async def delete_category(category_id: str):
-    conn = get_conn()
-    cursor = conn.cursor()
-    # Remove category reference from products before deleting (set to NULL)
-    sql = sql_params('UPDATE products SET category = NULL WHERE category = ?')
-    cursor.execute(sql, (category_id,))
-    sql = sql_params('DELETE FROM categories WHERE id = ?')
-    cursor.execute(sql, (category_id,))
-    conn.commit()
-    deleted = cursor.rowcount
-    conn.close()
+def delete_category(category_id: str):
+    def write(conn):
+        cursor = conn.cursor()
+        changes = ChangeSet()
+        sql = sql_params('SELECT id FROM products WHERE category = ?')
+        cursor.execute(sql, (category_id,))
+        changes.upsert("products", *(row[0] for row in cursor.fetchall()))
+        # Remove category reference from products before deleting (set to NULL)
+        sql = sql_params('UPDATE products SET category = NULL WHERE category = ?')
+        cursor.execute(sql, (category_id,))
+        sql = sql_params('DELETE FROM categories WHERE id = ?')
+        cursor.execute(sql, (category_id,))
+        deleted = cursor.rowcount
+        if deleted:
+            changes.delete("categories", category_id)
+        changes.write(conn)
+        return deleted
+
+    deleted = run_write(write)
 
     if deleted == 0:
         raise HTTPException(status_code=404, detail="Category not found")
+    get_store_db().barcode_index.clear_category(category_id)
     return {"status": "deleted"}
 
 @app.get("/api/sales")
-async def get_sales():
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM sales ORDER BY date DESC")
-    rows = cursor.fetchall()
-    conn.close()
-    
-    sales = []
-    for row in rows:
-        sales.append({
-            "id": row[0],
-            "product_id": row[1],
-            "product_name": row[2],
-            "quantity": row[3],
-            "price": row[4],
-            "total_price": row[5],
-            "date": row[6]
-        })
-    
-    return sales
+def get_sales(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    product_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+):
+    not_modified = check_not_modified(request, response, "sales")
+    if not_modified:
+        return not_modified
+
+    filters = []
+    if product_id:
+        filters.append(("product_id = ?", (product_id,)))
+    if date_from:
+        filters.append(("date >= ?", (date_from,)))
+    if date_to:
+        filters.append(("date < ?", (date_to,)))
+
+    columns, rows, next_cursor = fetch_page(
+        "sales", SALE_COLUMNS, "date", True, fields, filters,
+        limit or get_default_list_limit(), cursor,
+    )
+    set_next_cursor(request, response, next_cursor)
+    return RowsResponse(columns, rows, headers=response.headers)
+
+STOCK_UPDATE_RETRIES = int(os.getenv("STOCK_UPDATE_RETRIES", "5"))
+STOCK_DECREMENT_SQL = (
+    "UPDATE products SET stock = stock - ?, version = version + 1 "
+    "WHERE id = ? AND stock >= ? AND version = ?"
+)
+# Conditional stock updates that lost a race and were retried (all stores)
+stock_update_retries = 0
+
+def insufficient_stock(product_id: str, requested: int, available: int) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail={
+            "error": "insufficient_stock",
+            "product_id": product_id,
+            "requested": requested,
+            "available": available,
+        },
+    )
+
+def take_stock(cursor, product_id: str, quantities: List[int]) -> tuple:
+    """Take ``quantities`` from a product's stock, in order, while it lasts.
+
+    Lock-free optimistic update: read ``(stock, version)``, decide which
+    quantities fit, then ``UPDATE ... WHERE stock >= ? AND version = ?``.
+    If another till changed the product in between, the update matches no
+    row and is retried with fresh values, at most ``STOCK_UPDATE_RETRIES``
+    times. Stock never goes negative. Returns ``(taken, available, stock,
+    version)``: one flag per quantity, the stock seen before taking, and the
+    stock and version this transaction leaves. Raises 400 for a quantity
+    that isn't positive, 404 for an unknown product and 409 if every retry
+    lost a race.
+    """
+    global stock_update_retries
+    if any(quantity <= 0 for quantity in quantities):
+        # A negative quantity would put stock back through the decrement
+        raise HTTPException(status_code=400, detail="Quantities must be positive")
+    for _ in range(max(1, STOCK_UPDATE_RETRIES)):
+        cursor.execute(sql_params("SELECT stock, version FROM products WHERE id = ?"), (product_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        available, version = row
+        remaining = available
+        taken = []
+        for quantity in quantities:
+            fits = quantity <= remaining
+            taken.append(fits)
+            if fits:
+                remaining -= quantity
+        total = available - remaining
+        if total == 0:
+            return taken, available, available, version
+        cursor.execute(sql_params(STOCK_DECREMENT_SQL), (total, product_id, total, version))
+        if cursor.rowcount == 1:
+            return taken, available, remaining, version + 1
+        stock_update_retries += 1
+    raise HTTPException(status_code=409, detail="Stock changed concurrently, retry the request")
+
+def return_stock(cursor, product_id: str, quantity: int):
+    """Put ``quantity`` back; returns the ``(stock, version)`` left, or None for an unknown product."""
+    # Putting stock back can't overdraw it, so no condition is needed
+    cursor.execute(
+        sql_params("UPDATE products SET stock = stock + ?, version = version + 1 WHERE id = ?"),
+        (quantity, product_id),
+    )
+    # The row is locked by the update, so this is what the transaction commits
+    cursor.execute(sql_params("SELECT stock, version FROM products WHERE id = ?"), (product_id,))
+    return cursor.fetchone()
 
 @app.post("/api/sales")
-async def create_sale(sale: Sale):
-    conn = get_conn()
-    cursor = conn.cursor()
-    
-    # Insert sale
-    sql = sql_params('''
-        INSERT INTO sales (id, product_id, product_name, quantity, price, total_price, date)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''')
-    cursor.execute(sql, (
-        sale.id,
-        sale.product_id,
-        sale.product_name,
-        sale.quantity,
-        sale.price,
-        sale.total_price,
-        sale.date
-    ))
-    
-    # Update product stock
-    sql = sql_params('''
-        UPDATE products 
-        SET stock = stock - ? 
-        WHERE id = ?
-    ''')
-    cursor.execute(sql, (sale.quantity, sale.product_id))
-    
-    conn.commit()
-    conn.close()
+def create_sale(sale: Sale):
+    def write(conn):
+        cursor = conn.cursor()
+
+        # Update product stock; refused rather than allowed to go negative
+        (taken,), available, stock, version = take_stock(cursor, sale.product_id, [sale.quantity])
+        if not taken:
+            raise insufficient_stock(sale.product_id, sale.quantity, available)
+
+        # Insert sale
+        sql = sql_params('''
+            INSERT INTO sales (id, product_id, product_name, quantity, price, total_price, date)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''')
+        cursor.execute(sql, (
+            sale.id,
+            sale.product_id,
+            sale.product_name,
+            sale.quantity,
+            sale.price,
+            sale.total_price,
+            sale.date
+        ))
+
+        rollup = RollupDelta()
+        rollup.add(sale.product_id, sale.date, sale.quantity, sale.total_price)
+        rollup.apply(cursor, get_db_engine())
+
+        changes = ChangeSet()
+        changes.upsert("sales", sale.id)
+        changes.upsert("products", sale.product_id)
+        changes.write(conn)
+        return stock, version
+
+    stock, version = run_write(write)
+    get_store_db().barcode_index.set_stock(sale.product_id, stock, version)
     return sale
 
-@app.put("/api/sales/{sale_id}")
-async def update_sale(sale_id: str, sale: Sale):
-    conn = get_conn()
-    cursor = conn.cursor()
+SALES_BATCH_MAX = 1000
+IN_CLAUSE_CHUNK = 500
 
-    sql = sql_params('SELECT id, product_id, quantity FROM sales WHERE id = ?')
-    cursor.execute(sql, (sale_id,))
-    existing = cursor.fetchone()
-    if not existing:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Sale not found")
+def find_existing_ids(cursor, table: str, ids: List[str]) -> set:
+    existing = set()
+    for start in range(0, len(ids), IN_CLAUSE_CHUNK):
+        chunk = ids[start:start + IN_CLAUSE_CHUNK]
+        placeholders = ", ".join("?" for _ in chunk)
+        cursor.execute(
+            sql_params(f"SELECT id FROM {table} WHERE id IN ({placeholders})"),
+            tuple(chunk),
+        )
+        existing.update(row[0] for row in cursor.fetchall())
+    return existing
 
-    existing_product_id = existing[1]
-    existing_quantity = existing[2]
+@app.post("/api/sales/batch")
+def create_sales_batch(sales: List[Sale]):
+    if len(sales) > SALES_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch may contain at most {SALES_BATCH_MAX} sales",
+        )
 
-    if existing_product_id != sale.product_id:
-        conn.close()
+    def write(conn):
+        cursor = conn.cursor()
+        # Sales already recorded (e.g. a replay after a dropped response) are skipped
+        existing = find_existing_ids(cursor, "sales", list({sale.id for sale in sales}))
+        results = [None] * len(sales)
+        by_product = {}
+        for index, sale in enumerate(sales):
+            if sale.id in existing:
+                results[index] = {"id": sale.id, "status": "duplicate"}
+                continue
+            existing.add(sale.id)
+            by_product.setdefault(sale.product_id, []).append(index)
+
+        # One stock update per product rather than per sale; sales the stock no longer covers are refused
+        new_sales = []
+        stock_deltas = {}
+        committed = {}
+        rollup = RollupDelta()
+        for product_id, indexes in by_product.items():
+            try:
+                taken, _, stock, version = take_stock(
+                    cursor, product_id, [sales[index].quantity for index in indexes],
+                )
+                committed[product_id] = (stock, version)
+            except HTTPException as exc:
+                if exc.status_code != 404:
+                    raise
+                taken = [None] * len(indexes)
+            for index, fits in zip(indexes, taken):
+                sale = sales[index]
+                status = "created" if fits else "unknown_product" if fits is None else "insufficient_stock"
+                results[index] = {"id": sale.id, "status": status}
+                if fits:
+                    new_sales.append(sale)
+                    stock_deltas[product_id] = stock_deltas.get(product_id, 0) + sale.quantity
+                    rollup.add(sale.product_id, sale.date, sale.quantity, sale.total_price)
+
+        if new_sales:
+            sql = sql_params('''
+                INSERT INTO sales (id, product_id, product_name, quantity, price, total_price, date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''')
+            cursor.executemany(sql, [
+                (
+                    sale.id,
+                    sale.product_id,
+                    sale.product_name,
+                    sale.quantity,
+                    sale.price,
+                    sale.total_price,
+                    sale.date,
+                )
+                for sale in new_sales
+            ])
+            rollup.apply(cursor, get_db_engine())
+
+        changes = ChangeSet()
+        changes.upsert("sales", *(sale.id for sale in new_sales))
+        changes.upsert("products", *stock_deltas)
+        changes.write(conn)
+        return results, new_sales, committed
+
+    results, new_sales, committed = run_write(write)
+
+    barcode_index = get_store_db().barcode_index
+    for product_id, (stock, version) in committed.items():
+        barcode_index.set_stock(product_id, stock, version)
+    duplicates = sum(1 for result in results if result["status"] == "duplicate")
+    return {
+        "created": len(new_sales),
+        "duplicates": duplicates,
+        "rejected": len(sales) - len(new_sales) - duplicates,
+        "results": results,
+    }
+
+CHECKOUT_MAX_LINES = 100
+
+class CheckoutLine(BaseModel):
+    product_id: str
+    quantity: int = Field(..., gt=0)
+    # Defaults to the product's current price
+    price: Optional[float] = None
+
+class Checkout(BaseModel):
+    id: str
+    date: str
+    lines: List[CheckoutLine]
+
+class StockRace(Exception):
+    """A conditional stock update matched fewer rows than it should have."""
+
+def checkout_receipt(basket_id: str, date: str, lines, status: str) -> dict:
+    items = [dict(zip(SALE_COLUMNS, line)) for line in lines]
+    return {
+        "id": basket_id,
+        "date": date,
+        "status": status,
+        "lines": items,
+        "items": sum(item["quantity"] for item in items),
+        "total": round(sum(item["total_price"] for item in items), 2),
+    }
+
+@app.post("/api/checkout")
+def checkout(basket: Checkout):
+    """Record a whole basket as one sale per line, all or nothing, and return its receipt.
+
+    Stock, names and prices for every line come from one query, and the
+    stock updates and sale rows are written in one transaction. Sale ids are
+    ``<basket id>-<line number>``, so replaying a basket returns the receipt
+    that was recorded instead of selling it twice.
+    """
+    global stock_update_retries
+    if not basket.lines:
+        raise HTTPException(status_code=400, detail="A basket needs at least one line")
+    if len(basket.lines) > CHECKOUT_MAX_LINES:
         raise HTTPException(
-            status_code=400,
-            detail="Changing product_id for a sale is not supported",
+            status_code=413,
+            detail=f"A basket may contain at most {CHECKOUT_MAX_LINES} lines",
         )
+    sale_ids = [f"{basket.id}-{number}" for number in range(1, len(basket.lines) + 1)]
+    quantities = {}
+    for line in basket.lines:
+        quantities[line.product_id] = quantities.get(line.product_id, 0) + line.quantity
 
-    quantity_delta = sale.quantity - existing_quantity
-    if quantity_delta != 0:
-        sql = sql_params('SELECT stock FROM products WHERE id = ?')
-        cursor.execute(sql, (sale.product_id,))
-        product = cursor.fetchone()
-        if not product:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Product not found")
-        current_stock = product[0]
-        if quantity_delta > 0 and current_stock < quantity_delta:
-            conn.close()
+    def write(conn):
+        cursor = conn.cursor()
+        placeholders = ", ".join("?" for _ in sale_ids)
+        cursor.execute(
+            sql_params(f"SELECT {', '.join(SALE_COLUMNS)} FROM sales WHERE id IN ({placeholders})"),
+            sale_ids,
+        )
+        recorded = {row[0]: row for row in cursor.fetchall()}
+        if recorded:
+            return [recorded[sale_id] for sale_id in sale_ids if sale_id in recorded], None
+
+        product_ids = list(quantities)
+        placeholders = ", ".join("?" for _ in product_ids)
+        cursor.execute(
+            sql_params(f"SELECT id, name, price, stock, version FROM products WHERE id IN ({placeholders})"),
+            product_ids,
+        )
+        products = {row[0]: row[1:] for row in cursor.fetchall()}
+        missing = [product_id for product_id in product_ids if product_id not in products]
+        if missing:
+            raise HTTPException(status_code=404, detail={"error": "unknown_product", "product_ids": missing})
+        short = [
+            {"product_id": product_id, "requested": quantity, "available": products[product_id][2]}
+            for product_id, quantity in quantities.items()
+            if products[product_id][2] < quantity
+        ]
+        if short:
+            raise HTTPException(status_code=409, detail={"error": "insufficient_stock", "products": short})
+
+        cursor.executemany(sql_params(STOCK_DECREMENT_SQL), [
+            (quantity, product_id, quantity, products[product_id][3])
+            for product_id, quantity in quantities.items()
+        ])
+        if cursor.rowcount != len(quantities):
+            # Another till changed one of the products since it was read
+            raise StockRace()
+
+        lines = []
+        rollup = RollupDelta()
+        for sale_id, line in zip(sale_ids, basket.lines):
+            name, current_price = products[line.product_id][:2]
+            price = current_price if line.price is None else line.price
+            total_price = round(price * line.quantity, 2)
+            lines.append((sale_id, line.product_id, name, line.quantity, price, total_price, basket.date))
+            rollup.add(line.product_id, basket.date, line.quantity, total_price)
+        cursor.executemany(
+            sql_params(f"INSERT INTO sales ({', '.join(SALE_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)"),
+            lines,
+        )
+        rollup.apply(cursor, get_db_engine())
+
+        changes = ChangeSet()
+        changes.upsert("sales", *sale_ids)
+        changes.upsert("products", *product_ids)
+        changes.write(conn)
+        committed = {
+            product_id: (products[product_id][2] - quantity, products[product_id][3] + 1)
+            for product_id, quantity in quantities.items()
+        }
+        return lines, committed
+
+    for _ in range(max(1, STOCK_UPDATE_RETRIES)):
+        try:
+            lines, committed = run_write(write)
+            break
+        except StockRace:
+            stock_update_retries += 1
+    else:
+        raise HTTPException(status_code=409, detail="Stock changed concurrently, retry the request")
+
+    if committed is None:
+        return checkout_receipt(basket.id, basket.date, lines, "duplicate")
+    barcode_index = get_store_db().barcode_index
+    for product_id, (stock, version) in committed.items():
+        barcode_index.set_stock(product_id, stock, version)
+    return checkout_receipt(basket.id, basket.date, lines, "created")
+
+@app.put("/api/sales/{sale_id}")
+def update_sale(sale_id: str, sale: Sale):
+    def write(conn):
+        cursor = conn.cursor()
+
+        sql = sql_params('SELECT id, product_id, quantity, total_price, date FROM sales WHERE id = ?')
+        cursor.execute(sql, (sale_id,))
+        existing = cursor.fetchone()
+        if not existing:
+            raise HTTPException(status_code=404, detail="Sale not found")
+
+        existing_product_id = existing[1]
+        existing_quantity = existing[2]
+
+        if existing_product_id != sale.product_id:
             raise HTTPException(
                 status_code=400,
-                detail="Insufficient stock for updated sale quantity",
+                detail="Changing product_id for a sale is not supported",
             )
 
+        quantity_delta = sale.quantity - existing_quantity
+        committed = None
+        if quantity_delta > 0:
+            (taken,), available, *committed = take_stock(cursor, sale.product_id, [quantity_delta])
+            if not taken:
+                raise insufficient_stock(sale.product_id, quantity_delta, available)
+        elif quantity_delta < 0:
+            committed = return_stock(cursor, sale.product_id, -quantity_delta)
+
         sql = sql_params('''
-            UPDATE products
-            SET stock = stock - ?
+            UPDATE sales
+            SET product_name = ?,
+                quantity = ?,
+                price = ?,
+                total_price = ?,
+                date = ?
             WHERE id = ?
         ''')
-        cursor.execute(sql, (quantity_delta, sale.product_id))
+        cursor.execute(
+            sql,
+            (
+                sale.product_name,
+                sale.quantity,
+                sale.price,
+                sale.total_price,
+                sale.date,
+                sale_id,
+            ),
+        )
 
-    sql = sql_params('''
-        UPDATE sales
-        SET product_name = ?,
-            quantity = ?,
-            price = ?,
-            total_price = ?,
-            date = ?
-        WHERE id = ?
-    ''')
-    cursor.execute(
-        sql,
-        (
-            sale.product_name,
-            sale.quantity,
-            sale.price,
-            sale.total_price,
-            sale.date,
-            sale_id,
-        ),
-    )
+        rollup = RollupDelta()
+        rollup.add(existing_product_id, existing[4], existing_quantity, existing[3], sign=-1)
+        rollup.add(sale.product_id, sale.date, sale.quantity, sale.total_price)
+        rollup.apply(cursor, get_db_engine())
 
-    conn.commit()
-    conn.close()
+        changes = ChangeSet()
+        changes.upsert("sales", sale_id)
+        if quantity_delta != 0:
+            changes.upsert("products", sale.product_id)
+        changes.write(conn)
+        return committed
+
+    committed = run_write(write)
+    if committed is not None:
+        get_store_db().barcode_index.set_stock(sale.product_id, *committed)
     return sale
 
 @app.delete("/api/sales/{sale_id}")
-async def delete_sale(sale_id: str):
-    conn = get_conn()
-    cursor = conn.cursor()
+def delete_sale(sale_id: str):
+    def write(conn):
+        cursor = conn.cursor()
 
-    sql = sql_params('SELECT id, product_id, quantity FROM sales WHERE id = ?')
-    cursor.execute(sql, (sale_id,))
-    existing = cursor.fetchone()
-    if not existing:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Sale not found")
+        sql = sql_params('SELECT id, product_id, quantity, total_price, date FROM sales WHERE id = ?')
+        cursor.execute(sql, (sale_id,))
+        existing = cursor.fetchone()
+        if not existing:
+            raise HTTPException(status_code=404, detail="Sale not found")
 
-    product_id = existing[1]
-    quantity = existing[2]
+        product_id = existing[1]
+        quantity = existing[2]
 
-    sql = sql_params('DELETE FROM sales WHERE id = ?')
-    cursor.execute(sql, (sale_id,))
+        sql = sql_params('DELETE FROM sales WHERE id = ?')
+        cursor.execute(sql, (sale_id,))
+        committed = return_stock(cursor, product_id, quantity)
 
-    sql = sql_params('''
-        UPDATE products
-        SET stock = stock + ?
-        WHERE id = ?
-    ''')
-    cursor.execute(sql, (quantity, product_id))
+        rollup = RollupDelta()
+        rollup.add(product_id, existing[4], quantity, existing[3], sign=-1)
+        rollup.apply(cursor, get_db_engine())
 
-    conn.commit()
-    conn.close()
+        changes = ChangeSet()
+        changes.delete("sales", sale_id)
+        changes.upsert("products", product_id)
+        changes.write(conn)
+        return product_id, committed
+
+    product_id, committed = run_write(write)
+    if committed is not None:
+        get_store_db().barcode_index.set_stock(product_id, *committed)
     return {"status": "deleted"}
 
 @app.get("/api/suppliers")
-async def get_suppliers():
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM suppliers ORDER BY name")
-    rows = cursor.fetchall()
-    conn.close()
-    
-    suppliers = []
-    for row in rows:
-        suppliers.append({
-            "id": row[0],
-            "name": row[1],
-            "phone": row[2],
-            "location": row[3],
-            "email": row[4],
-            "business_name": row[5],
-            "created_at": row[6]
-        })
-    
-    return suppliers
+def get_suppliers(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    not_modified = check_not_modified(request, response, "suppliers")
+    if not_modified:
+        return not_modified
 
-@app.post("/api/suppliers")
-async def create_supplier(supplier: Supplier):
-    conn = get_conn()
-    cursor = conn.cursor()
-    sql = sql_params('''
-        INSERT INTO suppliers (id, name, phone, location, email, business_name, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''')
-    cursor.execute(sql, (
-        supplier.id,
-        supplier.name,
-        supplier.phone,
-        supplier.location,
-        supplier.email,
-        supplier.business_name,
-        supplier.created_at
-    ))
-    conn.commit()
-    conn.close()
-    return supplier
+    columns, rows, next_cursor = fetch_page(
+        "suppliers", SUPPLIER_COLUMNS, "name", False, fields, [],
+        limit or get_default_list_limit(), cursor,
+    )
+    set_next_cursor(request, response, next_cursor)
+    return RowsResponse(columns, rows, headers=response.headers)
 
-@app.put("/api/suppliers/{supplier_id}")
-async def update_supplier(supplier_id: str, supplier: Supplier):
-    conn = get_conn()
-    cursor = conn.cursor()
-    sql = sql_params('''
-        UPDATE suppliers
-        SET name = ?,
-            phone = ?,
-            location = ?,
-            email = ?,
-            business_name = ?,
-            created_at = ?
-        WHERE id = ?
-    ''')
-    cursor.execute(
-        sql,
-        (
+@app.post("/api/suppliers")
+def create_supplier(supplier: Supplier):
+    def write(conn):
+        cursor = conn.cursor()
+        sql = sql_params('''
+            INSERT INTO suppliers (id, name, phone, location, email, business_name, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''')
+        cursor.execute(sql, (
+            supplier.id,
             supplier.name,
             supplier.phone,
             supplier.location,
             supplier.email,
             supplier.business_name,
-            supplier.created_at,
-            supplier_id,
-        ),
-    )
-    conn.commit()
-    updated = cursor.rowcount
-    conn.close()
+            supplier.created_at
+        ))
+        changes = ChangeSet()
+        changes.upsert("suppliers", supplier.id)
+        changes.write(conn)
+
+    run_write(write)
+    return supplier
+
+@app.put("/api/suppliers/{supplier_id}")
+def update_supplier(supplier_id: str, supplier: Supplier):
+    def write(conn):
+        cursor = conn.cursor()
+        sql = sql_params('''
+            UPDATE suppliers
+            SET name = ?,
+                phone = ?,
+                location = ?,
+                email = ?,
+                business_name = ?,
+                created_at = ?
+            WHERE id = ?
+        ''')
+        cursor.execute(
+            sql,
+            (
+                supplier.name,
+                supplier.phone,
+                supplier.location,
+                supplier.email,
+                supplier.business_name,
+                supplier.created_at,
+                supplier_id,
+            ),
+        )
+        updated = cursor.rowcount
+        if updated:
+            changes = ChangeSet()
+            changes.upsert("suppliers", supplier_id)
+            changes.write(conn)
+        return updated
+
+    updated = run_write(write)
 
     if updated == 0:
         raise HTTPException(status_code=404, detail="Supplier not found")
     return supplier
 
 @app.delete("/api/suppliers/{supplier_id}")
-async def delete_supplier(supplier_id: str):
-    conn = get_conn()
-    cursor = conn.cursor()
-    sql = sql_params('DELETE FROM suppliers WHERE id = ?')
-    cursor.execute(sql, (supplier_id,))
-    conn.commit()
-    deleted = cursor.rowcount
-    conn.close()
+def delete_supplier(supplier_id: str):
+    def write(conn):
+        cursor = conn.cursor()
+        sql = sql_params('DELETE FROM suppliers WHERE id = ?')
+        cursor.execute(sql, (supplier_id,))
+        deleted = cursor.rowcount
+        if deleted:
+            changes = ChangeSet()
+            changes.delete("suppliers", supplier_id)
+            changes.write(conn)
+        return deleted
+
+    deleted = run_write(write)
 
     if deleted == 0:
         raise HTTPException(status_code=404, detail="Supplier not found")
     return {"status": "deleted"}
 
+# Change tracking: per-table versions (conditional GETs) and the row-level change log (sync)
+# Change sets written by the transaction running in run_write()
+written_change_sets: ContextVar[Optional[list]] = ContextVar("written_change_sets", default=None)
+
+class ChangeSet:
+    """Rows touched by one transaction, written just before it commits."""
+
+    def __init__(self):
+        self.ops = {}
+
+    def upsert(self, table: str, *row_ids):
+        for row_id in row_ids:
+            self.ops[(table, row_id)] = "upsert"
+
+    def delete(self, table: str, *row_ids):
+        for row_id in row_ids:
+            self.ops[(table, row_id)] = "delete"
+
+    def archive(self, table: str, *row_ids):
+        # Moved to cold storage: gone from the table, but not a deletion for sync clients
+        for row_id in row_ids:
+            self.ops[(table, row_id)] = "archive"
+
+    @property
+    def tables(self):
+        return list(dict.fromkeys(table for table, _ in self.ops))
+
+    def write(self, conn):
+        if not self.ops:
+            return
+        written = written_change_sets.get()
+        if written is not None:
+            written.append(self)
+        cursor = conn.cursor()
+        now = datetime.now(timezone.utc)
+        cursor.executemany(
+            sql_params('INSERT INTO change_log (table_name, row_id, op, changed_at) VALUES (?, ?, ?, ?)'),
+            [(table, row_id, op, db_timestamp(now)) for (table, row_id), op in self.ops.items()],
+        )
+        bump_table_versions(cursor, self.tables, now)
+
+def db_timestamp(moment: datetime) -> str:
+    # Naive UTC: MySQL would shift an offset into the session time zone, and SQLite compares the text
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def bump_table_versions(cursor, tables, now: datetime):
+    # Last in the transaction so the version row lock is held as briefly as possible
+    cursor.executemany(
+        sql_params('UPDATE table_versions SET version = version + 1, updated_at = ? WHERE table_name = ?'),
+        [(db_timestamp(now), table) for table in tables],
+    )
+
+def prune_change_log(conn):
+    """Drop change_log rows older than ``SYNC_RETENTION_DAYS``, moving the sync horizon past them."""
+    cutoff = db_timestamp(datetime.now(timezone.utc) - timedelta(days=SYNC_RETENTION_DAYS))
+    cursor = conn.cursor()
+    cursor.execute(sql_params('SELECT MAX(seq) FROM change_log WHERE changed_at < ?'), (cutoff,))
+    pruned = cursor.fetchone()[0]
+    if pruned is None:
+        return
+    cursor.execute(sql_params('DELETE FROM change_log WHERE seq <= ?'), (pruned,))
+    cursor.execute(
+        sql_params('UPDATE change_log_horizon SET seq = ? WHERE id = 1 AND seq < ?'), (pruned, pruned),
+    )
+
+def get_table_version(table: str):
+    conn = get_conn()
+    cursor = conn.cursor()
+    sql = sql_params('SELECT version, updated_at FROM table_versions WHERE table_name = ?')
+    cursor.execute(sql, (table,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/"x" and "x" match (RFC 9110 section 13.1.2)
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+def check_not_modified(request: Request, response: Response, table: str) -> Optional[Response]:
+    """Set ETag/Last-Modified for a list response; return a 304 if the client is current.
+
+    The ETag covers the table's change version and the query string, so each
+    page/filter combination validates independently.
+    """
+    row = get_table_version(table)
+    if row is None:
+        return None
+    version, updated_at = row
+    # Stores share URLs, so the store is part of the validator
+    query_hash = hashlib.blake2b(f"{get_store_id()}?{request.url.query}".encode(), digest_size=6).hexdigest()
+    etag = f'W/"{table}-{version}-{query_hash}"'
+    if not isinstance(updated_at, datetime):
+        updated_at = datetime.fromisoformat(str(updated_at))
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True),
+        "Cache-Control": "no-cache",
+        "Vary": "X-Store-Id",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+SYNC_TABLE_COLUMNS = {
+    "products": PRODUCT_COLUMNS,
+    "sales": SALE_COLUMNS,
+    "suppliers": SUPPLIER_COLUMNS,
+    "categories": CATEGORY_COLUMNS,
+}
+SYNC_MAX_LIMIT = 5000
+# MySQL: how long a gap in change_log.seq may be an uncommitted transaction rather than a rollback
+SYNC_SETTLE_SECONDS = float(os.getenv("SYNC_SETTLE_SECONDS", "30"))
+# Days change_log rows are kept; a client whose cursor is older gets a full resync (0 keeps them forever)
+SYNC_RETENTION_DAYS = float(os.getenv("SYNC_RETENTION_DAYS", "30"))
+CHANGE_LOG_PRUNE_INTERVAL = 600
+
+def event_tables(tables: Optional[str]):
+    if not tables:
+        return None
+    selected = [table.strip() for table in tables.split(",") if table.strip()]
+    unknown = [table for table in selected if table not in SYNC_TABLE_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+    return selected
+
+@app.get("/api/events")
+async def stream_events(tables: Optional[str] = None):
+    """Server-Sent Events stream of committed changes in the request's store.
+
+    Each ``changes`` event lists ``{table, id, op}`` entries; fetch the rows
+    through ``/api/sync`` or the list routes. A subscriber that falls behind
+    gets a ``dropped`` event and the stream ends.
+    """
+    subscriber = event_hub.subscribe(get_store_id(), event_tables(tables))
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    payload = await asyncio.wait_for(subscriber.get(), EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield b": keepalive\n\n"
+                    continue
+                if payload is None:
+                    yield b'event: dropped\ndata: {"reason":"slow_consumer"}\n\n'
+                    return
+                yield b"event: changes\ndata: " + payload.encode("utf-8") + b"\n\n"
+        finally:
+            event_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/api/events/ws")
+async def events_websocket(websocket: WebSocket, tables: Optional[str] = None):
+    """The ``/api/events`` stream as WebSocket text messages."""
+    try:
+        selected = event_tables(tables)
+    except HTTPException as exc:
+        await websocket.close(code=1008, reason=exc.detail)
+        return
+    await websocket.accept()
+    subscriber = event_hub.subscribe(get_store_id(), selected)
+    # Client messages are ignored; reading is only needed to notice it going away
+    receiving = asyncio.ensure_future(websocket.receive())
+    next_event = asyncio.ensure_future(subscriber.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receiving, next_event}, return_when=asyncio.FIRST_COMPLETED)
+            if receiving in done:
+                if receiving.result()["type"] == "websocket.disconnect":
+                    return
+                receiving = asyncio.ensure_future(websocket.receive())
+            if next_event in done:
+                payload = next_event.result()
+                if payload is None:
+                    await websocket.close(code=1013, reason="slow_consumer")
+                    return
+                await websocket.send_text(payload)
+                next_event = asyncio.ensure_future(subscriber.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiving.cancel()
+        next_event.cancel()
+        event_hub.unsubscribe(subscriber)
+
+def read_change_log(cursor, since: int, limit: int) -> list:
+    """``(seq, table, row_id, op, recent)`` after ``since``; ``recent`` if younger than the settle window."""
+    sql = sql_params('''
+        SELECT seq, table_name, row_id, op, changed_at > ?
+        FROM change_log
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    ''')
+    # Same encoding as ChangeSet.write, so the comparison needs no time zone handling
+    settle_after = db_timestamp(datetime.now(timezone.utc) - timedelta(seconds=SYNC_SETTLE_SECONDS))
+    cursor.execute(sql, (settle_after, since, limit))
+    return cursor.fetchall()
+
+def entries_before_recent_gap(entries: list, since: int) -> list:
+    # MySQL: the missing seqs may be in flight; older gaps are rolled back transactions
+    previous = since
+    for index, (seq, _, _, _, recent) in enumerate(entries):
+        if seq != previous + 1 and recent:
+            return entries[:index]
+        previous = seq
+    return entries
+
+@app.get("/api/sync")
+def sync_changes(since: int = Query(0, ge=0), limit: int = Query(1000, ge=1, le=SYNC_MAX_LIMIT)):
+    """Rows changed after change-log cursor ``since``.
+
+    Several changes to one row collapse into its current state (or a
+    tombstone if it no longer exists). Rows whose latest change is being
+    archived are left out entirely. Repeat with the returned ``cursor``
+    while ``has_more`` is true.
+
+    On MySQL, where seqs are allocated on insert but may commit out of
+    order, the cursor stops before a gap in seq until the change after it
+    is ``SYNC_SETTLE_SECONDS`` old, so a change still in flight isn't skipped.
+
+    If changes after ``since`` have been pruned from the log, the response
+    is a full resync instead: ``reset`` is true and every current row is
+    listed under ``upserts``. The client replaces its copy and carries on
+    from the returned ``cursor``.
+    """
+    conn = get_conn()
+    cursor = conn.cursor()
+    entries = read_change_log(cursor, since, limit + 1)
+    # Read after the entries: a prune that removed some of them has moved the horizon by now
+    cursor.execute('SELECT seq FROM change_log_horizon')
+    horizon = cursor.fetchone()[0]
+    if since < horizon:
+        changes = {}
+        for table, columns in SYNC_TABLE_COLUMNS.items():
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {table}")
+            changes[table] = {"upserts": [dict(zip(columns, row)) for row in cursor.fetchall()], "deletes": []}
+        conn.close()
+        # The rows already reflect every change up to the horizon; later ones are replayed from it
+        return {"cursor": horizon, "has_more": True, "reset": True, "changes": changes}
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    if get_db_engine() == "mysql":
+        settled = entries_before_recent_gap(entries, since)
+        if len(settled) < len(entries):
+            entries, has_more = settled, False
+
+    latest = {}
+    for _, table, row_id, op, _ in entries:
+        if table in SYNC_TABLE_COLUMNS:
+            latest[(table, row_id)] = op
+
+    changes = {}
+    for table, columns in SYNC_TABLE_COLUMNS.items():
+        ids = [row_id for (t, row_id), op in latest.items() if t == table and op == "upsert"]
+        found = {}
+        for start in range(0, len(ids), IN_CLAUSE_CHUNK):
+            chunk = ids[start:start + IN_CLAUSE_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            cursor.execute(
+                sql_params(f"SELECT {', '.join(columns)} FROM {table} WHERE id IN ({placeholders})"),
+                tuple(chunk),
+            )
+            for row in cursor.fetchall():
+                found[row[0]] = dict(zip(columns, row))
+        changes[table] = {
+            "upserts": list(found.values()),
+            # Deleted rows, and rows upserted then removed by a later change
+            "deletes": [
+                row_id for (t, row_id), op in latest.items()
+                if t == table and (op == "delete" or (op == "upsert" and row_id not in found))
+            ],
+        }
+    conn.close()
+
+    return {
+        "cursor": entries[-1][0] if entries else since,
+        "has_more": has_more,
+        "reset": False,
+        "changes": changes,
+    }
+
+# Streaming exports
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def _export_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def _fetch_chunks(cursor):
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+        if not rows:
+            return
+        yield rows
+
+def _merge_archived(chunks, archived):
+    # Both sides are in (date, id) order; MySQL dates compare as their ISO text
+    merged = heapq.merge(
+        archived,
+        (row for rows in chunks for row in rows),
+        key=lambda row: (row[6].isoformat() if isinstance(row[6], datetime) else row[6], row[0]),
+    )
+    while True:
+        rows = list(islice(merged, EXPORT_CHUNK_SIZE))
+        if not rows:
+            return
+        yield rows
+
+def iter_export(sql: str, params: tuple, columns: tuple, fmt: str, archived=None):
+    conn = get_conn()
+    try:
+        if get_db_engine() == "mysql":
+            # Unbuffered cursor: rows are streamed from the server, not loaded up front
+            cursor = conn.cursor(pymysql.cursors.SSCursor)
+        else:
+            cursor = conn.cursor()
+        cursor.execute(sql_params(sql), params)
+
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            yield buffer.getvalue().encode()
+
+        chunks = _fetch_chunks(cursor)
+        if archived is not None:
+            chunks = _merge_archived(chunks, archived)
+        for rows in chunks:
+            if fmt == "csv":
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(
+                    [value.isoformat() if isinstance(value, datetime) else value for value in row]
+                    for row in rows
+                )
+                yield buffer.getvalue().encode()
+            else:
+                yield "".join(
+                    json.dumps(dict(zip(columns, row)), default=_export_default) + "\n"
+                    for row in rows
+                ).encode()
+        cursor.close()
+    finally:
+        conn.close()
+
+def export_response(table: str, columns: tuple, order_by: str, filters: List[tuple], fmt: str, archived=None):
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if filters:
+        sql += " WHERE " + " AND ".join(clause for clause, _ in filters)
+    sql += f" ORDER BY {order_by}"
+    params = tuple(value for _, values in filters for value in values)
+    return StreamingResponse(
+        iter_export(sql, params, columns, fmt, archived),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{fmt}"'},
+    )
+
+@app.get("/api/export/sales")
+def export_sales(
+    format: str = "ndjson",
+    product_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+):
+    filters = []
+    if product_id:
+        filters.append(("product_id = ?", (product_id,)))
+    if date_from:
+        filters.append(("date >= ?", (date_from,)))
+    if date_to:
+        filters.append(("date < ?", (date_to,)))
+    # Archived months are read from their column files and merged in date order
+    archive = get_store_db().archive
+    archived = archive.rows(date_from, date_to, product_id) if archive.covers(date_from, date_to) else None
+    return export_response("sales", SALE_COLUMNS, "date, id", filters, format, archived)
+
+@app.get("/api/export/products")
+def export_products(format: str = "ndjson", category: Optional[str] = None):
+    filters = []
+    if category:
+        filters.append(("category = ?", (category,)))
+    return export_response("products", PRODUCT_COLUMNS, "name, id", filters, format)
+
 @app.get("/api/analytics/demand")
-async def get_demand_prediction():
+def get_demand_prediction():
     conn = get_conn()
     cursor = conn.cursor()
     
-    # Get sales from last 7 days
-    if get_db_engine() == "mysql":
-        sales_sql = '''
-            SELECT product_id,
-                   SUM(quantity) as total_quantity,
-                   COUNT(DISTINCT DATE(date)) as days_with_sales
-            FROM sales 
-            WHERE date >= NOW() - INTERVAL 7 DAY
-            GROUP BY product_id
-        '''
-    else:
-        sales_sql = '''
-            SELECT product_id,
-                   SUM(quantity) as total_quantity,
-                   COUNT(DISTINCT DATE(date)) as days_with_sales
-            FROM sales 
-            WHERE date >= DATE('now', '-7 days')
-            GROUP BY product_id
-        '''
-    cursor.execute(sales_sql)
+    # Get sales from last 7 days (one rollup row per product per day with sales)
+    since = (datetime.now() - timedelta(days=7)).date().isoformat()
+    sales_sql = sql_params('''
+        SELECT product_id,
+               SUM(quantity) as total_quantity,
+               COUNT(*) as days_with_sales
+        FROM daily_sales
+        WHERE day >= ?
+        GROUP BY product_id
+    ''')
+    cursor.execute(sales_sql, (since,))
     
     rows = cursor.fetchall()
     conn.close()
@@ -691,6 +2235,79 @@ async def get_demand_prediction():
         "generated_at": datetime.now().isoformat()
     }
 
+@app.get("/api/analytics/forecast")
+def get_demand_forecast(
+    method: str = "seasonal",
+    history_days: int = Query(56, ge=7, le=730),
+    horizon: int = Query(5, ge=1, le=60),
+    window: int = Query(7, ge=1, le=730),
+    alpha: float = Query(0.3, gt=0, le=1),
+    safety_factor: float = Query(1.65, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    if method not in forecast.METHODS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"method must be one of: {', '.join(forecast.METHODS)}",
+        )
+
+    # History covers complete days only; the forecast starts today
+    today = datetime.now().date()
+    start = today - timedelta(days=history_days)
+
+    conn = get_conn()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name, stock FROM products ORDER BY name, id")
+    products = cursor.fetchall()
+    # Day offsets are computed by the database so rows can be scattered directly
+    if get_db_engine() == "mysql":
+        offset_expr = "DATEDIFF(day, ?)"
+    else:
+        offset_expr = "CAST(julianday(day) - julianday(?) AS INTEGER)"
+    sql = sql_params(f'''
+        SELECT product_id, {offset_expr}, quantity
+        FROM daily_sales
+        WHERE day >= ? AND day < ?
+    ''')
+    cursor.execute(sql, (start.isoformat(), start.isoformat(), today.isoformat()))
+    rows = cursor.fetchall()
+    conn.close()
+
+    product_ids = [row[0] for row in products]
+    matrix = forecast.build_matrix(rows, product_ids, history_days)
+    predicted = forecast.forecast(matrix, start, horizon, method, window=window, alpha=alpha)
+    recommended, reorder, confidence, days_with_sales = forecast.recommend(
+        matrix, predicted, [row[2] for row in products], safety_factor
+    )
+    average_daily_sales = matrix.mean(axis=1)
+
+    # Most urgent reorders first
+    order = sorted(range(len(products)), key=lambda i: (-reorder[i], products[i][1]))
+    if limit:
+        order = order[:limit]
+
+    return {
+        "method": method,
+        "history_days": history_days,
+        "prediction_period": horizon,
+        "generated_at": datetime.now().isoformat(),
+        "products": [
+            {
+                "product_id": products[i][0],
+                "name": products[i][1],
+                "stock": products[i][2],
+                "average_daily_sales": round(float(average_daily_sales[i]), 4),
+                "forecast": [round(float(value), 4) for value in predicted[i]],
+                "forecast_total": round(float(predicted[i].sum()), 4),
+                "recommended_stock": int(recommended[i]),
+                "reorder_quantity": int(reorder[i]),
+                "days_with_sales": int(days_with_sales[i]),
+                "confidence": str(confidence[i]),
+            }
+            for i in order
+        ],
+    }
+
 if __name__ == "__main__":
     init_db()
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,281 @@
+"""Request and SQL timing metrics in the Prometheus text format.
+
+``MetricsMiddleware`` records per-route latency histograms, status counts
+and in-flight requests; ``TimedCursor`` wraps DB-API cursors and records
+every statement under its normalized text. ``Metrics.render()`` produces
+the ``/metrics`` body.
+"""
+import bisect
+import re
+import threading
+import time
+from functools import lru_cache
+
+# Seconds; roughly the Prometheus client defaults plus finer sub-millisecond buckets for SQL
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace, literals and ``IN (?, ?, ...)`` lists so that
+    statements differing only in values share one series."""
+    sql = sql.replace("%s", "?")
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{_label(value)}"' for key, value in labels.items())
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = {}
+        self.statuses = {}
+        self.queries = {}
+        self.query_errors = {}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route)
+        with self._lock:
+            histogram = self.requests.get(key)
+            if histogram is None:
+                histogram = self.requests[key] = Histogram(REQUEST_BUCKETS)
+            histogram.observe(seconds)
+            status_key = (method, route, status)
+            self.statuses[status_key] = self.statuses.get(status_key, 0) + 1
+
+    def observe_query(self, sql: str, seconds: float, failed: bool = False):
+        statement = normalize_sql(sql)
+        with self._lock:
+            histogram = self.queries.get(statement)
+            if histogram is None:
+                histogram = self.queries[statement] = Histogram(QUERY_BUCKETS)
+            histogram.observe(seconds)
+            if failed:
+                self.query_errors[statement] = self.query_errors.get(statement, 0) + 1
+
+    def _histogram_lines(self, name, histogram, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return lines
+
+    def render(self, gauges=None) -> str:
+        """Prometheus text exposition; ``gauges`` maps metric name -> (help, value)."""
+        with self._lock:
+            requests = {key: (list(h.counts), h.sum, h.count) for key, h in self.requests.items()}
+            statuses = dict(self.statuses)
+            queries = {key: (list(h.counts), h.sum, h.count) for key, h in self.queries.items()}
+            query_errors = dict(self.query_errors)
+            in_flight = self.in_flight
+
+        def snapshot(buckets, state):
+            histogram = Histogram(buckets)
+            histogram.counts, histogram.sum, histogram.count = state
+            return histogram
+
+        lines = [
+            "# HELP estolo_http_requests_in_flight Requests currently being handled.",
+            "# TYPE estolo_http_requests_in_flight gauge",
+            f"estolo_http_requests_in_flight {in_flight}",
+            "# HELP estolo_http_request_duration_seconds Request latency by route.",
+            "# TYPE estolo_http_request_duration_seconds histogram",
+        ]
+        for (method, route), state in sorted(requests.items()):
+            lines += self._histogram_lines(
+                "estolo_http_request_duration_seconds",
+                snapshot(REQUEST_BUCKETS, state),
+                _labels(method=method, route=route),
+            )
+        lines += [
+            "# HELP estolo_http_responses_total Responses by route and status code.",
+            "# TYPE estolo_http_responses_total counter",
+        ]
+        for (method, route, status), count in sorted(statuses.items()):
+            lines.append(f"estolo_http_responses_total{{{_labels(method=method, route=route, status=status)}}} {count}")
+        lines += [
+            "# HELP estolo_db_query_duration_seconds SQL statement latency by normalized statement.",
+            "# TYPE estolo_db_query_duration_seconds histogram",
+        ]
+        for statement, state in sorted(queries.items()):
+            lines += self._histogram_lines(
+                "estolo_db_query_duration_seconds",
+                snapshot(QUERY_BUCKETS, state),
+                _labels(statement=statement),
+            )
+        lines += [
+            "# HELP estolo_db_query_errors_total SQL statements that raised.",
+            "# TYPE estolo_db_query_errors_total counter",
+        ]
+        for statement, count in sorted(query_errors.items()):
+            lines.append(f"estolo_db_query_errors_total{{{_labels(statement=statement)}}} {count}")
+        for name, (help_text, value) in (gauges or {}).items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+class TimedCursor:
+    """DB-API cursor proxy that reports each execute/executemany to ``metrics``
+    (if given) and statements over its threshold to ``slow_log`` (if given).
+
+    SQLite (and unbuffered MySQL cursors) do most of the work of a SELECT
+    while rows are fetched, so fetch time is added to the statement, which
+    is reported once its result is exhausted, the next statement runs, or
+    the cursor or its pooled connection is closed.
+    """
+
+    def __init__(self, cursor, metrics: Metrics = None, slow_log=None):
+        self._cursor = cursor
+        self._metrics = metrics
+        self._slow_log = slow_log
+        self._pending = None
+
+    def _finish(self, failed=False):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        sql, params, many, elapsed = pending
+        if self._metrics is not None:
+            self._metrics.observe_query(sql, elapsed, failed=failed)
+        if not failed and self._slow_log is not None and elapsed >= self._slow_log.threshold:
+            self._slow_log.record(self._cursor, sql, params, elapsed, many)
+
+    def finish(self):
+        """Report the statement still being fetched, if any (before its connection is released)."""
+        self._finish()
+
+    def _timed(self, method, sql, args, many):
+        self._finish()
+        started = time.perf_counter()
+        self._pending = (sql, args[0] if args else None, many, 0.0)
+        try:
+            result = method(sql, *args)
+        except Exception:
+            self._add(started)
+            self._finish(failed=True)
+            raise
+        self._add(started)
+        if self._cursor.description is None:
+            # No result set to fetch
+            self._finish()
+        return result
+
+    def _add(self, started):
+        if self._pending is not None:
+            sql, params, many, elapsed = self._pending
+            self._pending = (sql, params, many, elapsed + time.perf_counter() - started)
+
+    def execute(self, sql, *args):
+        return self._timed(self._cursor.execute, sql, args, False)
+
+    def executemany(self, sql, *args):
+        return self._timed(self._cursor.executemany, sql, args, True)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._add(started)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(*args)
+        self._add(started)
+        if not rows or len(rows) < (args[0] if args else self._cursor.arraysize):
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._add(started)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so timing adds no extra task or response copy."""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        with metrics._lock:
+            metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            with metrics._lock:
+                metrics.in_flight -= 1
+            # Route templates keep label cardinality bounded (no ids in paths)
+            route = scope.get("route")
+            metrics.observe_request(scope["method"], getattr(route, "path", "<unmatched>"), status, elapsed)
@@ -0,0 +1,438 @@
+"""Versioned schema migrations for the SQLite and MySQL engines.
+
+``init_db()`` creates the base tables and then calls ``migrate()``, which
+applies every migration newer than the version recorded in
+``schema_migrations``. Migrations are append-only: never edit one that has
+shipped, add a new one with the next version number instead.
+
+An ``optional`` migration needs a feature the engine may lack (FTS5,
+FULLTEXT). If it fails it is rolled back and recorded as skipped, and the
+app falls back to code that doesn't need it.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List
+
+MYSQL_LOCK_NAME = "estolo_schema_migrations"
+
+logger = logging.getLogger("estolo.migrations")
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    sqlite: List[str]
+    mysql: List[str]
+    sqlite_down: List[str] = field(default_factory=list)
+    mysql_down: List[str] = field(default_factory=list)
+    optional: bool = False
+
+    def statements(self, engine: str, down: bool = False) -> List[str]:
+        if engine == "mysql":
+            return self.mysql_down if down else self.mysql
+        return self.sqlite_down if down else self.sqlite
+
+
+def _index(name: str, table: str, columns: str, mysql_columns: str = None):
+    # MySQL needs prefix lengths on TEXT columns, SQLite doesn't accept them.
+    return (
+        f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})",
+        f"CREATE INDEX {name} ON {table} ({mysql_columns or columns})",
+        f"DROP INDEX IF EXISTS {name}",
+        f"DROP INDEX {name} ON {table}",
+    )
+
+
+def _index_migration(version: int, name: str, indexes) -> Migration:
+    return Migration(
+        version=version,
+        name=name,
+        sqlite=[index[0] for index in indexes],
+        mysql=[index[1] for index in indexes],
+        sqlite_down=[index[2] for index in indexes],
+        mysql_down=[index[3] for index in indexes],
+    )
+
+
+# The category listing pages by (name, id) within a category
+_CATEGORY_NAME = _index("idx_products_category_name", "products", "category, name", "category(64), name(191)")
+_CATEGORY_NAME_ID = _index(
+    "idx_products_category_name_id", "products", "category, name, id", "category(64), name(191), id(64)",
+)
+
+# Retention pruning finds expired change_log rows by age
+_CHANGE_LOG_CHANGED_AT = _index("idx_change_log_changed_at", "change_log", "changed_at")
+
+MIGRATIONS = [
+    _index_migration(1, "sales indexes", [
+        # Date range scans (analytics) and ORDER BY date DESC, id DESC paging
+        _index("idx_sales_date_id", "sales", "date, id", "date, id(64)"),
+        # Per-product history and the product_id + date filters on /api/sales
+        _index("idx_sales_product_date", "sales", "product_id, date", "product_id(64), date"),
+    ]),
+    _index_migration(2, "product and supplier indexes", [
+        _index("idx_products_barcode", "products", "barcode", "barcode(64)"),
+        _index("idx_products_name_id", "products", "name, id", "name(191), id(64)"),
+        _index("idx_products_category_name", "products", "category, name", "category(64), name(191)"),
+        _index("idx_suppliers_name_id", "suppliers", "name, id", "name(191), id(64)"),
+    ]),
+    Migration(
+        version=3,
+        name="daily sales rollups",
+        sqlite=[
+            '''
+            CREATE TABLE IF NOT EXISTS daily_sales (
+                product_id TEXT NOT NULL,
+                day TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                revenue REAL NOT NULL,
+                transactions INTEGER NOT NULL,
+                PRIMARY KEY (product_id, day)
+            )
+            ''',
+            "CREATE INDEX IF NOT EXISTS idx_daily_sales_day ON daily_sales (day)",
+            '''
+            INSERT INTO daily_sales (product_id, day, quantity, revenue, transactions)
+            SELECT product_id, substr(date, 1, 10), SUM(quantity), SUM(total_price), COUNT(*)
+            FROM sales
+            GROUP BY product_id, substr(date, 1, 10)
+            ''',
+        ],
+        mysql=[
+            '''
+            CREATE TABLE IF NOT EXISTS daily_sales (
+                product_id VARCHAR(191) NOT NULL,
+                day DATE NOT NULL,
+                quantity INTEGER NOT NULL,
+                revenue DOUBLE NOT NULL,
+                transactions INTEGER NOT NULL,
+                PRIMARY KEY (product_id, day),
+                INDEX idx_daily_sales_day (day)
+            )
+            ''',
+            '''
+            INSERT INTO daily_sales (product_id, day, quantity, revenue, transactions)
+            SELECT product_id, DATE(date), SUM(quantity), SUM(total_price), COUNT(*)
+            FROM sales
+            GROUP BY product_id, DATE(date)
+            ''',
+        ],
+        sqlite_down=["DROP TABLE IF EXISTS daily_sales"],
+        mysql_down=["DROP TABLE IF EXISTS daily_sales"],
+    ),
+    Migration(
+        version=4,
+        name="table change versions",
+        sqlite=[
+            '''
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            ''',
+            '''
+            INSERT OR IGNORE INTO table_versions (table_name, version, updated_at)
+            VALUES ('products', 1, datetime('now')), ('sales', 1, datetime('now')),
+                   ('suppliers', 1, datetime('now')), ('categories', 1, datetime('now'))
+            ''',
+        ],
+        mysql=[
+            '''
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name VARCHAR(64) PRIMARY KEY,
+                version BIGINT NOT NULL,
+                updated_at DATETIME NOT NULL
+            )
+            ''',
+            '''
+            INSERT IGNORE INTO table_versions (table_name, version, updated_at)
+            VALUES ('products', 1, UTC_TIMESTAMP()), ('sales', 1, UTC_TIMESTAMP()),
+                   ('suppliers', 1, UTC_TIMESTAMP()), ('categories', 1, UTC_TIMESTAMP())
+            ''',
+        ],
+        sqlite_down=["DROP TABLE IF EXISTS table_versions"],
+        mysql_down=["DROP TABLE IF EXISTS table_versions"],
+    ),
+    Migration(
+        version=5,
+        name="change log",
+        sqlite=[
+            '''
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id TEXT NOT NULL,
+                op TEXT NOT NULL,
+                changed_at TEXT NOT NULL
+            )
+            ''',
+        ] + [
+            # Existing rows become the starting point for a full sync from cursor 0
+            f"INSERT INTO change_log (table_name, row_id, op, changed_at) "
+            f"SELECT '{table}', id, 'upsert', datetime('now') FROM {table}"
+            for table in ("categories", "products", "suppliers", "sales")
+        ],
+        mysql=[
+            '''
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+                table_name VARCHAR(64) NOT NULL,
+                row_id VARCHAR(191) NOT NULL,
+                op VARCHAR(16) NOT NULL,
+                changed_at DATETIME NOT NULL
+            )
+            ''',
+        ] + [
+            f"INSERT INTO change_log (table_name, row_id, op, changed_at) "
+            f"SELECT '{table}', id, 'upsert', UTC_TIMESTAMP() FROM {table}"
+            for table in ("categories", "products", "suppliers", "sales")
+        ],
+        sqlite_down=["DROP TABLE IF EXISTS change_log"],
+        mysql_down=["DROP TABLE IF EXISTS change_log"],
+    ),
+    Migration(
+        version=6,
+        name="product search index",
+        sqlite=[
+            # External-content FTS5 table: only the index is stored, names stay in products
+            '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name,
+                content='products',
+                content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts (rowid, name) VALUES (new.rowid, new.name);
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+                INSERT INTO products_fts (rowid, name) VALUES (new.rowid, new.name);
+            END
+            ''',
+            "INSERT INTO products_fts (products_fts) VALUES ('rebuild')",
+        ],
+        mysql=["ALTER TABLE products ADD FULLTEXT INDEX ft_products_name (name)"],
+        sqlite_down=[
+            "DROP TRIGGER IF EXISTS products_fts_ai",
+            "DROP TRIGGER IF EXISTS products_fts_ad",
+            "DROP TRIGGER IF EXISTS products_fts_au",
+            "DROP TABLE IF EXISTS products_fts",
+        ],
+        mysql_down=["DROP INDEX ft_products_name ON products"],
+        # Without FTS5 or FULLTEXT, search uses the in-memory index
+        optional=True,
+    ),
+    Migration(
+        version=7,
+        name="product stock version",
+        # Bumped by every stock change, so a conditional decrement can tell it raced another one
+        sqlite=["ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 0"],
+        mysql=["ALTER TABLE products ADD COLUMN version BIGINT NOT NULL DEFAULT 0"],
+        sqlite_down=["ALTER TABLE products DROP COLUMN version"],
+        mysql_down=["ALTER TABLE products DROP COLUMN version"],
+    ),
+    Migration(
+        version=8,
+        name="idempotency keys",
+        # created_at is epoch seconds, purged once older than IDEMPOTENCY_TTL_HOURS
+        sqlite=[
+            '''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                idempotency_key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                content_type TEXT,
+                body BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+            ''',
+            "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys (created_at)",
+        ],
+        mysql=[
+            '''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                idempotency_key VARCHAR(255) PRIMARY KEY,
+                fingerprint CHAR(64) NOT NULL,
+                status SMALLINT NOT NULL,
+                content_type VARCHAR(255),
+                body LONGBLOB NOT NULL,
+                created_at DOUBLE NOT NULL,
+                INDEX idx_idempotency_keys_created_at (created_at)
+            )
+            ''',
+        ],
+        sqlite_down=["DROP TABLE IF EXISTS idempotency_keys"],
+        mysql_down=["DROP TABLE IF EXISTS idempotency_keys"],
+    ),
+    Migration(
+        version=9,
+        name="category listing index",
+        # (category, name) left ties on name to a sort step; the listing orders by name, id
+        sqlite=[_CATEGORY_NAME_ID[0], _CATEGORY_NAME[2]],
+        mysql=[_CATEGORY_NAME_ID[1], _CATEGORY_NAME[3]],
+        sqlite_down=[_CATEGORY_NAME[0], _CATEGORY_NAME_ID[2]],
+        mysql_down=[_CATEGORY_NAME[1], _CATEGORY_NAME_ID[3]],
+    ),
+    Migration(
+        version=10,
+        name="change log retention",
+        # change_log_horizon.seq is the newest pruned seq; a sync cursor below it has missed changes
+        sqlite=[
+            _CHANGE_LOG_CHANGED_AT[0],
+            '''
+            CREATE TABLE IF NOT EXISTS change_log_horizon (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                seq INTEGER NOT NULL
+            )
+            ''',
+            "INSERT OR IGNORE INTO change_log_horizon (id, seq) VALUES (1, 0)",
+        ],
+        mysql=[
+            _CHANGE_LOG_CHANGED_AT[1],
+            '''
+            CREATE TABLE IF NOT EXISTS change_log_horizon (
+                id INT PRIMARY KEY,
+                seq BIGINT NOT NULL
+            )
+            ''',
+            "INSERT IGNORE INTO change_log_horizon (id, seq) VALUES (1, 0)",
+        ],
+        sqlite_down=["DROP TABLE IF EXISTS change_log_horizon", _CHANGE_LOG_CHANGED_AT[2]],
+        mysql_down=["DROP TABLE IF EXISTS change_log_horizon", _CHANGE_LOG_CHANGED_AT[3]],
+    ),
+]
+
+
+def _param(engine: str, sql: str) -> str:
+    return sql.replace("?", "%s") if engine == "mysql" else sql
+
+
+def ensure_version_table(cursor, engine: str):
+    datetime_type = "TEXT" if engine == "sqlite" else "DATETIME"
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at {datetime_type} NOT NULL
+        )
+    ''')
+
+
+def current_version(cursor) -> int:
+    cursor.execute("SELECT MAX(version) FROM schema_migrations")
+    row = cursor.fetchone()
+    return row[0] or 0
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def _lock(conn, cursor, engine: str):
+    # Serialize concurrent workers starting up against the same database.
+    if engine == "mysql":
+        cursor.execute("SELECT GET_LOCK(%s, 60)", (MYSQL_LOCK_NAME,))
+        cursor.fetchone()
+    else:
+        conn.commit()
+        cursor.execute("BEGIN IMMEDIATE")
+
+
+def _unlock(conn, cursor, engine: str):
+    if engine == "mysql":
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MYSQL_LOCK_NAME,))
+        cursor.fetchone()
+    conn.commit()
+
+
+def _run(cursor, engine: str, migration: Migration, down: bool = False):
+    """Run the migration's statements; for an optional one, return the error instead of raising."""
+    if not migration.optional:
+        for statement in migration.statements(engine, down):
+            cursor.execute(statement)
+        return None
+    if engine == "sqlite":
+        cursor.execute("SAVEPOINT optional_migration")
+    try:
+        for statement in migration.statements(engine, down):
+            cursor.execute(statement)
+    except Exception as exc:
+        # MySQL DDL commits as it goes, but each optional migration there is a single statement
+        if engine == "sqlite":
+            cursor.execute("ROLLBACK TO optional_migration")
+            cursor.execute("RELEASE optional_migration")
+        logger.warning("Skipped optional migration %s (%s): %s", migration.version, migration.name, exc)
+        return exc
+    if engine == "sqlite":
+        cursor.execute("RELEASE optional_migration")
+    return None
+
+
+def migrate(conn, engine: str, target: int = None) -> List[int]:
+    """Bring the schema to ``target`` (default: latest).
+
+    Moving to a lower target runs the down statements of newer migrations.
+    Returns the versions that were applied or reverted, in execution order.
+    """
+    if target is None:
+        target = latest_version()
+    cursor = conn.cursor()
+    ensure_version_table(cursor, engine)
+    _lock(conn, cursor, engine)
+    applied = []
+    try:
+        version = current_version(cursor)
+        for migration in MIGRATIONS:
+            if version < migration.version <= target:
+                error = _run(cursor, engine, migration)
+                name = migration.name if error is None else f"{migration.name} (skipped: {error})"
+                cursor.execute(
+                    _param(engine, "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)"),
+                    (migration.version, name, datetime.now().isoformat()),
+                )
+                applied.append(migration.version)
+        for migration in reversed(MIGRATIONS):
+            if target < migration.version <= version:
+                _run(cursor, engine, migration, down=True)
+                cursor.execute(
+                    _param(engine, "DELETE FROM schema_migrations WHERE version = ?"),
+                    (migration.version,),
+                )
+                applied.append(migration.version)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _unlock(conn, cursor, engine)
+    return applied
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import main
+
+    parser = argparse.ArgumentParser(description="Apply or revert schema migrations")
+    parser.add_argument("--target", type=int, help="Schema version to move to (default: latest)")
+    args = parser.parse_args()
+
+    main.init_db()
+    conn = main.get_conn()
+    changed = migrate(conn, main.get_db_engine(), args.target)
+    cursor = conn.cursor()
+    print(f"Migrations run: {changed or 'none'}; schema version is now {current_version(cursor)}")
+    conn.close()
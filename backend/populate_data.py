@@ -1,128 +1,284 @@
+"""Deterministic synthetic data generator for demos and capacity testing.
+
+Generates a product catalog, suppliers and a sales history with realistic
+category mix, skewed product popularity and weekly/annual/intraday
+seasonality, then bulk loads it with batched ``executemany`` calls in
+chunked transactions. The same ``--seed`` always produces the same data.
+
+    python populate_data.py                                   # small demo store
+    python populate_data.py --skus 5000 --days 365 --sales-per-day 20000
+    python populate_data.py --stores 4 --skus 2000 --days 180 --sales-per-day 5000
+
+With ``--stores 1`` the configured database (``SQLITE_PATH`` / ``DB_NAME``) is
+filled. With more stores, store ``n`` goes to its own database, the one the API
+uses for ``X-Store-Id: n``: ``<path>_store<n>.db`` for SQLite, ``<DB_NAME>_store<n>``
+for MySQL (created if missing).
+"""
+import argparse
+import math
 import os
-import sqlite3
-import pymysql
-from datetime import datetime, timedelta
-import uuid
-
-def get_db_engine() -> str:
-    engine = os.getenv("DB_ENGINE", "").strip().lower()
-    if engine:
-        return engine
-    if os.getenv("DB_HOST"):
-        return "mysql"
-    return "sqlite"
-
-def get_mysql_config():
-    host = os.getenv("DB_HOST")
-    name = os.getenv("DB_NAME")
-    user = os.getenv("DB_USER")
-    password = os.getenv("DB_PASSWORD")
-    port = int(os.getenv("DB_PORT", "3306"))
-
-    if not all([host, name, user, password]):
-        raise RuntimeError(
-            "MySQL configuration missing. Set DB_HOST, DB_NAME, DB_USER, "
-            "DB_PASSWORD, and optional DB_PORT."
-        )
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+import rollups
+from archive import SalesArchive
+
+# name, share of SKUs, price range, annual amplitude, peak month, product names
+CATEGORIES = [
+    ("bread_and_bakery", 0.07, (8, 45), 0.05, 12, ["White Bread", "Brown Bread", "Rolls", "Muffins", "Rusks"]),
+    ("dairy_and_eggs", 0.08, (10, 60), 0.05, 7, ["Milk 1L", "Eggs (12 pack)", "Yoghurt", "Cheddar", "Butter"]),
+    ("fruits", 0.05, (5, 40), 0.30, 1, ["Apples", "Bananas", "Oranges", "Grapes", "Mangoes"]),
+    ("vegetables", 0.05, (5, 35), 0.15, 6, ["Potatoes", "Onions", "Tomatoes", "Spinach", "Carrots"]),
+    ("meat", 0.04, (40, 180), 0.25, 12, ["Beef Mince", "Boerewors", "Pork Chops", "Lamb Stew", "Steak"]),
+    ("poultry", 0.03, (35, 120), 0.10, 12, ["Chicken Portions", "Chicken Breasts", "Whole Chicken"]),
+    ("beverages", 0.06, (8, 40), 0.35, 1, ["Rooibos Tea", "Coffee", "Iced Tea", "Energy Drink"]),
+    ("soft_drinks", 0.07, (8, 30), 0.40, 1, ["Cola 2L", "Cold Drink 500ml", "Ginger Beer", "Cream Soda"]),
+    ("water", 0.03, (5, 25), 0.45, 1, ["Still Water 500ml", "Sparkling Water", "Water 5L"]),
+    ("juices", 0.04, (12, 45), 0.30, 1, ["Orange Juice", "Apple Juice", "Mango Juice"]),
+    ("alcohol", 0.04, (20, 250), 0.35, 12, ["Lager 6 pack", "Cider", "Red Wine", "Brandy"]),
+    ("snacks", 0.09, (5, 35), 0.15, 12, ["Chips (Small)", "Chips (Large)", "Biltong", "Popcorn", "Pretzels"]),
+    ("confectionery", 0.05, (3, 25), 0.20, 12, ["Gum", "Lollipops", "Jelly Sweets", "Toffees"]),
+    ("chocolates", 0.04, (8, 60), 0.30, 12, ["Milk Chocolate", "Dark Chocolate", "Chocolate Slab"]),
+    ("grains", 0.03, (15, 70), 0.05, 6, ["Maize Meal 2.5kg", "Flour 1kg", "Oats"]),
+    ("cereals", 0.03, (25, 80), 0.05, 6, ["Corn Flakes", "Muesli", "Bran Flakes"]),
+    ("rice_and_legumes", 0.04, (15, 60), 0.05, 6, ["Rice 2kg", "Lentils", "Beans", "Split Peas"]),
+    ("pasta_and_noodles", 0.03, (8, 35), 0.05, 6, ["Spaghetti", "Macaroni", "Instant Noodles"]),
+    ("oils_and_fats", 0.02, (25, 90), 0.05, 12, ["Cooking Oil 750ml", "Cooking Oil 2L", "Margarine"]),
+    ("condiments_and_sauces", 0.03, (10, 45), 0.10, 12, ["Tomato Sauce", "Chutney", "Mayonnaise", "Peri-Peri"]),
+    ("spices_and_herbs", 0.02, (8, 40), 0.05, 6, ["Curry Powder", "Salt", "Black Pepper", "Braai Spice"]),
+    ("canned_and_preserved", 0.03, (10, 40), 0.10, 6, ["Baked Beans", "Pilchards", "Chakalaka", "Jam"]),
+    ("frozen_foods", 0.02, (25, 120), 0.20, 1, ["Frozen Veg", "Fish Fingers", "Ice Cream 2L"]),
+    ("nuts_and_seeds", 0.01, (15, 80), 0.10, 12, ["Peanuts", "Cashews", "Trail Mix"]),
+    ("seafood", 0.01, (40, 200), 0.15, 4, ["Hake Fillets", "Prawns", "Calamari"]),
+    ("baby_food", 0.01, (20, 90), 0.02, 6, ["Baby Cereal", "Purees", "Formula"]),
+    ("health_and_specialty", 0.02, (20, 150), 0.10, 6, ["Vitamins", "Protein Bars", "Gluten-free Bread"]),
+]
+
+# Relative demand by weekday (Monday first) and by hour of day
+WEEKDAY_FACTORS = np.array([0.85, 0.85, 0.9, 0.95, 1.2, 1.35, 0.9])
+HOUR_WEIGHTS = np.array([
+    0, 0, 0, 0, 0, 0, 1, 4, 8, 6, 5, 6, 9, 8, 5, 5, 7, 10, 9, 5, 3, 1, 0, 0,
+], dtype=np.float64)
+# Month-end paydays lift spending
+PAYDAY_BOOST = 1.25
+
+SALE_INSERT = '''
+    INSERT INTO sales (id, product_id, product_name, quantity, price, total_price, date)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
 
-    return host, name, user, password, port
-
-def get_conn():
-    engine = get_db_engine()
-    if engine == "mysql":
-        host, name, user, password, port = get_mysql_config()
-        return pymysql.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=name,
-            port=port,
-            cursorclass=pymysql.cursors.Cursor,
-            autocommit=False,
+def row_id_prefix(store: int, kind: int) -> str:
+    # Ids are UUID-shaped and deterministic: store, row kind and sequence number
+    return f"{store:08x}-{kind:04x}-4000-8000-"
+
+
+def row_id(store: int, kind: int, seq: int) -> str:
+    return f"{row_id_prefix(store, kind)}{seq:012x}"
+
+
+def store_database(store: int, stores: int):
+    """Environment overrides that point ``main`` at one store's database,
+    the one the API serves for ``X-Store-Id: <store>``."""
+    if stores == 1:
+        return {}
+    if main.get_db_engine() == "mysql":
+        return {"DB_NAME": main.get_mysql_config(str(store))[1]}
+    return {"SQLITE_PATH": main.get_sqlite_path(str(store))}
+
+
+def generate_catalog(rng, store: int, skus: int, created_at: str):
+    shares = np.array([category[1] for category in CATEGORIES])
+    category_of = rng.choice(len(CATEGORIES), size=skus, p=shares / shares.sum())
+    # Zipf-like popularity: a few products sell far more than the long tail
+    popularity = 1.0 / np.arange(1, skus + 1) ** 1.1
+    rng.shuffle(popularity)
+
+    products = []
+    for sku in range(skus):
+        name, _, (low, high), _, _, stems = CATEGORIES[category_of[sku]]
+        # Shelf prices end in .99
+        price = round(max(round(float(rng.uniform(low, high))), 1) - 0.01, 2)
+        products.append((
+            row_id(store, 1, sku),
+            f"{stems[sku % len(stems)]} #{sku:05d}",
+            int(rng.integers(0, 400)),
+            price,
+            f"6{store:04d}{sku:08d}",
+            name,
+            created_at,
+        ))
+    return products, category_of, popularity / popularity.sum()
+
+
+def generate_suppliers(rng, store: int, count: int, created_at: str):
+    towns = ["Johannesburg CBD", "Sandton", "Pretoria", "Centurion", "Soweto", "Durban", "Cape Town"]
+    return [
+        (
+            row_id(store, 2, n),
+            f"Supplier {n:04d}",
+            f"08{int(rng.integers(10_000_000, 99_999_999))}",
+            towns[n % len(towns)],
+            f"orders{n}@supplier.example" if n % 3 else None,
+            f"Supplier {n:04d} (Pty) Ltd",
+            created_at,
         )
-    if engine == "sqlite":
-        return sqlite3.connect("estolo.db")
-    raise RuntimeError("Unsupported DB_ENGINE. Use 'sqlite' or 'mysql'.")
+        for n in range(count)
+    ]
+
+
+def day_multipliers(day: date, category_of):
+    """Expected demand on ``day`` relative to an average day, per product."""
+    annual = np.array([
+        1 + amplitude * math.cos(2 * math.pi * (day.month - peak) / 12)
+        for _, _, _, amplitude, peak, _ in CATEGORIES
+    ])
+    multiplier = WEEKDAY_FACTORS[day.weekday()]
+    if day.day >= 25 or day.day == 1:
+        multiplier *= PAYDAY_BOOST
+    return multiplier, annual[category_of]
 
-def get_paramstyle():
-    return "qmark" if get_db_engine() == "sqlite" else "format"
 
-def sql_params(sql: str) -> str:
-    if get_paramstyle() == "qmark":
-        return sql
-    return sql.replace("?", "%s")
+def generate_day(rng, day: date, products, category_of, popularity, sales_per_day, next_seq, store):
+    multiplier, product_factor = day_multipliers(day, category_of)
+    weights = popularity * product_factor
+    count = int(rng.poisson(sales_per_day * multiplier * float(weights.sum())))
+    if count == 0:
+        return []
+    chosen = rng.choice(len(products), size=count, p=weights / weights.sum())
+    quantities = 1 + rng.poisson(0.6, size=count)
+    seconds = np.sort(
+        rng.choice(24, size=count, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum()) * 3600
+        + rng.integers(0, 3600, size=count)
+    )
 
-def populate_sample_data():
-    conn = get_conn()
+    id_prefix = row_id_prefix(store, 3)
+    day_prefix = day.isoformat()
+    rows = []
+    for n, (index, quantity, second) in enumerate(zip(chosen.tolist(), quantities.tolist(), seconds.tolist())):
+        product_id, name, _, price, _, _, _ = products[index]
+        rows.append((
+            f"{id_prefix}{next_seq + n:012x}",
+            product_id,
+            name,
+            quantity,
+            price,
+            round(price * quantity, 2),
+            f"{day_prefix}T{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}",
+        ))
+    return rows
+
+
+def insert_chunk(conn, sql, rows, table, changed_at):
     cursor = conn.cursor()
-    
-    # Sample products
-    products = [
-        ('Bread', 25, 12.50, '6001234567890', 'Bakery'),
-        ('Milk 1L', 18, 18.90, '6001234567891', 'Dairy'),
-        ('Eggs (12 pack)', 12, 25.00, '6001234567892', 'Dairy'),
-        ('Sugar 1kg', 30, 15.50, '6001234567893', 'Grocery'),
-        ('Cooking Oil 750ml', 8, 32.00, '6001234567894', 'Grocery'),
-        ('Rice 2kg', 15, 28.90, '6001234567895', 'Grocery'),
-        ('Soap Bar', 45, 8.50, '6001234567896', 'Household'),
-        ('Toothpaste', 22, 19.90, '6001234567897', 'Health'),
-        ('Chips (Small)', 35, 12.00, '6001234567898', 'Snacks'),
-        ('Cold Drink 500ml', 28, 15.00, '6001234567899', 'Beverages')
-    ]
-    
-    # Insert products
-    for name, stock, price, barcode, category in products:
-        product_id = str(uuid.uuid4())
-        created_at = (datetime.now() - timedelta(days=10)).isoformat()
-        sql = sql_params('''
-            INSERT INTO products (id, name, stock, price, barcode, category, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''')
-        cursor.execute(sql, (product_id, name, stock, price, barcode, category, created_at))
-    
-    # Sample suppliers
-    suppliers = [
-        ('Fresh Foods Distributors', '0821234567', 'Johannesburg CBD', 'orders@freshfoods.co.za', 'Fresh Foods Distributors'),
-        ('Dairy Direct', '0839876543', 'Sandton', 'info@dairydirect.co.za', 'Dairy Direct Suppliers'),
-        ('Bakery Supply Co', '0845551234', 'Pretoria', None, 'Bakery Supply Company'),
-        ('General Grocers Ltd', '0817778888', 'Centurion', 'sales@grocers.co.za', 'General Grocers Ltd'),
-        ('Township Supplies', '0791112233', 'Soweto', None, 'Township Supplies Network')
-    ]
-    
-    # Insert suppliers
-    for name, phone, location, email, business_name in suppliers:
-        supplier_id = str(uuid.uuid4())
-        created_at = (datetime.now() - timedelta(days=30)).isoformat()
-        sql = sql_params('''
-            INSERT INTO suppliers (id, name, phone, location, email, business_name, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''')
-        cursor.execute(sql, (supplier_id, name, phone, location, email, business_name, created_at))
-    
-    # Sample sales data for the past week
-    cursor.execute("SELECT id, name, price FROM products")
-    product_data = cursor.fetchall()
-    
-    if product_data:
-        # Generate some sample sales
-        import random
-        for i in range(15):  # 15 sample sales
-            product = random.choice(product_data)
-            product_id, product_name, price = product
-            quantity = random.randint(1, 5)
-            total_price = price * quantity
-            sale_date = (datetime.now() - timedelta(days=random.randint(0, 6))).isoformat()
-            sale_id = str(uuid.uuid4())
-            
-            sql = sql_params('''
-                INSERT INTO sales (id, product_id, product_name, quantity, price, total_price, date)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''')
-            cursor.execute(sql, (sale_id, product_id, product_name, quantity, price, total_price, sale_date))
-    
+    cursor.executemany(main.sql_params(sql), rows)
+    # Sync clients see generated rows like any other change. Generated ids
+    # increase monotonically, so the chunk is one primary key range.
+    cursor.execute(
+        main.sql_params(f'''
+            INSERT INTO change_log (table_name, row_id, op, changed_at)
+            SELECT '{table}', id, 'upsert', ? FROM {table} WHERE id BETWEEN ? AND ? ORDER BY id
+        '''),
+        (changed_at, rows[0][0], rows[-1][0]),
+    )
     conn.commit()
+
+
+def populate_store(store: int, args):
+    rng = np.random.default_rng([args.seed, store])
+    engine = main.get_db_engine()
+    main.init_db()
+    main.close_pool()
+
+    conn = main.open_connection()
+    cursor = conn.cursor()
+    if engine == "sqlite":
+        # A half-written load is simply regenerated, so skip fsyncs
+        cursor.execute("PRAGMA synchronous = OFF")
+    now = datetime.now()
+    changed_at = main.db_timestamp(datetime.now(timezone.utc))
+    # Complete days only: history ends yesterday
+    first_day = now.date() - timedelta(days=args.days)
+    created_at = datetime.combine(first_day, datetime.min.time()).isoformat()
+
+    products, category_of, popularity = generate_catalog(rng, store, args.skus, created_at)
+    insert_chunk(conn, '''
+        INSERT INTO products (id, name, stock, price, barcode, category, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', products, "products", changed_at)
+    insert_chunk(conn, '''
+        INSERT INTO suppliers (id, name, phone, location, email, business_name, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', generate_suppliers(rng, store, args.suppliers, created_at), "suppliers", changed_at)
+
+    started = time.perf_counter()
+    total = 0
+    pending = []
+    for offset in range(args.days):
+        day = first_day + timedelta(days=offset)
+        pending.extend(generate_day(
+            rng, day, products, category_of, popularity, args.sales_per_day, total + len(pending), store,
+        ))
+        while len(pending) >= args.chunk:
+            insert_chunk(conn, SALE_INSERT, pending[:args.chunk], "sales", changed_at)
+            total += args.chunk
+            del pending[:args.chunk]
+        if not args.quiet and (offset + 1) % 30 == 0:
+            elapsed = time.perf_counter() - started
+            generated = total + len(pending)
+            print(f"store {store}: {offset + 1}/{args.days} days, {generated:,} sales "
+                  f"({generated / elapsed:,.0f} rows/s)", flush=True)
+    if pending:
+        insert_chunk(conn, SALE_INSERT, pending, "sales", changed_at)
+        total += len(pending)
+
+    cursor.executemany(
+        main.sql_params('UPDATE table_versions SET version = version + 1, updated_at = ? WHERE table_name = ?'),
+        [(changed_at, table) for table in ("products", "suppliers", "sales")],
+    )
+    conn.commit()
+    # The API serves store n's archive from its own directory, as it does its database
+    archive = SalesArchive(main.get_sales_archive_dir(str(store) if args.stores > 1 else None))
+    rollups.rebuild(conn, engine, archive)
     conn.close()
-    print("Sample data populated successfully!")
+    return len(products), total, time.perf_counter() - started
+
+
+def populate(args):
+    original = dict(os.environ)
+    for store in range(1, args.stores + 1):
+        if args.stores > 1 and main.get_db_engine() == "mysql":
+            main.create_mysql_database(str(store))
+        os.environ.update(store_database(store, args.stores))
+        try:
+            skus, sales, elapsed = populate_store(store, args)
+        finally:
+            os.environ.clear()
+            os.environ.update(original)
+        location = store_database(store, args.stores) or {"database": "configured database"}
+        print(f"store {store}: {skus:,} products and {sales:,} sales in {elapsed:.1f}s "
+              f"-> {next(iter(location.values()))}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stores", type=int, default=1, help="Stores to generate (one database each)")
+    parser.add_argument("--skus", type=int, default=200, help="Products per store")
+    parser.add_argument("--suppliers", type=int, default=10, help="Suppliers per store")
+    parser.add_argument("--days", type=int, default=30, help="Days of sales history, ending yesterday")
+    parser.add_argument("--sales-per-day", type=float, default=150,
+                        help="Average sales per store per day (before seasonality)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--chunk", type=int, default=50_000, help="Rows per transaction")
+    parser.add_argument("--quiet", action="store_true", help="Only print the per-store summary")
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
-    populate_sample_data()
+    populate(parse_args())
@@ -0,0 +1,181 @@
+"""Typeahead product search: query parsing, full-text query builders and an
+in-memory prefix index used when the database has no usable text index."""
+import bisect
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_MAX_CHAR = "\U0010ffff"
+# Ordinals of removed products tolerated (beyond one per live product) before they are compacted away
+_COMPACT_AFTER = 1024
+
+
+def tokenize(text: str):
+    """Lowercased, accent-folded word tokens (matches FTS5 ``unicode61 remove_diacritics 2``)."""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return _TOKEN.findall(folded)
+
+
+def fts5_query(tokens) -> str:
+    # Every token must match as a prefix of some word in the name
+    return " AND ".join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+
+def mysql_boolean_query(tokens) -> str:
+    return " ".join(f"+{token}*" for token in tokens)
+
+
+def like_prefix(text: str) -> str:
+    """A LIKE pattern for values starting with ``text``, for use with ``ESCAPE '\\'``."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class ProductSearchIndex:
+    """In-memory prefix index over product name tokens.
+
+    A flattened trie: name tokens are kept in one sorted array, so the words
+    under a prefix are a contiguous range found with two binary searches.
+    Parallel NumPy arrays hold each token's product and whether it is the
+    first word of the name, and every product has a precomputed rank by
+    (name length, name), so even a one-letter prefix matching most of the
+    catalog is filtered and ranked with a few vector operations.
+    Writers swap in new arrays under a lock, readers never lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._swap(np.zeros(0, "U1"), np.zeros(0, np.int32), np.zeros(0, bool), [], np.zeros(0), {})
+
+    def _swap(self, tokens, ords, first, ids, order, ord_of):
+        # One tuple so readers always see a consistent snapshot
+        self._state = (tokens, ords, first, ids, order, ord_of)
+
+    def __len__(self):
+        return len(self._state[-1])
+
+    @staticmethod
+    def _entries(ordinal: int, name: str):
+        words = tokenize(name)
+        return sorted({(token, ordinal, token == words[0]) for token in words})
+
+    def load(self, products):
+        ids, keys, entries = [], [], []
+        for product_id, name in products:
+            ordinal = len(ids)
+            ids.append(product_id)
+            keys.append((len(name), name, ordinal))
+            entries.extend(self._entries(ordinal, name))
+        entries.sort()
+        keys.sort()
+        order = np.empty(len(ids))
+        order[[ordinal for _, _, ordinal in keys]] = np.arange(len(ids))
+        with self._lock:
+            self._keys = [(length, name) for length, name, _ in keys]
+            self._swap(
+                np.array([token for token, _, _ in entries], dtype=str) if entries else np.zeros(0, "U1"),
+                np.fromiter((ordinal for _, ordinal, _ in entries), np.int32, len(entries)),
+                np.fromiter((is_first for _, _, is_first in entries), bool, len(entries)),
+                ids,
+                order,
+                {product_id: ordinal for ordinal, product_id in enumerate(ids)},
+            )
+
+    def _without(self, state, product_id):
+        tokens, ords, first, ids, order, ord_of = state
+        ordinal = ord_of.get(product_id)
+        if ordinal is None:
+            return state
+        keep = ords != ordinal
+        ord_of = dict(ord_of)
+        del ord_of[product_id]
+        return tokens[keep], ords[keep], first[keep], ids, order, ord_of
+
+    @staticmethod
+    def _compacted(state):
+        tokens, ords, first, ids, order, ord_of = state
+        if len(ids) - len(ord_of) <= max(_COMPACT_AFTER, len(ord_of)):
+            return state
+        # Renumber the live ordinals into new arrays; older snapshots keep theirs
+        live = np.array(sorted(ord_of.values()), dtype=np.intp)
+        renumber = np.zeros(len(ids), np.int32)
+        renumber[live] = np.arange(len(live), dtype=np.int32)
+        return (
+            tokens,
+            renumber[ords],
+            first,
+            [ids[ordinal] for ordinal in live.tolist()],
+            order[live],
+            {product_id: int(renumber[ordinal]) for product_id, ordinal in ord_of.items()},
+        )
+
+    def put(self, product_id: str, name: str):
+        with self._lock:
+            ordinal = self._state[-1].get(product_id)
+            tokens, ords, first, ids, order, ord_of = self._without(self._state, product_id)
+            # Rank between its neighbours in the order loaded at startup
+            rank = bisect.bisect_left(self._keys, (len(name), name)) - 0.5
+            if ordinal is None:
+                # ids is only ever appended to, so older snapshots stay valid
+                ordinal = len(ids)
+                ids.append(product_id)
+                order = np.append(order, rank)
+            else:
+                # A renamed product keeps its ordinal, re-ranked in a copy
+                order = order.copy()
+                order[ordinal] = rank
+            ord_of = {**ord_of, product_id: ordinal}
+            entries = self._entries(ordinal, name)
+            if entries:
+                new_tokens = np.array([token for token, _, _ in entries], dtype=str)
+                if new_tokens.dtype.itemsize > tokens.dtype.itemsize:
+                    tokens = tokens.astype(new_tokens.dtype)
+                positions = np.searchsorted(tokens, new_tokens)
+                tokens = np.insert(tokens, positions, new_tokens)
+                ords = np.insert(ords, positions, ordinal)
+                first = np.insert(first, positions, [is_first for _, _, is_first in entries])
+            self._swap(*self._compacted((tokens, ords, first, ids, order, ord_of)))
+
+    def remove(self, product_id: str):
+        with self._lock:
+            self._swap(*self._compacted(self._without(self._state, product_id)))
+
+    @staticmethod
+    def _prefix_range(tokens, prefix: str):
+        start, end = np.searchsorted(tokens, [prefix, prefix + _MAX_CHAR])
+        return int(start), int(end)
+
+    def search(self, query: str, limit: int):
+        """Ids of products with a name word starting with every query token, best first.
+
+        Names whose first word starts with the first token come first, then
+        shorter names, then by name: the order the SQL search backends use.
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+        tokens, ords, first, ids, order, _ = self._state
+
+        start, end = self._prefix_range(tokens, query_tokens[0])
+        matched = np.zeros(len(order), bool)
+        matched[ords[start:end]] = True
+        starts = np.zeros(len(order), bool)
+        starts[ords[start:end][first[start:end]]] = True
+        for token in query_tokens[1:]:
+            start, end = self._prefix_range(tokens, token)
+            also = np.zeros(len(order), bool)
+            also[ords[start:end]] = True
+            matched &= also
+        candidates = np.flatnonzero(matched)
+
+        score = np.where(starts[candidates], 0, len(order)) + order[candidates]
+        if len(candidates) > limit:
+            best = np.argpartition(score, limit)[:limit]
+            candidates, score = candidates[best], score[best]
+        return [ids[ordinal] for ordinal in candidates[np.argsort(score, kind="stable")].tolist()]
@@ -0,0 +1,124 @@
+"""Incrementally maintained per-product daily sales rollups.
+
+``daily_sales`` holds one row per (product_id, day) with the quantity sold,
+revenue and number of sales. The sale routes apply deltas in the same
+transaction as the sale itself, and analytics read the rollups instead of
+scanning ``sales``. ``rebuild()`` recomputes them from scratch, including
+sales moved to the archive:
+
+    python rollups.py                    # rebuild everything
+    python rollups.py --since 2026-01-01 # rebuild from a day onwards
+"""
+from typing import Dict, Tuple
+
+
+def sale_day(date) -> str:
+    # Sale dates are ISO strings (SQLite) or datetimes (MySQL); both start YYYY-MM-DD
+    if hasattr(date, "date"):
+        return date.date().isoformat()
+    return str(date)[:10]
+
+
+def _upsert_sql(engine: str) -> str:
+    if engine == "mysql":
+        return '''
+            INSERT INTO daily_sales (product_id, day, quantity, revenue, transactions)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                quantity = quantity + VALUES(quantity),
+                revenue = revenue + VALUES(revenue),
+                transactions = transactions + VALUES(transactions)
+        '''
+    return '''
+        INSERT INTO daily_sales (product_id, day, quantity, revenue, transactions)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(product_id, day) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue,
+            transactions = transactions + excluded.transactions
+    '''
+
+
+class RollupDelta:
+    """Accumulates rollup changes for one transaction and applies them in bulk."""
+
+    def __init__(self):
+        self._deltas: Dict[Tuple[str, str], list] = {}
+
+    def add(self, product_id: str, date, quantity: int, revenue: float, sign: int = 1):
+        key = (product_id, sale_day(date))
+        delta = self._deltas.setdefault(key, [0, 0.0, 0])
+        delta[0] += sign * quantity
+        delta[1] += sign * revenue
+        delta[2] += sign
+
+    def apply(self, cursor, engine: str):
+        rows = [
+            (product_id, day, quantity, revenue, transactions)
+            for (product_id, day), (quantity, revenue, transactions) in self._deltas.items()
+            if transactions or quantity or revenue
+        ]
+        if not rows:
+            return
+        cursor.executemany(_upsert_sql(engine), rows)
+        emptied = [(product_id, day) for product_id, day, _, _, transactions in rows if transactions < 0]
+        if emptied:
+            placeholder = "%s" if engine == "mysql" else "?"
+            cursor.executemany(
+                f"DELETE FROM daily_sales WHERE product_id = {placeholder} "
+                f"AND day = {placeholder} AND transactions <= 0",
+                emptied,
+            )
+
+
+def rebuild(conn, engine: str, archive, since: str = None):
+    """Recompute rollups from ``sales`` and ``archive`` (optionally only for days >= ``since``).
+
+    ``archive`` is the store's ``SalesArchive``. It is required because
+    archived sales are no longer in ``sales``, and their totals would be lost.
+    """
+    day_expr = "DATE(date)" if engine == "mysql" else "substr(date, 1, 10)"
+    placeholder = "%s" if engine == "mysql" else "?"
+    cursor = conn.cursor()
+    try:
+        if since:
+            cursor.execute(f"DELETE FROM daily_sales WHERE day >= {placeholder}", (since,))
+            cursor.execute(f'''
+                INSERT INTO daily_sales (product_id, day, quantity, revenue, transactions)
+                SELECT product_id, {day_expr}, SUM(quantity), SUM(total_price), COUNT(*)
+                FROM sales
+                WHERE date >= {placeholder}
+                GROUP BY product_id, {day_expr}
+            ''', (since,))
+        else:
+            cursor.execute("DELETE FROM daily_sales")
+            cursor.execute(f'''
+                INSERT INTO daily_sales (product_id, day, quantity, revenue, transactions)
+                SELECT product_id, {day_expr}, SUM(quantity), SUM(total_price), COUNT(*)
+                FROM sales
+                GROUP BY product_id, {day_expr}
+            ''')
+        # Added on top: a day can have both archived sales and late-synced ones in the table
+        cursor.executemany(_upsert_sql(engine), archive.daily_totals(since))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    cursor.execute("SELECT COUNT(*) FROM daily_sales")
+    return cursor.fetchone()[0]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import main
+
+    parser = argparse.ArgumentParser(description="Rebuild the daily_sales rollups")
+    parser.add_argument("--since", help="Only rebuild days on or after this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    main.init_db()
+    conn = main.get_conn()
+    rows = rebuild(conn, main.get_db_engine(), main.get_store_db().archive, args.since)
+    conn.close()
+    print(f"daily_sales rebuilt: {rows} rows")
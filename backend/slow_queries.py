@@ -0,0 +1,89 @@
+"""Opt-in slow-query recorder.
+
+Statements slower than a threshold are kept, with their parameter shape
+(types only, never values), duration and the engine's query plan, in a
+bounded ring buffer that the admin endpoint reads.
+"""
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from metrics import normalize_sql
+
+logger = logging.getLogger("estolo.slow_queries")
+
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+
+def params_shape(params, many: bool):
+    def shape(row):
+        if row is None:
+            return []
+        if isinstance(row, dict):
+            return {key: type(value).__name__ for key, value in row.items()}
+        return [type(value).__name__ for value in row]
+
+    if many:
+        rows = params if isinstance(params, (list, tuple)) else list(params)
+        return {"rows": len(rows), "row": shape(rows[0]) if rows else []}
+    return shape(params)
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, engine: str, capacity: int = 200, explain: bool = True):
+        self.threshold = threshold_ms / 1000
+        self.engine = engine
+        self.explain = explain
+        self._entries = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def _plan(self, cursor, sql: str, params):
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        connection = getattr(cursor, "connection", None)
+        # An unbuffered MySQL result still being read blocks the connection
+        if connection is None or type(cursor).__name__ in ("SSCursor", "SSDictCursor"):
+            return None
+        prefix = "EXPLAIN QUERY PLAN " if self.engine == "sqlite" else "EXPLAIN "
+        try:
+            explain_cursor = connection.cursor()
+            explain_cursor.execute(prefix + sql, params if params is not None else ())
+            columns = [column[0] for column in explain_cursor.description or ()]
+            rows = explain_cursor.fetchall()
+            explain_cursor.close()
+        except Exception as exc:
+            return {"error": str(exc)}
+        if self.engine == "sqlite":
+            # (id, parent, notused, detail): keep the readable detail lines
+            return [row[-1] for row in rows]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def record(self, cursor, sql: str, params, seconds: float, many: bool = False):
+        plan_params = params
+        if many:
+            rows = list(params) if not isinstance(params, (list, tuple)) else params
+            plan_params = rows[0] if rows else None
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(seconds * 1000, 3),
+            "statement": normalize_sql(sql),
+            "params": params_shape(params, many),
+            "executemany": many,
+            "plan": self._plan(cursor, sql, plan_params) if self.explain else None,
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+        logger.warning("Slow query (%.1f ms): %s", entry["duration_ms"], entry["statement"])
+
+    def entries(self, limit: int = None):
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
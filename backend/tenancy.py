@@ -0,0 +1,191 @@
+"""Per-request store (tenant) selection.
+
+``StoreMiddleware`` reads the store id from the ``X-Store-Id`` header into
+``current_store``, which the database layer uses to pick that store's
+database. ``StoreCache`` keeps the per-store resources (pools, writer,
+in-memory indexes) of the most recently used stores open.
+"""
+import re
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+
+import anyio
+import anyio.to_thread
+
+STORE_HEADER = b"x-store-id"
+STORE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_]{1,32}$")
+
+# None is the default store: the configured database itself
+current_store: ContextVar[Optional[str]] = ContextVar("current_store", default=None)
+
+# (cache, store, entry) the current request has taken from a StoreCache; StoreMiddleware releases them
+store_leases: ContextVar[Optional[list]] = ContextVar("store_leases", default=None)
+
+
+def _close(entries):
+    for entry in entries:
+        entry.close()
+
+
+class StoreCache:
+    """LRU cache of per-store resources.
+
+    ``create(store)`` builds a store's entry on first use; once more than
+    ``capacity`` stores are open the least recently used one is dropped and
+    ``close()`` is called on it. The default store is never evicted.
+
+    Inside a ``StoreMiddleware`` request, ``get`` leases the entry to the
+    request and keeps returning it for the rest of the request. An entry
+    evicted while leased is only closed once the last request using it has
+    finished.
+    """
+
+    def __init__(self, create, capacity: int = 32):
+        self._create = create
+        self.capacity = max(1, capacity)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._users = {}
+        self._retired = set()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, store: Optional[str]):
+        leases = store_leases.get()
+        if leases:
+            for cache, key, leased in leases:
+                if cache is self and key == store:
+                    return leased
+        with self._lock:
+            entry = self._entries.get(store)
+            if entry is not None:
+                self._entries.move_to_end(store)
+                self._lease(store, entry, leases)
+                return entry
+        entry = self._create(store)
+        evicted = []
+        with self._lock:
+            existing = self._entries.get(store)
+            if existing is not None:
+                # Another thread created it first
+                evicted.append(entry)
+                entry = existing
+            else:
+                self._entries[store] = entry
+            self._entries.move_to_end(store)
+            self._lease(store, entry, leases)
+            while len(self._entries) > self.capacity:
+                victim = next((key for key in self._entries if key is not None), None)
+                if victim is None:
+                    break
+                stale = self._entries.pop(victim)
+                self.evictions += 1
+                if stale in self._users:
+                    # Still in use; closed by the last release()
+                    self._retired.add(stale)
+                else:
+                    evicted.append(stale)
+        # Closing can block (a writer drains its queue), so do it outside the lock
+        _close(evicted)
+        return entry
+
+    def _lease(self, store, entry, leases):
+        # Outside a request nothing is leased
+        if leases is None:
+            return
+        leases.append((self, store, entry))
+        self._users[entry] = self._users.get(entry, 0) + 1
+
+    def release(self, entry) -> bool:
+        """End a lease; True if ``entry`` was evicted meanwhile and the caller must now close it."""
+        with self._lock:
+            users = self._users.get(entry, 0) - 1
+            if users > 0:
+                self._users[entry] = users
+                return False
+            self._users.pop(entry, None)
+            if entry in self._retired:
+                self._retired.discard(entry)
+                return True
+            return False
+
+    def peek(self, store: Optional[str]):
+        """The cached entry for ``store`` or None, without creating it."""
+        return self._entries.get(store)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries.items())
+
+    def close(self):
+        with self._lock:
+            entries = list(self._entries.values()) + list(self._retired)
+            self._entries.clear()
+            self._retired.clear()
+        _close(entries)
+
+
+class StoreMiddleware:
+    """Pure ASGI middleware that scopes each request to its ``X-Store-Id`` store.
+
+    Only ids in ``allowed`` are served, since the first request to a store
+    creates its database. With ``auto_create`` and no ``allowed`` list, any
+    valid id is served and provisioned on first use.
+    """
+
+    def __init__(self, app, allowed=None, auto_create: bool = False):
+        self.app = app
+        self.allowed = set(allowed) if allowed else None
+        self.auto_create = auto_create
+
+    def serves(self, store: str) -> bool:
+        if self.allowed is not None:
+            return store in self.allowed
+        return self.auto_create
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        store = None
+        for name, value in scope["headers"]:
+            if name == STORE_HEADER:
+                store = value.decode("latin-1").strip() or None
+                break
+        if store is not None:
+            error = None
+            if not STORE_ID_PATTERN.match(store):
+                error = (400, b'{"detail":"Invalid X-Store-Id"}')
+            elif not self.serves(store):
+                error = (404, b'{"detail":"Unknown store"}')
+            if error is not None and scope["type"] == "http":
+                status, body = error
+                await send({
+                    "type": "http.response.start",
+                    "status": status,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+            if error is not None:
+                await send({"type": "websocket.close", "code": 1008})
+                return
+
+        token = current_store.set(store)
+        leases = []
+        leases_token = store_leases.set(leases)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            store_leases.reset(leases_token)
+            current_store.reset(token)
+            stale = [entry for cache, _, entry in leases if cache.release(entry)]
+            if stale:
+                # Evicted during the request; closing blocks, and must happen even if it was cancelled
+                with anyio.CancelScope(shield=True):
+                    await anyio.to_thread.run_sync(_close, stale)
@@ -0,0 +1,44 @@
+"""Archiving sales must not look like deleting them to /api/sync clients.
+
+    python -m pytest -q test_archive.py
+"""
+from datetime import date
+
+import archive
+
+
+def sale_body(sale_id: str, day: str) -> dict:
+    return {
+        "id": sale_id,
+        "product_id": "prod-001",
+        "product_name": "Apples",
+        "quantity": 1,
+        "price": 2.5,
+        "total_price": 2.5,
+        "date": f"{day}T10:00:00",
+    }
+
+
+def test_archived_month_sends_no_sync_tombstones(main, client):
+    product = {
+        "id": "prod-001", "name": "Apples", "stock": 100, "price": 2.5,
+        "barcode": None, "category": "fruit", "created_at": "2024-01-01T00:00:00",
+    }
+    assert client.post("/api/products", json=product).status_code == 200
+    for sale_id, day in (("old-1", "2024-01-05"), ("old-2", "2024-01-20"), ("recent", "2026-10-01")):
+        assert client.post("/api/sales", json=sale_body(sale_id, day)).status_code == 200
+    cursor = client.get("/api/sync", params={"since": 0}).json()["cursor"]
+
+    assert archive.archive_sales(main, 365, today=date(2026, 10, 17)) == {"2024-01": 2}
+
+    # Neither a full sync nor an incremental one reports the archived month as deleted
+    full = client.get("/api/sync", params={"since": 0}).json()["changes"]["sales"]
+    assert full["deletes"] == []
+    assert [row["id"] for row in full["upserts"]] == ["recent"]
+    incremental = client.get("/api/sync", params={"since": cursor}).json()["changes"]["sales"]
+    assert incremental == {"upserts": [], "deletes": []}
+
+    # Real deletions are still tombstoned
+    assert client.delete("/api/sales/recent").status_code == 200
+    after = client.get("/api/sync", params={"since": cursor}).json()["changes"]["sales"]
+    assert after["deletes"] == ["recent"]
@@ -0,0 +1,53 @@
+"""The in-memory barcode index must agree with the products table.
+
+    python -m pytest -q test_barcode_index.py
+"""
+from barcode_index import BarcodeIndex
+
+PRODUCT = {
+    "id": "prod-001", "name": "Apples", "stock": 10, "price": 2.5,
+    "barcode": "600100", "category": None, "created_at": "2026-01-01T00:00:00",
+}
+
+
+def product_row(client, product_id):
+    rows = client.get("/api/products").json()
+    return next(row for row in rows if row["id"] == product_id)
+
+
+def test_scan_matches_database_after_edit_and_sales(client):
+    assert client.post("/api/products", json=PRODUCT).status_code == 200
+    assert client.get("/api/products/by-barcode/600100").json()["stock"] == 10
+
+    edited = {**PRODUCT, "name": "Green Apples", "stock": 20}
+    assert client.put("/api/products/prod-001", json=edited).status_code == 200
+    sale = {
+        "id": "sale-1", "product_id": "prod-001", "product_name": "Green Apples", "quantity": 3,
+        "price": 2.5, "total_price": 7.5, "date": "2026-10-01T10:00:00",
+    }
+    assert client.post("/api/sales", json=sale).status_code == 200
+    assert client.put("/api/sales/sale-1", json={**sale, "quantity": 5, "total_price": 12.5}).status_code == 200
+    checkout = {"id": "basket-1", "date": "2026-10-01T11:00:00", "lines": [{"product_id": "prod-001", "quantity": 2}]}
+    assert client.post("/api/checkout", json=checkout).status_code == 200
+    assert client.delete("/api/sales/sale-1").status_code == 200
+
+    scanned = client.get("/api/products/by-barcode/600100").json()
+    assert scanned == product_row(client, "prod-001")
+    assert scanned["name"] == "Green Apples" and scanned["stock"] == 18
+
+
+def test_out_of_order_updates_keep_the_newest_version():
+    index = BarcodeIndex()
+    index.put(PRODUCT, 1)
+
+    # A sale committed version 3 and reported first; the edit that committed 2 arrives late
+    index.set_stock("prod-001", 7, 2)
+    index.put({**PRODUCT, "stock": 7}, 3)
+    index.put({**PRODUCT, "name": "Stale", "stock": 10}, 2)
+    index.set_stock("prod-001", 9, 2)
+    assert index.get("600100")["name"] == "Apples"
+    assert index.get("600100")["stock"] == 7
+
+    # A stock change that skips a version leaves the entry to be reloaded
+    index.set_stock("prod-001", 4, 5)
+    assert index.get("600100") is None
@@ -0,0 +1,34 @@
+"""Conditional GETs on the list routes.
+
+    python -m pytest -q test_conditional_get.py
+"""
+import pytest
+
+
+@pytest.mark.parametrize("if_none_match", [
+    "{etag}",
+    "{strong}",
+    '"other", {strong}',
+    'W/"other" ,{etag}',
+    "*",
+])
+def test_matching_validators_get_304(client, if_none_match):
+    etag = client.get("/api/products").headers["ETag"]
+    assert etag.startswith('W/"')
+    header = if_none_match.format(etag=etag, strong=etag[2:])
+    response = client.get("/api/products", headers={"If-None-Match": header})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_changed_table_gets_the_rows(client):
+    etag = client.get("/api/products").headers["ETag"]
+    assert client.get("/api/products", headers={"If-None-Match": '"other"'}).status_code == 200
+    product = {
+        "id": "prod-001", "name": "Apples", "stock": 1, "price": 1.0,
+        "barcode": None, "category": None, "created_at": "2026-01-01T00:00:00",
+    }
+    assert client.post("/api/products", json=product).status_code == 200
+    response = client.get("/api/products", headers={"If-None-Match": etag[2:]})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
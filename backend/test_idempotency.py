@@ -0,0 +1,106 @@
+"""Idempotency-Key replays, conflicts and in-flight retries.
+
+    python -m pytest -q test_idempotency.py
+"""
+import asyncio
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from idempotency import IdempotencyKeys, IdempotencyMiddleware
+
+PRODUCT = {
+    "id": "prod-001", "name": "Apples", "stock": 10, "price": 2.5,
+    "barcode": None, "category": None, "created_at": "2026-01-01T00:00:00",
+}
+
+
+def sale_body(sale_id: str, quantity: int) -> dict:
+    return {
+        "id": sale_id, "product_id": "prod-001", "product_name": "Apples", "quantity": quantity,
+        "price": 2.5, "total_price": 2.5 * quantity, "date": "2026-10-01T10:00:00",
+    }
+
+
+def stock(client) -> int:
+    return next(row["stock"] for row in client.get("/api/products").json() if row["id"] == "prod-001")
+
+
+def test_retry_replays_the_first_response(main, client):
+    assert client.post("/api/products", json=PRODUCT).status_code == 200
+    headers = {"Idempotency-Key": "sale-retry"}
+
+    first = client.post("/api/sales", json=sale_body("sale-1", 3), headers=headers)
+    retry = client.post("/api/sales", json=sale_body("sale-1", 3), headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.content == first.content
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert stock(client) == 7
+
+    # Another worker, or this one after a restart, answers from the table
+    main.idempotency_keys._entries.clear()
+    again = client.post("/api/sales", json=sale_body("sale-1", 3), headers=headers)
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.content == first.content
+    assert stock(client) == 7
+    assert len(client.get("/api/sales").json()) == 1
+
+
+def test_key_reused_for_another_request_is_rejected(client):
+    assert client.post("/api/products", json=PRODUCT).status_code == 200
+    headers = {"Idempotency-Key": "sale-reused"}
+    assert client.post("/api/sales", json=sale_body("sale-1", 1), headers=headers).status_code == 200
+
+    reused = client.post("/api/sales", json=sale_body("sale-2", 1), headers=headers)
+    assert reused.status_code == 422
+    assert stock(client) == 9
+
+    assert client.post("/api/sales", json=sale_body("sale-3", 1), headers={"Idempotency-Key": ""}).status_code == 400
+
+
+def test_failed_request_is_not_stored(client):
+    assert client.post("/api/products", json=PRODUCT).status_code == 200
+    headers = {"Idempotency-Key": "sale-oversold"}
+    assert client.post("/api/sales", json=sale_body("sale-1", 12), headers=headers).status_code == 409
+
+    assert client.put("/api/products/prod-001", json={**PRODUCT, "stock": 20}).status_code == 200
+    retry = client.post("/api/sales", json=sale_body("sale-1", 12), headers=headers)
+    assert retry.status_code == 200
+    assert "Idempotent-Replayed" not in retry.headers
+    assert stock(client) == 8
+
+
+def test_retry_during_the_first_attempt_is_a_conflict():
+    stored = {}
+    keys = IdempotencyKeys(stored.get, stored.__setitem__)
+    release = None
+    calls = []
+
+    async def handler(request):
+        calls.append(await request.body())
+        await release.wait()
+        return JSONResponse({"call": len(calls)})
+
+    app = IdempotencyMiddleware(Starlette(routes=[Route("/", handler, methods=["POST"])]), keys)
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        headers = {"Idempotency-Key": "slow"}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = asyncio.create_task(client.post("/", content=b"body", headers=headers))
+            while not calls:
+                await asyncio.sleep(0)
+            assert (await client.post("/", content=b"body", headers=headers)).status_code == 409
+            release.set()
+            assert (await first).json() == {"call": 1}
+            replay = await client.post("/", content=b"body", headers=headers)
+            assert replay.json() == {"call": 1}
+            assert replay.headers["Idempotent-Replayed"] == "true"
+        assert calls == [b"body"]
+        assert list(stored) == ["slow"]
+
+    asyncio.run(scenario())
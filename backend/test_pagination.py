@@ -0,0 +1,49 @@
+"""Keyset pagination over the list routes.
+
+    python -m pytest -q test_pagination.py
+"""
+import base64
+import json
+
+import pytest
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def test_pages_cover_every_row_once(client):
+    for number in range(7):
+        product = {
+            "id": f"prod-{number}", "name": f"Product {number % 3}", "stock": 1, "price": 1.0,
+            "barcode": None, "category": None, "created_at": "2026-01-01T00:00:00",
+        }
+        assert client.post("/api/products", json=product).status_code == 200
+
+    seen = []
+    params = {"limit": 3}
+    while True:
+        response = client.get("/api/products", params=params)
+        assert response.status_code == 200
+        seen += [(row["name"], row["id"]) for row in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": 3, "cursor": response.headers["X-Next-Cursor"]}
+    assert seen == sorted(seen)
+    assert len(seen) == 7
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    raw_cursor({"name": "x"}),
+    raw_cursor(["x"]),
+    raw_cursor(["x", "y", "z"]),
+    raw_cursor([[1], "x"]),
+    raw_cursor([None, "x"]),
+    raw_cursor([True, "x"]),
+    raw_cursor([2 ** 70, "x"]),
+])
+def test_malformed_cursor_is_a_400(client, cursor):
+    response = client.get("/api/products", params={"limit": 2, "cursor": cursor})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
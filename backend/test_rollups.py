@@ -0,0 +1,77 @@
+"""daily_sales must match the sales it summarizes, archived ones included.
+
+    python -m pytest -q test_rollups.py
+"""
+from collections import defaultdict
+from datetime import date
+
+import archive
+import rollups
+
+SALES = [
+    ("old-1", "prod-001", "2024-01-05T09:00:00", 2),
+    ("old-2", "prod-001", "2024-01-05T17:30:00", 1),
+    ("old-3", "prod-002", "2024-01-20T10:00:00", 4),
+    ("mid-1", "prod-002", "2026-09-30T23:59:00", 3),
+    ("new-1", "prod-001", "2026-10-01T08:00:00", 5),
+    ("new-2", "prod-002", "2026-10-01T12:00:00", 1),
+]
+
+
+def sale_body(sale_id: str, product_id: str, day: str, quantity: int) -> dict:
+    return {
+        "id": sale_id, "product_id": product_id, "product_name": product_id, "quantity": quantity,
+        "price": 2.5, "total_price": 2.5 * quantity, "date": day,
+    }
+
+
+def rollup_rows(main):
+    conn = main.get_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT product_id, day, quantity, revenue, transactions FROM daily_sales")
+        return {(row[0], str(row[1])): tuple(row[2:]) for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+def expected_totals(sales):
+    totals = defaultdict(lambda: [0, 0.0, 0])
+    for _, product_id, day, quantity in sales:
+        total = totals[(product_id, day[:10])]
+        total[0] += quantity
+        total[1] += 2.5 * quantity
+        total[2] += 1
+    return {key: tuple(value) for key, value in totals.items()}
+
+
+def rebuild(main, since=None):
+    conn = main.get_conn()
+    try:
+        return rollups.rebuild(conn, main.get_db_engine(), main.get_store_db().archive, since)
+    finally:
+        conn.close()
+
+
+def test_rebuild_matches_the_base_tables(main, client):
+    for product_id in ("prod-001", "prod-002"):
+        product = {
+            "id": product_id, "name": product_id, "stock": 100, "price": 2.5,
+            "barcode": None, "category": None, "created_at": "2024-01-01T00:00:00",
+        }
+        assert client.post("/api/products", json=product).status_code == 200
+    for sale in SALES:
+        assert client.post("/api/sales", json=sale_body(*sale)).status_code == 200
+    assert client.put("/api/sales/new-2", json=sale_body("new-2", "prod-002", "2026-10-01T12:00:00", 2)).status_code == 200
+    assert client.delete("/api/sales/mid-1").status_code == 200
+    sales = [sale for sale in SALES if sale[0] not in ("mid-1", "new-2")] + [("new-2", "prod-002", "2026-10-01T12:00:00", 2)]
+    expected = expected_totals(sales)
+    assert rollup_rows(main) == expected
+
+    assert archive.archive_sales(main, 365, today=date(2026, 10, 17)) == {"2024-01": 3}
+    assert rebuild(main) == len(expected)
+    assert rollup_rows(main) == expected
+
+    # A partial rebuild leaves earlier days alone and recomputes the rest
+    assert rebuild(main, "2024-01-10") == len(expected)
+    assert rollup_rows(main) == expected
@@ -0,0 +1,70 @@
+"""Product search over the text index and the in-memory fallback.
+
+    python -m pytest -q test_search.py
+"""
+import migrations
+
+
+def add_product(client, product_id: str, name: str):
+    product = {
+        "id": product_id, "name": name, "stock": 1, "price": 1.0,
+        "barcode": None, "category": None, "created_at": "2026-01-01T00:00:00",
+    }
+    assert client.post("/api/products", json=product).status_code == 200
+
+
+def search(client, q: str):
+    response = client.get("/api/products/search", params={"q": q})
+    assert response.status_code == 200
+    return response.headers["X-Search-Backend"], [row["name"] for row in response.json()]
+
+
+def test_missing_text_index_falls_back_to_memory(main, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    # As on a SQLite build without FTS5: the module is unknown, so the whole migration is undone
+    search_migration = next(m for m in migrations.MIGRATIONS if m.name == "product search index")
+    monkeypatch.setattr(search_migration, "sqlite", [
+        "CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN SELECT 1; END",
+        "CREATE VIRTUAL TABLE products_fts USING no_such_module(name)",
+    ])
+    with TestClient(main.app) as client:
+        add_product(client, "prod-001", "Coca Cola 2L")
+        assert search(client, "coca") == ("memory", ["Coca Cola 2L"])
+
+        conn = main.get_conn()
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM schema_migrations WHERE version = ?", (search_migration.version,))
+        assert cursor.fetchone()[0].startswith("product search index (skipped:")
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'products_fts%'")
+        assert cursor.fetchone()[0] == 0
+        conn.close()
+
+
+def test_text_index_search(client):
+    add_product(client, "prod-001", "Coca Cola 2L")
+    add_product(client, "prod-002", "Diet Coca Cola")
+    assert search(client, "coca co") == ("fts5", ["Coca Cola 2L", "Diet Coca Cola"])
+
+
+def test_memory_index_stays_bounded_under_renames_and_deletes():
+    from product_search import ProductSearchIndex
+
+    index = ProductSearchIndex()
+    index.load([("prod-001", "Coca Cola 2L"), ("prod-002", "Diet Coke")])
+    for number in range(3000):
+        index.put("prod-001", f"Coca Cola {number}L")
+        index.put(f"temp-{number}", "Temporary Item")
+        index.remove(f"temp-{number}")
+    ids = index._state[3]
+    assert len(ids) <= 2 + 1024 + 1
+    assert index.search("coca cola 2999", 10) == ["prod-001"]
+    assert index.search("diet", 10) == ["prod-002"]
+    assert index.search("temporary", 10) == []
+
+
+def test_like_wildcards_in_the_query_are_literal(client):
+    # FTS5 matches both names for "a_b"; unescaped, '_' would rank "A B Tea" as starting with it
+    add_product(client, "prod-001", "A B Tea")
+    add_product(client, "prod-002", "Zz A B")
+    assert search(client, "a_b") == ("fts5", ["Zz A B", "A B Tea"])
@@ -0,0 +1,46 @@
+"""Sales can only take stock that exists, and never add to it.
+
+    python -m pytest -q test_stock.py
+"""
+import pytest
+from fastapi import HTTPException
+
+PRODUCT = {
+    "id": "prod-001", "name": "Apples", "stock": 5, "price": 2.0,
+    "barcode": None, "category": None, "created_at": "2026-01-01T00:00:00",
+}
+
+
+def sale_body(sale_id: str, quantity: int) -> dict:
+    return {
+        "id": sale_id, "product_id": "prod-001", "product_name": "Apples", "quantity": quantity,
+        "price": 2.0, "total_price": 2.0 * quantity, "date": "2026-10-01T10:00:00",
+    }
+
+
+def stock(client) -> int:
+    return next(row["stock"] for row in client.get("/api/products").json() if row["id"] == "prod-001")
+
+
+@pytest.mark.parametrize("quantity", [0, -5])
+def test_non_positive_quantities_are_rejected(client, quantity):
+    assert client.post("/api/products", json=PRODUCT).status_code == 200
+    assert client.post("/api/sales", json=sale_body("sale-1", quantity)).status_code == 422
+    assert client.post("/api/sales/batch", json=[sale_body("sale-2", quantity)]).status_code == 422
+    assert client.post("/api/sales", json=sale_body("sale-3", 2)).status_code == 200
+    assert client.put("/api/sales/sale-3", json=sale_body("sale-3", quantity)).status_code == 422
+    assert stock(client) == 3
+
+
+def test_take_stock_refuses_non_positive_quantities(main):
+    with pytest.raises(HTTPException) as raised:
+        main.take_stock(None, "prod-001", [2, -1])
+    assert raised.value.status_code == 400
+
+
+def test_overselling_is_refused(client):
+    assert client.post("/api/products", json=PRODUCT).status_code == 200
+    response = client.post("/api/sales", json=sale_body("sale-1", 6))
+    assert response.status_code == 409
+    assert response.json()["detail"]["available"] == 5
+    assert stock(client) == 5
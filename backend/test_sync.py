@@ -0,0 +1,108 @@
+"""/api/sync: every change in order, MySQL's settle window and change_log retention.
+
+    python -m pytest -q test_sync.py
+"""
+import re
+from datetime import datetime, timedelta, timezone
+
+
+def product_body(product_id: str, name: str, stock: int = 10) -> dict:
+    return {
+        "id": product_id, "name": name, "stock": stock, "price": 1.0,
+        "barcode": None, "category": None, "created_at": "2026-01-01T00:00:00",
+    }
+
+
+def execute(main, sql: str, params=()):
+    conn = main.get_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+    return rows
+
+
+def sync_all(client, since: int = 0, limit: int = 1000):
+    pages = []
+    while True:
+        page = client.get("/api/sync", params={"since": since, "limit": limit}).json()
+        pages.append(page)
+        since = page["cursor"]
+        if not page["has_more"]:
+            return pages
+
+
+def test_sync_returns_every_change_in_order(main, client):
+    for number in range(5):
+        assert client.post("/api/products", json=product_body(f"prod-{number}", f"Product {number}")).status_code == 200
+    cursor = client.get("/api/sync", params={"since": 0}).json()["cursor"]
+
+    assert client.put("/api/products/prod-1", json=product_body("prod-1", "Renamed", 4)).status_code == 200
+    assert client.delete("/api/products/prod-2").status_code == 200
+    assert client.post("/api/products", json=product_body("prod-9", "New")).status_code == 200
+    assert client.put("/api/products/prod-9", json=product_body("prod-9", "Newer")).status_code == 200
+
+    pages = sync_all(client, cursor, limit=1)
+    cursors = [cursor] + [page["cursor"] for page in pages]
+    assert cursors == sorted(set(cursors))
+    upserts = [row for page in pages for row in page["changes"]["products"]["upserts"]]
+    deletes = [row_id for page in pages for row_id in page["changes"]["products"]["deletes"]]
+    # Each page carries the row as it is now, so both prod-9 pages show its latest name
+    assert [(row["id"], row["name"]) for row in upserts] == [("prod-1", "Renamed"), ("prod-9", "Newer"), ("prod-9", "Newer")]
+    assert deletes == ["prod-2"]
+    assert client.get("/api/sync", params={"since": cursors[-1]}).json()["changes"]["products"] == {"upserts": [], "deletes": []}
+
+    # Naive UTC timestamps: an offset would be shifted into the session time zone by MySQL
+    for (changed_at,) in execute(main, "SELECT changed_at FROM change_log"):
+        assert re.fullmatch(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d", changed_at)
+
+
+def test_mysql_cursor_waits_at_a_recent_gap(main, client):
+    for number in range(3):
+        assert client.post("/api/products", json=product_body(f"prod-{number}", f"Product {number}")).status_code == 200
+    (last,), = execute(main, "SELECT MAX(seq) FROM change_log")
+    # As if the transaction holding the middle seq had not committed yet
+    execute(main, "DELETE FROM change_log WHERE seq = ?", (last - 1,))
+    since = last - 3
+
+    conn = main.get_conn()
+    try:
+        entries = main.read_change_log(conn.cursor(), since, 10)
+        assert [(seq, recent) for seq, _, _, _, recent in entries] == [(last - 2, 1), (last, 1)]
+        assert [entry[0] for entry in main.entries_before_recent_gap(entries, since)] == [last - 2]
+
+        # Once the change after the gap has settled, the gap is taken to be a rollback
+        settled = main.db_timestamp(datetime.now(timezone.utc) - timedelta(seconds=main.SYNC_SETTLE_SECONDS + 5))
+        conn.cursor().execute("UPDATE change_log SET changed_at = ? WHERE seq = ?", (settled, last))
+        conn.commit()
+        entries = main.read_change_log(conn.cursor(), since, 10)
+        assert [(seq, recent) for seq, _, _, _, recent in entries] == [(last - 2, 1), (last, 0)]
+        assert main.entries_before_recent_gap(entries, since) == entries
+    finally:
+        conn.close()
+
+
+def test_cursor_behind_pruned_changes_gets_a_full_resync(main, client, monkeypatch):
+    monkeypatch.setattr(main, "SYNC_RETENTION_DAYS", 7)
+    monkeypatch.setattr(main, "CHANGE_LOG_PRUNE_INTERVAL", 0)
+    for number in range(3):
+        assert client.post("/api/products", json=product_body(f"prod-{number}", f"Product {number}")).status_code == 200
+    assert client.delete("/api/products/prod-0").status_code == 200
+    (pruned,), = execute(main, "SELECT MAX(seq) FROM change_log")
+    expired = main.db_timestamp(datetime.now(timezone.utc) - timedelta(days=8))
+    execute(main, "UPDATE change_log SET changed_at = ?", (expired,))
+
+    # The next write prunes the expired rows
+    assert client.post("/api/products", json=product_body("prod-3", "Product 3")).status_code == 200
+    assert execute(main, "SELECT seq FROM change_log") == [(pruned + 1,)]
+
+    reset = client.get("/api/sync", params={"since": pruned - 2}).json()
+    assert reset["reset"] and reset["has_more"] and reset["cursor"] == pruned
+    assert sorted(row["id"] for row in reset["changes"]["products"]["upserts"]) == ["prod-1", "prod-2", "prod-3"]
+
+    rest = client.get("/api/sync", params={"since": reset["cursor"]}).json()
+    assert not rest["reset"] and not rest["has_more"]
+    assert [row["id"] for row in rest["changes"]["products"]["upserts"]] == ["prod-3"]
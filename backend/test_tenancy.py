@@ -0,0 +1,75 @@
+"""A store evicted from the cache must stay open for the requests still using it.
+
+    python -m pytest -q test_tenancy.py
+"""
+import asyncio
+
+import httpx
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from tenancy import StoreCache, StoreMiddleware, current_store
+
+
+class Entry:
+    def __init__(self, store):
+        self.store = store
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_evicted_store_is_closed_after_its_last_request():
+    cache = StoreCache(Entry, capacity=2)
+    seen = {}
+    release_first = None
+
+    async def handler(request):
+        entry = cache.get(current_store.get())
+        seen[request.query_params["name"]] = entry
+        if request.query_params.get("wait"):
+            await release_first.wait()
+        return JSONResponse({"closed": entry.closed})
+
+    app = StoreMiddleware(Starlette(routes=[Route("/", handler)]), auto_create=True)
+
+    async def scenario():
+        nonlocal release_first
+        release_first = asyncio.Event()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            slow = asyncio.create_task(client.get("/", params={"name": "a", "wait": 1}, headers={"X-Store-Id": "a"}))
+            while "a" not in seen:
+                await asyncio.sleep(0)
+            # Opening a third store evicts "a" (the default store is never evicted) while it is in use
+            await client.get("/", params={"name": "default"})
+            await client.get("/", params={"name": "b"}, headers={"X-Store-Id": "b"})
+            assert cache.evictions == 1
+            assert not seen["a"].closed
+            release_first.set()
+            response = await slow
+            assert response.json() == {"closed": False}
+            assert seen["a"].closed
+            assert not seen["b"].closed
+
+    asyncio.run(scenario())
+
+
+def test_unknown_stores_are_rejected_unless_auto_created():
+    async def handler(request):
+        return JSONResponse({"store": current_store.get()})
+
+    routes = [Route("/", handler)]
+    listed = TestClient(StoreMiddleware(Starlette(routes=routes), allowed=["1"]))
+    assert listed.get("/", headers={"X-Store-Id": "1"}).json() == {"store": "1"}
+    assert listed.get("/", headers={"X-Store-Id": "2"}).status_code == 404
+
+    default = TestClient(StoreMiddleware(Starlette(routes=routes)))
+    assert default.get("/").json() == {"store": None}
+    assert default.get("/", headers={"X-Store-Id": "2"}).status_code == 404
+    assert default.get("/", headers={"X-Store-Id": "bad-id"}).status_code == 400
+
+    auto = TestClient(StoreMiddleware(Starlette(routes=routes), auto_create=True))
+    assert auto.get("/", headers={"X-Store-Id": "2"}).json() == {"store": "2"}
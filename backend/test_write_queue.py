@@ -0,0 +1,94 @@
+"""Group commit in the SQLite writer thread.
+
+    python -m pytest -q test_write_queue.py
+"""
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from write_queue import WriteQueue
+
+
+@pytest.fixture
+def writer(tmp_path):
+    path = str(tmp_path / "queue.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    queue = WriteQueue(lambda: sqlite3.connect(path, check_same_thread=False))
+    yield queue, path
+    queue.close()
+
+
+def insert(name):
+    def job(conn):
+        conn.execute("INSERT INTO items (name) VALUES (?)", (name,))
+        return name
+    return job
+
+
+def failing(conn):
+    conn.execute("INSERT INTO items (name) VALUES ('failed')")
+    raise ValueError("job failed")
+
+
+def committed(path):
+    with sqlite3.connect(path) as conn:
+        return sorted(name for (name,) in conn.execute("SELECT name FROM items"))
+
+
+def wait_until_queued(queue, count):
+    deadline = time.monotonic() + 5
+    while queue.stats()["queued"] < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_jobs_queued_during_a_commit_share_the_next_transaction(writer):
+    queue, path = writer
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(conn):
+        started.set()
+        release.wait(5)
+        return insert("first")(conn)
+
+    with ThreadPoolExecutor(max_workers=9) as pool:
+        first = pool.submit(queue.submit, blocking)
+        assert started.wait(5)
+        jobs = [insert(f"item-{number}") for number in range(7)] + [failing]
+        futures = [pool.submit(queue.submit, job) for job in jobs]
+        wait_until_queued(queue, len(jobs))
+        release.set()
+
+        assert first.result() == "first"
+        assert [future.result() for future in futures[:-1]] == [f"item-{number}" for number in range(7)]
+        with pytest.raises(ValueError, match="job failed"):
+            futures[-1].result()
+
+    # Only the failing job's savepoint was rolled back
+    assert committed(path) == sorted(["first"] + [f"item-{number}" for number in range(7)])
+    stats = queue.stats()
+    assert (stats["batches"], stats["jobs"], stats["largest_batch"]) == (2, 9, 8)
+
+
+def test_jobs_cannot_commit_themselves(writer):
+    queue, path = writer
+
+    def committing(conn):
+        insert("uncommitted")(conn)
+        conn.commit()
+
+    with pytest.raises(RuntimeError, match="committed by the writer thread"):
+        queue.submit(committing)
+    assert queue.submit(insert("after")) == "after"
+    assert committed(path) == ["after"]
+
+
+def test_closed_queue_rejects_writes(writer):
+    queue, _ = writer
+    queue.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        queue.submit(insert("late"))
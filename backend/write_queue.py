@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WriteConnection:
+    """Connection handed to a queued write.
+
+    The writer owns the transaction, so jobs may run statements but must not
+    commit or roll back themselves.
+    """
+
+    def __init__(self, raw, cursor_wrapper=None):
+        self._raw = raw
+        self._cursor_wrapper = cursor_wrapper
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        return self._cursor_wrapper(cursor) if self._cursor_wrapper else cursor
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        raise RuntimeError("Queued writes are committed by the writer thread")
+
+    rollback = commit
+
+
+class WriteQueue:
+    """Single writer thread that group-commits queued SQLite writes.
+
+    ``submit(fn)`` queues ``fn(conn)`` and blocks until the transaction that
+    ran it has committed. Jobs that queue up while a commit is in progress
+    are run together in the next transaction, one SAVEPOINT each, so a
+    failing job is rolled back (and its exception re-raised to its caller)
+    without affecting the rest of the batch.
+    """
+
+    def __init__(self, connect, max_batch=64, cursor_wrapper=None):
+        self._connect = connect
+        self.max_batch = max(1, max_batch)
+        self.cursor_wrapper = cursor_wrapper
+        self._queue = queue.Queue()
+        self._conn = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+        self._jobs = 0
+        self._batches = 0
+        self._failed_commits = 0
+        self._largest_batch = 0
+        self._commit_time = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Write queue is closed")
+            self._queue.put((fn, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            self._run_batch(batch)
+            if stop:
+                break
+        if self._conn is not None:
+            self._conn.close()
+
+    def _open(self):
+        if self._conn is None:
+            self._conn = self._connect()
+            # Transactions are managed explicitly below
+            self._conn.isolation_level = None
+        return self._conn
+
+    def _run_batch(self, batch):
+        outcomes = []
+        try:
+            conn = self._open()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                wrapped = WriteConnection(conn, self.cursor_wrapper)
+                for fn, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT queued_write")
+                    try:
+                        result = fn(wrapped)
+                    except BaseException as exc:
+                        conn.execute("ROLLBACK TO queued_write")
+                        conn.execute("RELEASE queued_write")
+                        outcomes.append((future, None, exc))
+                    else:
+                        conn.execute("RELEASE queued_write")
+                        outcomes.append((future, result, None))
+                started = time.perf_counter()
+                conn.execute("COMMIT")
+                self._commit_time += time.perf_counter() - started
+            except BaseException:
+                if conn.in_transaction:
+                    try:
+                        conn.execute("ROLLBACK")
+                    except Exception:
+                        pass
+                raise
+        except BaseException as exc:
+            self._failed_commits += 1
+            # Start the next batch on a fresh connection
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+            for fn, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        self._jobs += len(outcomes)
+        self._batches += 1
+        self._largest_batch = max(self._largest_batch, len(outcomes))
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "jobs": self._jobs,
+            "batches": self._batches,
+            "average_batch": round(self._jobs / self._batches, 2) if self._batches else 0,
+            "largest_batch": self._largest_batch,
+            "failed_commits": self._failed_commits,
+            "commit_time_seconds": round(self._commit_time, 6),
+        }